@@ -0,0 +1,258 @@
+#!/usr/bin/env python
+# coding=utf-8
+"""benchmark.py - Measure how fast Sopel handles incoming IRC traffic.
+
+Usage: python contrib/benchmark.py [options]
+
+Replays a raw IRC stream through a bot with all the bundled modules loaded,
+as if it came from the server, and reports lines per second, dispatch
+latency, peak memory and thread count. Nothing is actually sent anywhere: the
+bot writes to a fake socket.
+
+The stream is either a recorded raw.log (``--corpus``; only the lines the bot
+received are used, and plain files with one IRC line each work too) or a
+synthetic one of ordinary channel traffic with some commands mixed in. The
+synthetic stream is the same for the same ``--seed``, so runs before and
+after a change can be compared; ``--json`` prints the results in a form that
+is easy to keep and diff.
+
+Callables which run in threads are started but not waited for, so the
+latency figures are for the bot's reading thread only: matching the rules and
+running the unthreaded callables (mostly core bookkeeping).
+"""
+from __future__ import unicode_literals, absolute_import, print_function, division
+
+import argparse
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sopel.bot import Sopel  # noqa: E402
+from sopel.config import Config  # noqa: E402
+
+NICK = 'BenchBot'
+
+CONFIG = """[core]
+nick = {nick}
+owner = BenchOwner
+homedir = {homedir}
+logdir = {homedir}/logs
+log_raw = {log_raw}
+exclude = {exclude}
+"""
+
+COMMANDS = [
+    '.choose tea|coffee|water',
+    '.rand 1 100',
+    '.uptime',
+    '.seen {nick}',
+    '.c 2 + 3 * 4',
+    '.help',
+]
+
+WORDS = ('the quick brown fox jumps over lazy dog and then some more words '
+         'about nothing in particular that people say on irc').split()
+
+
+class FakeSocket(object):
+    """Accepts and discards everything the bot sends."""
+    def __init__(self):
+        self.sent = 0
+
+    def send(self, data):
+        self.sent += 1
+        return len(data)
+
+    def close(self):
+        pass
+
+    def fileno(self):
+        return -1
+
+
+def synthetic_corpus(lines, channels, users, seed):
+    """Generate ``lines`` lines of plausible traffic."""
+    rng = random.Random(seed)
+    channels = ['#chan%d' % i for i in range(channels)]
+    users = ['user%d' % i for i in range(users)]
+    present = dict((channel, set()) for channel in channels)
+
+    def mask(nick):
+        return '%s!~%s@%s.example.net' % (nick, nick, nick)
+
+    corpus = []
+    for channel in channels:
+        corpus.append(':%s JOIN %s' % (mask(NICK), channel))
+
+    while len(corpus) < lines:
+        channel = rng.choice(channels)
+        nick = rng.choice(users)
+        roll = rng.random()
+        if nick not in present[channel] or roll < 0.03:
+            if nick in present[channel]:
+                present[channel].discard(nick)
+                corpus.append(':%s PART %s' % (mask(nick), channel))
+            else:
+                present[channel].add(nick)
+                corpus.append(':%s JOIN %s' % (mask(nick), channel))
+            continue
+        if roll < 0.04:
+            corpus.append('PING :irc.example.net')
+        elif roll < 0.14:
+            command = rng.choice(COMMANDS).format(nick=rng.choice(users))
+            corpus.append(':%s PRIVMSG %s :%s' % (mask(nick), channel,
+                                                  command))
+        elif roll < 0.17:
+            corpus.append(':%s PRIVMSG %s :s/%s/%s/' % (
+                mask(nick), channel, rng.choice(WORDS), rng.choice(WORDS)))
+        elif roll < 0.22:
+            corpus.append(':%s PRIVMSG %s :\x01ACTION %s\x01' % (
+                mask(nick), channel, ' '.join(rng.sample(WORDS, 4))))
+        else:
+            text = ' '.join(rng.choice(WORDS)
+                            for _ in range(rng.randint(2, 15)))
+            corpus.append(':%s PRIVMSG %s :%s' % (mask(nick), channel, text))
+    return corpus
+
+
+def read_corpus(filename):
+    """Read the received lines from a raw.log, or a file of plain lines."""
+    corpus = []
+    with open(filename, 'rb') as f:
+        for line in f:
+            line = line.decode('utf-8', 'replace').rstrip('\r\n')
+            if line.startswith('>>'):
+                continue
+            if line.startswith('<<'):
+                line = line.split('\t', 1)[-1]
+            if line:
+                corpus.append(line)
+    return corpus
+
+
+def peak_memory_kb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        peak //= 1024  # bytes there, KiB elsewhere
+    return peak
+
+
+def percentile(ordered, fraction):
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def make_bot(homedir, args):
+    filename = os.path.join(homedir, 'benchmark.cfg')
+    with open(filename, 'w') as f:
+        f.write(CONFIG.format(nick=NICK, homedir=homedir,
+                              log_raw=str(args.log_raw).lower(),
+                              exclude=args.exclude))
+    start = time.time()
+    bot = Sopel(Config(filename))
+    startup = time.time() - start
+    bot.socket = FakeSocket()
+    bot.connected = True
+    return bot, startup
+
+
+def replay(bot, corpus):
+    latencies = []
+    peak_threads = threading.active_count()
+    start = time.time()
+    for line in corpus:
+        line_start = time.time()
+        bot.collect_incoming_data(line.encode('utf-8'))
+        bot.found_terminator()
+        latencies.append(time.time() - line_start)
+        peak_threads = max(peak_threads, threading.active_count())
+    elapsed = time.time() - start
+    latencies.sort()
+    return {
+        'lines': len(corpus),
+        'seconds': elapsed,
+        'lines_per_second': len(corpus) / elapsed if elapsed else 0.0,
+        'latency_p50_ms': percentile(latencies, 0.5) * 1000,
+        'latency_p99_ms': percentile(latencies, 0.99) * 1000,
+        'latency_max_ms': latencies[-1] * 1000 if latencies else 0.0,
+        'peak_threads': peak_threads,
+        'lines_sent': bot.socket.sent,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Replay IRC traffic through Sopel and time it.')
+    parser.add_argument('--corpus',
+                        help='raw.log or file of IRC lines to replay')
+    parser.add_argument('--lines', type=int, default=20000,
+                        help='synthetic lines to generate (default 20000)')
+    parser.add_argument('--channels', type=int, default=5)
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--save-corpus',
+                        help='write the synthetic corpus to this file')
+    parser.add_argument('--exclude', default='',
+                        help='comma-separated modules not to load')
+    parser.add_argument('--log-raw', action='store_true',
+                        help='keep raw logging on, as in a default config')
+    parser.add_argument('--json', action='store_true',
+                        help='print the results as JSON')
+    args = parser.parse_args(argv)
+
+    if args.corpus:
+        corpus = read_corpus(args.corpus)
+    else:
+        corpus = synthetic_corpus(args.lines, args.channels, args.users,
+                                  args.seed)
+        if args.save_corpus:
+            with open(args.save_corpus, 'wb') as f:
+                f.write(('\n'.join(corpus) + '\n').encode('utf-8'))
+
+    homedir = tempfile.mkdtemp(prefix='sopel-benchmark-')
+    try:
+        bot, startup = make_bot(homedir, args)
+        results = replay(bot, corpus)
+        results['startup_seconds'] = startup
+        results['peak_memory_kb'] = peak_memory_kb()
+        results['modules'] = len(bot._loaded_modules)
+    finally:
+        shutil.rmtree(homedir, ignore_errors=True)
+
+    if args.json:
+        print(json.dumps(results, sort_keys=True))
+    else:
+        print('\nReplayed %(lines)d lines in %(seconds).2fs '
+              '(%(lines_per_second).0f lines/s)' % results)
+        print('Dispatch latency: p50 %(latency_p50_ms).3fms, '
+              'p99 %(latency_p99_ms).3fms, max %(latency_max_ms).3fms'
+              % results)
+        print('Startup: %(startup_seconds).2fs with %(modules)d modules'
+              % results)
+        print('Peak threads: %(peak_threads)d, peak memory: '
+              '%(peak_memory_kb)s KiB, lines sent: %(lines_sent)d' % results)
+    sys.stdout.flush()
+    sys.stderr.flush()
+    # Callables may still be running in their threads, and the job scheduler
+    # never stops, so don't wait for them.
+    os._exit(0)
+
+
+if __name__ == '__main__':
+    main()
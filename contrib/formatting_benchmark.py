@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+# coding=utf-8
+"""formatting_benchmark.py - Time stripping and splitting formatted text.
+
+Usage: python contrib/formatting_benchmark.py [options]
+
+Makes long lines of mixed text, colors and other formatting, then times
+sopel.formatting.plain against stripping every code with one regex, and
+sopel.formatting.split against cutting the encoded line at fixed byte
+offsets, which is the least any splitter has to do.
+"""
+from __future__ import unicode_literals, absolute_import, print_function, division
+
+import argparse
+import json
+import os
+import random
+import re
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sopel import formatting  # noqa: E402
+
+_CODES = re.compile('[\x02\x0f\x11\x16\x1d\x1e\x1f]'
+                    '|\x03(?:[0-9]{1,2}(?:,[0-9]{1,2})?)?'
+                    '|\x04(?:[0-9A-Fa-f]{6}(?:,[0-9A-Fa-f]{6})?)?')
+
+
+def strip_one_regex(text):
+    return _CODES.sub('', text)
+
+
+def cut_bytes(text, max_bytes):
+    data = text.encode('utf-8')
+    return [data[i:i + max_bytes].decode('utf-8', 'ignore')
+            for i in range(0, len(data), max_bytes)]
+
+
+def make_line(rng, length):
+    words = ['spam', 'eggs', 'héllo', '漢字', 'café',
+             'niño', 'été', 'http://example.com/']
+    parts = []
+    size = 0
+    while size < length:
+        word = rng.choice(words)
+        style = rng.randrange(6)
+        if style == 0:
+            word = formatting.color(word, rng.randrange(16), rng.randrange(16))
+        elif style == 1:
+            word = formatting.bold(word)
+        elif style == 2:
+            word = formatting.hex_color(word, '%06X' % rng.randrange(1 << 24))
+        parts.append(word)
+        size += len(word) + 1
+    return ' '.join(parts)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Time stripping and splitting IRC formatting.')
+    parser.add_argument('--length', type=int, default=4096,
+                        help='characters per line (default 4096)')
+    parser.add_argument('--lines', type=int, default=100)
+    parser.add_argument('--max-bytes', type=int, default=400,
+                        help='bytes per piece when splitting (default 400)')
+    parser.add_argument('--rounds', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--json', action='store_true',
+                        help='print the results as JSON')
+    args = parser.parse_args(argv)
+
+    rng = random.Random(args.seed)
+    lines = [make_line(rng, args.length) for _ in range(args.lines)]
+    megabytes = sum(len(line.encode('utf-8')) for line in lines) / 1e6
+    for line in lines:
+        assert formatting.plain(line) == strip_one_regex(line)
+
+    tests = (
+        ('plain', lambda line: formatting.plain(line)),
+        ('one regex', strip_one_regex),
+        ('split', lambda line: formatting.split(line, args.max_bytes)),
+        ('cut bytes', lambda line: cut_bytes(line, args.max_bytes)),
+    )
+    results = {}
+    for name, func in tests:
+        def run():
+            for line in lines:
+                func(line)
+        seconds = min(timeit.repeat(run, number=args.rounds, repeat=3))
+        results[name] = megabytes * args.rounds / seconds
+
+    if args.json:
+        print(json.dumps(results, sort_keys=True))
+        return
+    for name, _ in tests:
+        print('%-16s %8.1f MB/s' % (name, results[name]))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+# coding=utf-8
+"""identifier_benchmark.py - Time making and comparing Identifiers.
+
+Usage: python contrib/identifier_benchmark.py [options]
+
+Times the things done with Identifiers for each line the bot receives:
+making them from the nicks and channels in the line (mostly the same few
+over and over), comparing them with plain strings and looking them up in a
+dict. Each is timed for the current Identifier and for the one before 6.4,
+which lowered every string as it was made and every string it was compared
+with.
+"""
+from __future__ import unicode_literals, absolute_import, print_function, division
+
+import argparse
+import json
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sopel.tools import Identifier  # noqa: E402
+
+if sys.version_info.major >= 3:
+    unicode = str
+
+
+class OldIdentifier(unicode):
+    """Identifier as it was before 6.4, for comparison."""
+    def __new__(cls, identifier):
+        s = unicode.__new__(cls, identifier)
+        s._lowered = OldIdentifier._lower(identifier)
+        return s
+
+    @staticmethod
+    def _lower(identifier):
+        low = identifier.lower().replace('{', '[').replace('}', ']')
+        low = low.replace('|', '\\').replace('^', '~')
+        return low
+
+    def __hash__(self):
+        return self._lowered.__hash__()
+
+    def __eq__(self, other):
+        if isinstance(other, OldIdentifier):
+            return self._lowered == other._lowered
+        return self._lowered == OldIdentifier._lower(other)
+
+    def __ne__(self, other):
+        return not (self == other)
+
+
+def run(cls, names, number):
+    made = [cls(name) for name in names]
+    lookup = dict((name, True) for name in made)
+    plain = [name.upper() for name in names]
+    results = {}
+
+    def construct():
+        for name in names:
+            cls(name)
+
+    def compare():
+        for identifier, other in zip(made, plain):
+            identifier == other
+
+    def find():
+        for name in names:
+            cls(name) in lookup
+
+    for test, func in (('construct', construct), ('compare', compare),
+                       ('lookup', find)):
+        seconds = min(timeit.repeat(func, number=number, repeat=3))
+        results[test] = len(names) * number / seconds
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Compare Identifier with its old implementation.')
+    parser.add_argument('--distinct', type=int, default=200,
+                        help='distinct nicks and channels (default 200)')
+    parser.add_argument('--names', type=int, default=10000,
+                        help='names per round (default 10000)')
+    parser.add_argument('--rounds', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--json', action='store_true',
+                        help='print the results as JSON')
+    args = parser.parse_args(argv)
+
+    rng = random.Random(args.seed)
+    distinct = ['%s%d%s' % (rng.choice(['#Chan', 'Nick', 'User|']), i,
+                            rng.choice(['', '[away]', '^', '_']))
+                for i in range(args.distinct)]
+    names = [rng.choice(distinct) for _ in range(args.names)]
+
+    results = {}
+    for name, cls in (('old', OldIdentifier), ('Identifier', Identifier)):
+        results[name] = run(cls, names, args.rounds)
+
+    if args.json:
+        print(json.dumps(results, sort_keys=True))
+        return
+    for name in ('old', 'Identifier'):
+        print(('%(name)-11s %(construct)10.0f made/s '
+               '%(compare)10.0f compared/s %(lookup)10.0f looked up/s')
+              % dict(results[name], name=name))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,143 @@
+#!/usr/bin/env python
+# coding=utf-8
+"""memory_benchmark.py - Measure SopelMemory under concurrent use.
+
+Usage: python contrib/memory_benchmark.py [options]
+
+Mimics how ``bot.channels``, ``bot.users`` and ``bot.memory`` are used: one
+writer thread (the thread reading from the server, which keeps them up to
+date) changes keys now and then, while several reader threads (callables,
+each run in its own thread) look keys up and occasionally iterate over the
+whole mapping. The same load is run against ``SopelMemory`` and against the
+implementation it replaced, which locked on writes and ``in`` but not on
+reads or iteration, and the operations per second and iteration failures of
+each are reported.
+"""
+from __future__ import unicode_literals, absolute_import, print_function, division
+
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sopel.tools import SopelMemory  # noqa: E402
+
+
+class LockedDict(dict):
+    """SopelMemory as it was before 6.4, for comparison."""
+    def __init__(self, *args):
+        dict.__init__(self, *args)
+        self.lock = threading.Lock()
+
+    def __setitem__(self, key, value):
+        self.lock.acquire()
+        result = dict.__setitem__(self, key, value)
+        self.lock.release()
+        return result
+
+    def __contains__(self, key):
+        self.lock.acquire()
+        result = dict.__contains__(self, key)
+        self.lock.release()
+        return result
+
+
+def run(cls, args):
+    keys = ['user%d' % i for i in range(args.keys)]
+    memory = cls((key, {}) for key in keys)
+    stop = threading.Event()
+    counts = {'reads': 0, 'writes': 0, 'iterations': 0, 'failures': 0}
+    counts_lock = threading.Lock()
+
+    def writer():
+        rng = random.Random(args.seed)
+        writes = 0
+        while not stop.is_set():
+            key = rng.choice(keys)
+            if key in memory and rng.random() < 0.5:
+                try:
+                    del memory[key]
+                except KeyError:
+                    pass
+            else:
+                memory[key] = {}
+            writes += 1
+        with counts_lock:
+            counts['writes'] += writes
+
+    def reader(seed):
+        rng = random.Random(seed)
+        reads = iterations = failures = 0
+        while not stop.is_set():
+            if rng.random() < args.iterate_fraction:
+                try:
+                    for key in memory:
+                        memory.get(key)
+                    iterations += 1
+                except RuntimeError:
+                    failures += 1
+            else:
+                key = rng.choice(keys)
+                if key in memory:
+                    memory.get(key)
+                reads += 1
+        with counts_lock:
+            counts['reads'] += reads
+            counts['iterations'] += iterations
+            counts['failures'] += failures
+
+    threads = [threading.Thread(target=writer)]
+    threads.extend(threading.Thread(target=reader, args=(args.seed + i,))
+                   for i in range(args.readers))
+    for thread in threads:
+        thread.start()
+    time.sleep(args.seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+
+    return {
+        'reads_per_second': counts['reads'] / args.seconds,
+        'writes_per_second': counts['writes'] / args.seconds,
+        'iterations_per_second': counts['iterations'] / args.seconds,
+        'iteration_failures': counts['failures'],
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Compare SopelMemory with its old implementation.')
+    parser.add_argument('--readers', type=int, default=8,
+                        help='reader threads (default 8)')
+    parser.add_argument('--keys', type=int, default=1000,
+                        help='keys in the mapping (default 1000)')
+    parser.add_argument('--iterate-fraction', type=float, default=0.001,
+                        help='share of reads which iterate (default 0.001)')
+    parser.add_argument('--seconds', type=float, default=3)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--json', action='store_true',
+                        help='print the results as JSON')
+    args = parser.parse_args(argv)
+
+    results = {}
+    for name, cls in (('old', LockedDict), ('SopelMemory', SopelMemory)):
+        results[name] = run(cls, args)
+
+    if args.json:
+        print(json.dumps(results, sort_keys=True))
+        return
+    for name in ('old', 'SopelMemory'):
+        print(('%(name)-12s %(reads_per_second)10.0f reads/s '
+               '%(writes_per_second)10.0f writes/s '
+               '%(iterations_per_second)8.0f iterations/s '
+               '%(iteration_failures)d failed iterations')
+              % dict(results[name], name=name))
+
+
+if __name__ == '__main__':
+    main()
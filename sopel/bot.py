@@ -14,10 +14,13 @@ import sys
 import threading
 import time
 
+from sopel import formatting
 from sopel import tools
 from sopel import irc
 from sopel.db import SopelDB
 from sopel.tools import stderr, Identifier
+from sopel.tools.history import MessageHistory
+from sopel.tools.ratelimit import RateLimiter
 import sopel.tools.jobs
 from sopel.trigger import Trigger
 from sopel.module import NOLIMIT
@@ -47,6 +50,10 @@ class _CapReq(object):
         self.success = success or nop
 
 
+_LoadedModule = collections.namedtuple(
+    '_LoadedModule', 'callables jobs shutdowns mtime source_hash')
+
+
 class Sopel(irc.Bot):
     def __init__(self, config, daemon=False):
         irc.Bot.__init__(self, config)
@@ -71,10 +78,22 @@ class Sopel(irc.Bot):
         self._command_groups = collections.defaultdict(list)
         """A mapping of module names to a list of commands in it."""
         self.stats = {}  # deprecated, remove in 7.0
-        self._times = {}
-        """
-        A dictionary mapping lower-case'd nicks to dictionaries which map
-        funtion names to the time which they were last used by that nick.
+        self.shutdown_methods = []
+        """The ``shutdown`` functions of all loaded modules."""
+        self._deferred_modules = {}
+        """Modules registered from cached metadata, but not yet imported."""
+        self._loaded_modules = {}
+        """Imported module names, mapped to what they registered."""
+        self._reload_lock = threading.Lock()
+        """Held while (re)loading a module, deferred or not, so that only one
+        thread at a time changes the callable table."""
+        self._recipient_locks = {}
+        """Locks held while saying something to each recipient, so that the
+        pieces of one message aren't mixed up with those of another."""
+        self.rate_limiter = RateLimiter()
+        """When rate-limited callables were last used, by whom and where.
+
+        A :class:`sopel.tools.ratelimit.RateLimiter`.
         """
 
         self.server_capabilities = {}
@@ -127,6 +146,15 @@ class Sopel(irc.Bot):
         modules. See :class:`sopel.tools.Sopel.SopelMemory`
         """
 
+        self.history = MessageHistory(self.config.core.history_depth,
+                                      self.config.core.history_max_bytes)
+        """The recent lines said in each channel.
+
+        A :class:`sopel.tools.history.MessageHistory`, which records every
+        channel message, except from blocked nicks and hosts, before it is
+        dispatched to modules.
+        """
+
         self.scheduler = sopel.tools.jobs.JobScheduler(self)
         self.scheduler.start()
 
@@ -140,7 +168,7 @@ class Sopel(irc.Bot):
 
     # Backwards-compatibility aliases to attributes made private in 6.2. Remove
     # these in 7.0
-    times = property(lambda self: getattr(self, '_times'))
+    times = property(lambda self: self.rate_limiter.times(self.nick))
     command_groups = property(lambda self: getattr(self, '_command_groups'))
 
     def write(self, args, text=None):  # Shim this in here for autodocs
@@ -165,46 +193,290 @@ class Sopel(irc.Bot):
     def setup(self):
         stderr("\nWelcome to Sopel. Loading modules...\n\n")
 
+        self.shutdown_methods = []
+        self._loaded_modules = {}
         modules = sopel.loader.enumerate_modules(self.config)
+        metadata = sopel.loader.load_metadata_cache(self.config)
+        lazy = set(self.config.core.lazy_modules)
+        start = time.time()
+
+        # Modules which are to be loaded lazily, and whose callables we know
+        # from a previous run, don't need to be imported yet.
+        deferred = set()
+        for name in lazy:
+            if name not in modules:
+                continue
+            path, type_ = modules[name]
+            meta = metadata.get(name)
+            if (sopel.loader.metadata_is_fresh(meta, path, type_, self.config)
+                    and meta['deferrable']):
+                deferred.add(name)
+
+        to_import = [name for name in modules if name not in deferred]
+        imported = sopel.loader.load_modules(
+            modules, to_import, self.config.core.module_import_threads)
 
         error_count = 0
         success_count = 0
+        self.module_load_times = {}
+        """A dict mapping module names to the seconds spent importing and
+        setting them up at startup."""
         for name in modules:
             path, type_ = modules[name]
 
+            if name in deferred:
+                self._register_deferred(name, path, type_, metadata[name])
+                self.module_load_times[name] = 0.0
+                success_count += 1
+                continue
+
+            module, exc_info, elapsed = imported[name]
+            if module is None:
+                error_count = error_count + 1
+                filename, lineno = tools.get_raising_file_and_line(exc_info[2])
+                rel_path = os.path.relpath(filename, os.path.dirname(__file__))
+                raising_stmt = "%s:%d" % (rel_path, lineno)
+                stderr("Error loading %s: %s (%s)" %
+                       (name, exc_info[1], raising_stmt))
+                continue
+
+            setup_start = time.time()
             try:
-                module, _ = sopel.loader.load_module(name, path, type_)
+                relevant_parts = self._activate_module(
+                    name, module, path, type_)
             except Exception as e:
                 error_count = error_count + 1
                 filename, lineno = tools.get_raising_file_and_line()
-                rel_path = os.path.relpath(filename, os.path.dirname(__file__))
+                rel_path = os.path.relpath(
+                    filename, os.path.dirname(__file__)
+                )
                 raising_stmt = "%s:%d" % (rel_path, lineno)
-                stderr("Error loading %s: %s (%s)" % (name, e, raising_stmt))
+                stderr("Error in %s setup procedure: %s (%s)"
+                       % (name, e, raising_stmt))
             else:
-                try:
-                    if hasattr(module, 'setup'):
-                        module.setup(self)
-                    relevant_parts = sopel.loader.clean_module(
-                        module, self.config)
-                except Exception as e:
-                    error_count = error_count + 1
-                    filename, lineno = tools.get_raising_file_and_line()
-                    rel_path = os.path.relpath(
-                        filename, os.path.dirname(__file__)
-                    )
-                    raising_stmt = "%s:%d" % (rel_path, lineno)
-                    stderr("Error in %s setup procedure: %s (%s)"
-                           % (name, e, raising_stmt))
-                else:
-                    self.register(*relevant_parts)
-                    success_count += 1
+                success_count += 1
+                metadata[name] = sopel.loader.get_module_metadata(
+                    path, type_, self.config, module, *relevant_parts)
+            elapsed += time.time() - setup_start
+            self.module_load_times[name] = elapsed
+            LOGGER.info('Loaded %s in %.3fs', name, elapsed)
+
+        sopel.loader.save_metadata_cache(self.config, metadata)
 
         if len(modules) > 1:  # coretasks is counted
             stderr('\n\nRegistered %d modules,' % (success_count - 1))
             stderr('%d modules failed to load\n\n' % error_count)
+            slowest = sorted(self.module_load_times.items(),
+                             key=lambda item: item[1], reverse=True)[:3]
+            stderr('Loading took %.2fs; slowest: %s\n\n' % (
+                time.time() - start,
+                ', '.join('%s (%.2fs)' % item for item in slowest)))
         else:
             stderr("Warning: Couldn't load any modules")
 
+    def _register_deferred(self, name, path, type_, metadata):
+        """Register stand-ins for a module which hasn't been imported yet.
+
+        The module is imported, set up and registered for real the first time
+        one of its callables is triggered.
+        """
+        def load():
+            return self._load_deferred(name)
+
+        stubs = [sopel.loader.deferred_callable(name, meta, load)
+                 for meta in metadata['callables']]
+        self._deferred_modules[name] = (path, type_, stubs)
+        self.register(stubs, [], [])
+
+    def _load_deferred(self, name):
+        """Import a deferred module, and swap in its real callables."""
+        with self._reload_lock:
+            entry = self._deferred_modules.pop(name, None)
+            if entry is None:
+                # Another trigger got here first
+                return sys.modules[name]
+            path, type_, stubs = entry
+            for stub in stubs:
+                self.unregister(stub)
+            start = time.time()
+            module, _ = sopel.loader.load_module(name, path, type_)
+            self._activate_module(name, module, path, type_)
+            elapsed = time.time() - start
+            self.module_load_times[name] = elapsed
+            LOGGER.info('Loaded deferred module %s in %.3fs', name, elapsed)
+            return module
+
+    def _activate_module(self, name, module, path, type_):
+        """Set up, clean and register an imported module.
+
+        Returns the registered ``(callables, jobs, shutdowns)``.
+        """
+        if hasattr(module, 'setup'):
+            module.setup(self)
+        callables, jobs, shutdowns = sopel.loader.clean_module(
+            module, self.config)
+        self.register(callables, jobs, shutdowns)
+        self._loaded_modules[name] = _LoadedModule(
+            callables, jobs, shutdowns,
+            sopel.loader.get_module_mtime(path, type_),
+            sopel.loader.get_module_hash(path, type_))
+        return callables, jobs, shutdowns
+
+    def load_module(self, name, path, type_):
+        """Import a module which isn't loaded yet, and register it.
+
+        Returns the module. If it's already loaded, use :meth:`reload_module`
+        instead.
+        """
+        with self._reload_lock:
+            module, _ = sopel.loader.load_module(name, path, type_)
+            self._activate_module(name, module, path, type_)
+            return module
+
+    def reload_module(self, name, force=False):
+        """Reload the module ``name`` from its source, if it has changed.
+
+        Only that module's callables, jobs, shutdown methods and URL callbacks
+        are replaced; the rest of the bot carries on undisturbed. Its old
+        ``shutdown`` function is called before the new ``setup``.
+
+        Returns the new module, or ``None`` if the source hasn't changed since
+        it was loaded and ``force`` is false. If the new source can't be
+        imported or set up, the exception is raised and the old module stays
+        in place; if it was the new ``setup`` which failed, the old module's
+        ``setup`` is run again. Raises ``KeyError`` if the module isn't loaded.
+        """
+        if name in self._deferred_modules:
+            # It has never been imported, so it's fresh either way.
+            return self._load_deferred(name)
+
+        with self._reload_lock:
+            old = self._loaded_modules[name]
+            path, type_ = sopel.loader.enumerate_modules(self.config)[name]
+            mtime = sopel.loader.get_module_mtime(path, type_)
+            if not force and mtime == old.mtime:
+                return None
+            source_hash = sopel.loader.get_module_hash(path, type_)
+            if not force and source_hash == old.source_hash:
+                self._loaded_modules[name] = old._replace(mtime=mtime)
+                return None
+
+            start = time.time()
+            old_module = sys.modules.pop(name, None)
+            try:
+                module, _ = sopel.loader.load_module(name, path, type_)
+                callables, jobs, shutdowns = sopel.loader.clean_module(
+                    module, self.config)
+            except Exception:
+                if old_module is not None:
+                    sys.modules[name] = old_module
+                raise
+
+            for shutdown in old.shutdowns:
+                try:
+                    shutdown(self)
+                except Exception as e:
+                    LOGGER.error('Error calling shutdown method for '
+                                 'module %s: %s', name, e)
+            callbacks = self._forget_module(name, old)
+            try:
+                if hasattr(module, 'setup'):
+                    module.setup(self)
+            except Exception:
+                self._restore_module(name, old, old_module, callbacks)
+                raise
+            self._replace_callables(old.callables, callables)
+            self.register([], jobs, shutdowns)
+            self._loaded_modules[name] = _LoadedModule(
+                callables, jobs, shutdowns, mtime, source_hash)
+
+            elapsed = time.time() - start
+            self.module_load_times[name] = elapsed
+            LOGGER.info('Reloaded %s in %.3fs', name, elapsed)
+            return module
+
+    def _forget_module(self, name, loaded):
+        """Drop a module's jobs, shutdown methods and URL callbacks.
+
+        Its callables are left for :meth:`_replace_callables`. Returns the
+        URL callbacks which were dropped, mapped from their regexes.
+        """
+        self.scheduler.remove_jobs(loaded.jobs)
+        for shutdown in loaded.shutdowns:
+            if shutdown in self.shutdown_methods:
+                self.shutdown_methods.remove(shutdown)
+        dropped = {}
+        if self.memory.contains('url_callbacks'):
+            callbacks = self.memory['url_callbacks']
+            for regex, func in list(callbacks.items()):
+                if getattr(func, '__module__', None) == name:
+                    dropped[regex] = callbacks.pop(regex)
+        return dropped
+
+    def _restore_module(self, name, loaded, module, callbacks):
+        """Put back a module dropped by :meth:`_forget_module`.
+
+        ``module`` is the old module object, whose ``setup`` is run again
+        (its ``shutdown`` has been), and ``callbacks`` are the URL callbacks
+        which were dropped. Its callables were never unregistered.
+        """
+        if module is not None:
+            sys.modules[name] = module
+        else:
+            sys.modules.pop(name, None)
+        try:
+            if hasattr(module, 'setup'):
+                module.setup(self)
+        except Exception as e:
+            LOGGER.error('Error setting up the old version of module %s '
+                         'again: %s', name, e)
+        if callbacks:
+            if not self.memory.contains('url_callbacks'):
+                self.memory['url_callbacks'] = tools.SopelMemory()
+            self.memory['url_callbacks'].update(callbacks)
+        self.register([], loaded.jobs, loaded.shutdowns)
+
+    def _replace_callables(self, old, new):
+        """Unregister the ``old`` callables and register the ``new`` ones.
+
+        The new callable table is built aside and swapped in at once, so a
+        message being dispatched meanwhile sees either all of the old
+        callables or all of the new ones.
+        """
+        table = {}
+        for priority, rules in self._callables.items():
+            table[priority] = collections.defaultdict(list)
+            for rule, funcs in rules.items():
+                table[priority][rule] = list(funcs)
+        for func in old:
+            for rule in func.rule:
+                funcs = table[func.priority].get(rule, [])
+                if func in funcs:
+                    funcs.remove(func)
+                    if not funcs:
+                        del table[func.priority][rule]
+            if hasattr(func, 'commands'):
+                module_name = func.__module__.rsplit('.', 1)[-1]
+                category = getattr(func, 'category', module_name)
+                commands = self._command_groups.get(category, [])
+                if func.commands[0] in commands:
+                    commands.remove(func.commands[0])
+            for command in func._docs:
+                self.doc.pop(command, None)
+        for func in new:
+            for rule in func.rule:
+                table[func.priority][rule].append(func)
+        self._callables = table
+        # Command groups and docs are only informational, so it doesn't
+        # matter that they change separately.
+        for func in new:
+            if hasattr(func, 'commands'):
+                module_name = func.__module__.rsplit('.', 1)[-1]
+                category = getattr(func, 'category', module_name)
+                self._command_groups[category].append(func.commands[0])
+            for command, docs in func._docs.items():
+                self.doc[command] = docs
+
     def unregister(self, obj):
         if not callable(obj):
             return
@@ -214,15 +486,19 @@ class Sopel(irc.Bot):
                 if obj in callb_list:
                     callb_list.remove(obj)
         if hasattr(obj, 'interval'):
-            # TODO this should somehow find the right job to remove, rather than
-            # clearing the entire queue. Issue #831
-            self.scheduler.clear_jobs()
+            self.scheduler.remove_jobs([obj])
+        if hasattr(obj, 'commands'):
+            module_name = obj.__module__.rsplit('.', 1)[-1]
+            category = getattr(obj, 'category', module_name)
+            commands = self._command_groups.get(category, [])
+            if obj.commands[0] in commands:
+                commands.remove(obj.commands[0])
         if (getattr(obj, '__name__', None) == 'shutdown'
                 and obj in self.shutdown_methods):
             self.shutdown_methods.remove(obj)
 
     def register(self, callables, jobs, shutdowns):
-        self.shutdown_methods = shutdowns
+        self.shutdown_methods.extend(shutdowns)
         for callbl in callables:
             for rule in callbl.rule:
                 self._callables[callbl.priority][rule].append(callbl)
@@ -240,8 +516,12 @@ class Sopel(irc.Bot):
                 self.scheduler.add_job(job)
 
     def part(self, channel, msg=None):
-        """Part a channel."""
-        self.write(['PART', channel], msg)
+        """Part a channel.
+
+        Parts from several channels with the same message, close together,
+        are sent as one PART.
+        """
+        self.coalescer.part(channel, msg)
 
     def join(self, channel, password=None):
         """Join a channel
@@ -250,16 +530,36 @@ class Sopel(irc.Bot):
         assumed to split the argument into the channel to join and its
         password.  `channel` should not contain a space if `password` is given.
 
+        Joins close together (e.g. of every channel on connect) are sent as
+        few JOINs with several channels each.
         """
-        if password is None:
-            self.write(('JOIN', channel))
-        else:
-            self.write(['JOIN', channel, password])
+        if password is None and ' ' in channel:
+            channel, password = channel.split(' ', 1)
+        self.coalescer.join(channel, password)
 
     def msg(self, recipient, text, max_messages=1):
         # Deprecated, but way too much of a pain to remove.
         self.say(text, recipient, max_messages)
 
+    def max_text_length(self, recipient, command='PRIVMSG'):
+        """Return how many bytes of text fit in one ``command`` to
+        ``recipient``.
+
+        The server relays the message prefixed with the bot's hostmask, and
+        the whole line must fit in the server's ``LINELEN`` (512 bytes unless
+        it says otherwise). The bot's hostmask is known once it has joined a
+        channel; until then, the longest likely one is assumed.
+        """
+        me = self.users.get(self.nick)
+        if me is not None and me.user and me.host:
+            hostmask = '%s!%s@%s' % (self.nick, me.user, me.host)
+        else:
+            hostmask = '%s!~%s@%s' % (self.nick, self.user, 'x' * 63)
+        # ":<hostmask> <command> <recipient> :<text>\r\n"
+        overhead = len(('%s %s %s' % (hostmask, command,
+                                       recipient)).encode('utf-8')) + 5
+        return self.isupport.linelen - overhead
+
     def say(self, text, recipient, max_messages=1):
         """Send ``text`` as a PRIVMSG to ``recipient``.
 
@@ -270,72 +570,68 @@ class Sopel(irc.Bot):
         By default, this will attempt to send the entire ``text`` in one
         message. If the text is too long for the server, it may be truncated.
         If ``max_messages`` is given, the ``text`` will be split into at most
-        that many messages, each no more than 400 bytes. The split is made at
-        the last space character before the 400th byte, or at the 400th byte if
-        no such space exists. If the ``text`` is too long to fit into the
-        specified number of messages using the above splitting, the final
+        that many messages, each no longer than :meth:`max_text_length`
+        allows. The split is made at the last space character that fits, or
+        else as late as possible without cutting a character or a formatting
+        code in two (see :func:`sopel.formatting.split`). If the ``text`` is
+        too long to fit into the specified number of messages, the final
         message will contain the entire remainder, which may be truncated by
         the server.
         """
-        # We're arbitrarily saying that the max is 400 bytes of text when
-        # messages will be split. Otherwise, we'd have to acocunt for the bot's
-        # hostmask, which is hard.
-        max_text_length = 400
-        # Encode to bytes, for propper length calculation
-        if isinstance(text, unicode):
-            encoded_text = text.encode('utf-8')
+        if not isinstance(text, unicode):
+            text = text.decode('utf-8')
+        if max_messages > 1:
+            pieces = formatting.split(text, self.max_text_length(recipient),
+                                      max_messages)
         else:
-            encoded_text = text
-        excess = ''
-        if max_messages > 1 and len(encoded_text) > max_text_length:
-            last_space = encoded_text.rfind(' '.encode('utf-8'), 0, max_text_length)
-            if last_space == -1:
-                excess = encoded_text[max_text_length:]
-                encoded_text = encoded_text[:max_text_length]
-            else:
-                excess = encoded_text[last_space + 1:]
-                encoded_text = encoded_text[:last_space]
-        # We'll then send the excess at the end
-        # Back to unicode again, so we don't screw things up later.
-        text = encoded_text.decode('utf-8')
-        try:
-            self.sending.acquire()
-
-            # No messages within the last 3 seconds? Go ahead!
-            # Otherwise, wait so it's been at least 0.8 seconds + penalty
-
-            recipient_id = Identifier(recipient)
-
-            if recipient_id not in self.stack:
-                self.stack[recipient_id] = []
-            elif self.stack[recipient_id]:
-                elapsed = time.time() - self.stack[recipient_id][-1][0]
-                if elapsed < 3:
-                    penalty = float(max(0, len(text) - 40)) / 70
-                    wait = 0.8 + penalty
-                    if elapsed < wait:
-                        time.sleep(wait - elapsed)
-
-                # Loop detection
-                messages = [m[1] for m in self.stack[recipient_id][-8:]]
-
-                # If what we about to send repeated at least 5 times in the
-                # last 2 minutes, replace with '...'
-                if messages.count(text) >= 5 and elapsed < 120:
-                    text = '...'
-                    if messages.count('...') >= 3:
-                        # If we said '...' 3 times, discard message
-                        return
-
+            pieces = [text]
+        recipient_id = Identifier(recipient)
+        with self.sending:
+            lock = self._recipient_locks.get(recipient_id)
+            if lock is None:
+                lock = self._recipient_locks[recipient_id] = threading.Lock()
+        self.metrics.send_waiting.append(None)
+        with lock:
+            self.metrics.send_waiting.pop()
+            for text in pieces:
+                if not self._send_message(recipient, recipient_id, text):
+                    break
+
+    def _send_message(self, recipient, recipient_id, text):
+        # Send one line of say(), with the recipient's lock held. Returns
+        # False if it was dropped for repeating itself. The sending lock is
+        # only held while looking at or adding to the stack, not while
+        # waiting, so other recipients aren't held up.
+        with self.sending:
+            stack = list(self.stack.setdefault(recipient_id, []))
+
+        # No messages within the last 3 seconds? Go ahead!
+        # Otherwise, wait so it's been at least 0.8 seconds + penalty
+        if stack:
+            elapsed = time.time() - stack[-1][0]
+            if elapsed < 3:
+                penalty = float(max(0, len(text) - 40)) / 70
+                wait = 0.8 + penalty
+                if elapsed < wait:
+                    time.sleep(wait - elapsed)
+
+            # Loop detection
+            messages = [m[1] for m in stack[-8:]]
+
+            # If what we about to send repeated at least 5 times in the
+            # last 2 minutes, replace with '...'
+            if messages.count(text) >= 5 and elapsed < 120:
+                text = '...'
+                if messages.count('...') >= 3:
+                    # If we said '...' 3 times, discard message
+                    return False
+
+        with self.sending:
             self.write(('PRIVMSG', recipient), text)
-            self.stack[recipient_id].append((time.time(), self.safe(text)))
-            self.stack[recipient_id] = self.stack[recipient_id][-10:]
-        finally:
-            self.sending.release()
-        # Now that we've sent the first part, we need to send the rest. Doing
-        # this recursively seems easier to me than iteratively
-        if excess:
-            self.msg(recipient, excess, max_messages - 1)
+            stack = self.stack.setdefault(recipient_id, [])
+            stack.append((time.time(), self.safe(text)))
+            self.stack[recipient_id] = stack[-10:]
+        return True
 
     def notice(self, text, dest):
         """Send an IRC NOTICE to a user or a channel.
@@ -420,58 +716,42 @@ class Sopel(irc.Bot):
 
     def call(self, func, sopel, trigger):
         nick = trigger.nick
+        channel = None if trigger.is_privmsg else trigger.sender
         current_time = time.time()
-        if nick not in self._times:
-            self._times[nick] = dict()
-        if self.nick not in self._times:
-            self._times[self.nick] = dict()
-        if not trigger.is_privmsg and trigger.sender not in self._times:
-            self._times[trigger.sender] = dict()
-
-        if not trigger.admin and not func.unblockable:
-            if func in self._times[nick]:
-                usertimediff = current_time - self._times[nick][func]
-                if func.rate > 0 and usertimediff < func.rate:
-                    #self._times[nick][func] = current_time
-                    LOGGER.info(
-                        "%s prevented from using %s in %s due to user limit: %d < %d",
-                        trigger.nick, func.__name__, trigger.sender, usertimediff,
-                        func.rate
-                    )
-                    return
-            if func in self._times[self.nick]:
-                globaltimediff = current_time - self._times[self.nick][func]
-                if func.global_rate > 0 and globaltimediff < func.global_rate:
-                    #self._times[self.nick][func] = current_time
-                    LOGGER.info(
-                        "%s prevented from using %s in %s due to global limit: %d < %d",
-                        trigger.nick, func.__name__, trigger.sender, globaltimediff,
-                        func.global_rate
-                    )
-                    return
-
-            if not trigger.is_privmsg and func in self._times[trigger.sender]:
-                chantimediff = current_time - self._times[trigger.sender][func]
-                if func.channel_rate > 0 and chantimediff < func.channel_rate:
-                    #self._times[trigger.sender][func] = current_time
-                    LOGGER.info(
-                        "%s prevented from using %s in %s due to channel limit: %d < %d",
-                        trigger.nick, func.__name__, trigger.sender, chantimediff,
-                        func.channel_rate
-                    )
-                    return
 
+        acquired = not trigger.admin and not func.unblockable
+        if acquired:
+            limited = self.rate_limiter.acquire(func, nick, channel,
+                                                current_time)
+            if limited:
+                limit, elapsed, rate = limited
+                LOGGER.info(
+                    "%s prevented from using %s in %s due to %s limit: %d < %d",
+                    trigger.nick, func.__name__, trigger.sender, limit,
+                    elapsed, rate
+                )
+                self.metrics.record_rejection(func, limit)
+                return
+
+        profiler = self.metrics.start_profile(func)
+        start = time.time()
         try:
             exit_code = func(sopel, trigger)
         except Exception:
             exit_code = None
+            self.metrics.record_call(func, time.time() - start, error=True)
             self.error(trigger)
+        else:
+            self.metrics.record_call(func, time.time() - start)
+        finally:
+            if profiler is not None:
+                self.metrics.finish_profile(func, profiler)
 
-        if exit_code != NOLIMIT:
-            self._times[nick][func] = current_time
-            self._times[self.nick][func] = current_time
-            if not trigger.is_privmsg:
-                self._times[trigger.sender][func] = current_time
+        if exit_code == NOLIMIT:
+            if acquired:
+                self.rate_limiter.release(func, nick, channel, current_time)
+        elif not acquired:
+            self.rate_limiter.record(func, nick, channel, current_time)
 
     def dispatch(self, pretrigger):
         args = pretrigger.args
@@ -483,9 +763,17 @@ class Sopel(irc.Bot):
         else:
             nick_blocked = host_blocked = None
 
+        if (event == 'PRIVMSG' and pretrigger.sender and
+                not pretrigger.sender.is_nick() and
+                not (nick_blocked or host_blocked)):
+            self.history.record(pretrigger.sender, pretrigger.nick, text,
+                                pretrigger.tags.get('intent'))
+
         list_of_blocked_functions = []
+        # Modules may be (re)loaded while this runs, so work from a snapshot.
+        callables = self._callables
         for priority in ('high', 'medium', 'low'):
-            items = self._callables[priority].items()
+            items = list(callables[priority].items())
 
             for regexp, funcs in items:
                 match = regexp.match(text)
@@ -78,6 +78,12 @@ class CoreSection(StaticSection):
     channels = ListAttribute('channels')
     """List of channels for the bot to join when it connects"""
 
+    coalesce_window = ValidatedAttribute('coalesce_window', float,
+                                         default=0.1)
+    """How many seconds to hold JOINs, PARTs, MODEs and KICKs which follow
+    one just sent, to send those made close together in fewer lines (0 to
+    send every one right away)."""
+
     db_filename = ValidatedAttribute('db_filename')
     """The filename for Sopel's database."""
 
@@ -94,12 +100,35 @@ class CoreSection(StaticSection):
     exclude = ListAttribute('exclude')
     """A list of modules which should not be loaded."""
 
+    exception_log_json = ValidatedAttribute('exception_log_json', bool,
+                                            default=False)
+    """Whether to write ``exceptions.log`` as one JSON object per line."""
+
+    exception_log_max_bytes = ValidatedAttribute('exception_log_max_bytes',
+                                                 int, default=10 * 1024 * 1024)
+    """The size at which ``exceptions.log`` is rotated (0 for never)."""
+
     extra = ListAttribute('extra')
     """A list of other directories you'd like to include modules from."""
 
     help_prefix = ValidatedAttribute('help_prefix', default='.')
     """The prefix to use in help"""
 
+    history_depth = ValidatedAttribute('history_depth', int, default=100)
+    """How many recent lines to remember for each channel.
+
+    Modules can look back through these with ``bot.history``. 0 disables the
+    history. The find module's ``s/find/replace/`` only searches these lines,
+    so in busy channels, where a nick's lines are soon pushed out by others',
+    a higher value lets it find older ones."""
+
+    history_max_bytes = ValidatedAttribute('history_max_bytes', int,
+                                           default=1024 * 1024)
+    """The approximate maximum size of the recent message history, in bytes.
+
+    When it's exceeded, lines from the least active channels are dropped
+    first."""
+
     @property
     def homedir(self):
         """The directory in which various files are stored at runtime.
@@ -117,6 +146,15 @@ class CoreSection(StaticSection):
 
     Regular expression syntax is used"""
 
+    lazy_modules = ListAttribute('lazy_modules')
+    """A list of modules to import only when one of their commands is used.
+
+    This speeds up startup when large modules are rarely used. It takes
+    effect from the second start after a module is added, since its commands
+    are read from a cache written on the previous start. Modules with
+    ``interval`` jobs, or a ``setup`` or ``shutdown`` function, are always
+    loaded."""
+
     log_raw = ValidatedAttribute('log_raw', bool, default=True)
     """Whether a log of raw lines as sent and recieved should be kept."""
 
@@ -126,12 +164,23 @@ class CoreSection(StaticSection):
     logging_channel = ValidatedAttribute('logging_channel', Identifier)
     """The channel to send logging messages to."""
 
+    logging_channel_rate = ValidatedAttribute('logging_channel_rate', int,
+                                              default=10)
+    """The most log messages to send to ``logging_channel`` per minute.
+
+    Repeats of a message already sent that minute aren't sent again either;
+    what's held back is summed up at the end of the minute."""
+
     logging_level = ChoiceAttribute('logging_level',
                                     ['CRITICAL', 'ERROR', 'WARNING', 'INFO',
                                      'DEBUG'],
                                     'WARNING')
     """The lowest severity of logs to display."""
 
+    module_import_threads = ValidatedAttribute('module_import_threads', int,
+                                               default=4)
+    """How many modules to import at once when starting up."""
+
     modes = ValidatedAttribute('modes', default='B')
     """User modes to be set on connection."""
 
@@ -178,14 +227,52 @@ class CoreSection(StaticSection):
     It is a regular expression (so the default, ``\.``, means commands start
     with a period), though using capturing groups will create problems."""
 
+    profile_every = ValidatedAttribute('profile_every', int, default=0)
+    """Profile every this-many-th call of each callable, if not 0.
+
+    Profiles are written to ``logdir`` and summarized by ``.metrics``."""
+
+    profile_slower_than = ValidatedAttribute('profile_slower_than', float,
+                                             default=0)
+    """Profile the next call of any callable which took longer than this
+    many seconds, if not 0."""
+
     reply_errors = ValidatedAttribute('reply_errors', bool, default=True)
     """Whether to message the sender of a message that triggered an error with the exception."""
 
+    reply_errors_interval = ValidatedAttribute('reply_errors_interval', int,
+                                               default=60)
+    """How many seconds to wait before replying with the same error again.
+
+    The error is still logged every time."""
+
+    stdio_log_backups = ValidatedAttribute('stdio_log_backups', int,
+                                           default=3)
+    """How many rotated copies of ``stdio.log`` to keep."""
+
+    stdio_log_max_bytes = ValidatedAttribute('stdio_log_max_bytes', int,
+                                             default=10 * 1024 * 1024)
+    """The size at which ``stdio.log`` is rotated, or 0 to let it grow.
+
+    This is 10 MiB by default, so set it to 0 to keep a single ever-growing
+    ``stdio.log`` as older versions did. Sending Sopel ``SIGHUP`` makes it reopen the file, for use with external
+    log rotation instead."""
+
+    sync_burst = ValidatedAttribute('sync_burst', int, default=5)
+    """How many JOIN and WHO requests to send at once on connect, before
+    slowing down to ``sync_rate``."""
+
+    sync_rate = ValidatedAttribute('sync_rate', float, default=2)
+    """How many JOIN and WHO requests to send per second on connect.
+
+    Channels are joined and synced in the order they are listed in
+    ``channels``, after ``logging_channel``."""
+
     throttle_join = ValidatedAttribute('throttle_join', int)
     """Slow down the initial join of channels to prevent getting kicked.
 
-    Sopel will only join this many channels at a time, sleeping for a second
-    between each batch. This is unnecessary on most networks."""
+    If set, this is used for both ``sync_burst`` and ``sync_rate``. Kept
+    for older configs."""
 
     timeout = ValidatedAttribute('timeout', int, default=120)
     """The amount of time acceptable between pings before timing out."""
@@ -13,8 +13,8 @@ dispatch function in bot.py and making it easier to maintain.
 from __future__ import unicode_literals, absolute_import, print_function, division
 
 
+import functools
 from random import randint
-import re
 import sys
 import time
 import sopel
@@ -87,17 +87,15 @@ def startup(bot, trigger):
 
     bot.memory['retry_join'] = dict()
 
-    if bot.config.core.throttle_join:
-        throttle_rate = int(bot.config.core.throttle_join)
-        channels_joined = 0
-        for channel in bot.config.core.channels:
-            channels_joined += 1
-            if not channels_joined % throttle_rate:
-                time.sleep(1)
-            bot.join(channel)
-    else:
-        for channel in bot.config.core.channels:
-            bot.join(channel)
+    # Joined (and then synced) in the order they're configured, but the
+    # logging channel first, at the pace set by sync_rate and sync_burst.
+    logging_channel = bot.config.core.logging_channel
+    for index, channel in enumerate(bot.config.core.channels):
+        key = None
+        if ' ' in channel:
+            channel, key = channel.split(' ', 1)
+        priority = 1 if channel == logging_channel else 10 + index
+        bot.channel_sync.join(channel, key, priority)
 
     if (not bot.config.core.owner_account and
             'account-tag' in bot.enabled_capabilities and
@@ -156,6 +154,48 @@ def retry_join(bot, trigger):
     bot.join(channel)
 
 
+@sopel.module.event(events.ERR_CHANNELISFULL, events.ERR_INVITEONLYCHAN,
+                    events.ERR_BANNEDFROMCHAN, events.ERR_BADCHANNELKEY)
+@sopel.module.rule('.*')
+@sopel.module.priority('high')
+@sopel.module.thread(False)
+@sopel.module.unblockable
+def join_failed(bot, trigger):
+    """Stop waiting for a channel the server wouldn't let us join."""
+    LOGGER.warning('Could not join %s: %s', trigger.args[1], trigger.args[-1])
+    bot.channel_sync.parted(trigger.args[1])
+
+
+@sopel.module.event(events.RPL_ISUPPORT)
+@sopel.module.rule('.*')
+@sopel.module.priority('high')
+@sopel.module.thread(False)
+@sopel.module.unblockable
+def handle_isupport(bot, trigger):
+    """Record the features the server supports (RPL_ISUPPORT)."""
+    bot.isupport.parse(trigger.args[1:-1])
+    casemapping = bot.isupport.casemapping.lower()
+    if casemapping == Identifier.casemapping:
+        return
+    try:
+        Identifier.set_casemapping(casemapping)
+    except ValueError:
+        LOGGER.warning('Unknown CASEMAPPING %s, using %s',
+                       casemapping, Identifier.casemapping)
+        return
+    # Our own nick was made before we knew the casemapping
+    bot.nick = Identifier(unicode(bot.nick))
+
+
+# The privileges of the modes servers commonly use for them; which of them
+# a server has, and the prefixes for them, are in bot.isupport.prefix.
+_privileges = {'v': sopel.module.VOICE,
+               'h': sopel.module.HALFOP,
+               'o': sopel.module.OP,
+               'a': sopel.module.ADMIN,
+               'q': sopel.module.OWNER}
+
+
 @sopel.module.rule('(.*)')
 @sopel.module.event(events.RPL_NAMREPLY)
 @sopel.module.priority('high')
@@ -163,31 +203,26 @@ def retry_join(bot, trigger):
 @sopel.module.unblockable
 def handle_names(bot, trigger):
     """Handle NAMES response, happens when joining to channels."""
-    names = trigger.split()
-
-    #TODO specific to one channel type. See issue 281.
-    channels = re.search('(#\S*)', trigger.raw)
-    if not channels:
+    # RPL_NAMREPLY is "<nick> <type> <channel> :<names>"
+    if len(trigger.args) < 4:
+        return
+    channel = Identifier(trigger.args[2])
+    if channel[:1] not in bot.isupport.chantypes:
         return
-    channel = Identifier(channels.group(1))
     if channel not in bot.privileges:
         bot.privileges[channel] = dict()
 
-    # This could probably be made flexible in the future, but I don't think
-    # it'd be worth it.
-    mapping = {'+': sopel.module.VOICE,
-               '%': sopel.module.HALFOP,
-               '@': sopel.module.OP,
-               '&': sopel.module.ADMIN,
-               '~': sopel.module.OWNER}
+    privileges = dict((prefix, _privileges.get(mode, 0))
+                      for mode, prefix in bot.isupport.prefix)
 
-    for name in names:
+    for name in trigger.args[3].split():
+        # With multi-prefix, a nick may have several prefixes, e.g. "@+nick"
         priv = 0
-        for prefix, value in iteritems(mapping):
-            if prefix in name:
-                priv = priv | value
-        nick = Identifier(name.lstrip(''.join(mapping.keys())))
-        bot.privileges[channel][nick] = priv
+        while name[:1] and name[0] in privileges:
+            priv = priv | privileges[name[0]]
+            name = name[1:]
+        if name:
+            bot.privileges[channel][Identifier(name)] = priv
 
 
 @sopel.module.rule('(.*)')
@@ -201,42 +236,52 @@ def track_modes(bot, trigger):
     channel = Identifier(trigger.args[0])
     line = trigger.args[1:]
 
-    # If the first character of where the mode is being set isn't a #
-    # then it's a user mode, not a channel mode, so we'll ignore it.
-    if channel.is_nick():
+    # If the first character of where the mode is being set isn't a channel
+    # type, then it's a user mode, not a channel mode, so we'll ignore it.
+    if channel[:1] not in bot.isupport.chantypes:
         return
+    if channel not in bot.privileges:
+        bot.privileges[channel] = dict()
 
-    mapping = {'v': sopel.module.VOICE,
-               'h': sopel.module.HALFOP,
-               'o': sopel.module.OP,
-               'a': sopel.module.ADMIN,
-               'q': sopel.module.OWNER}
+    prefix_modes = ''.join(mode for mode, _ in bot.isupport.prefix)
+    list_modes, always_param, set_param, _ = bot.isupport.chanmodes
 
-    modes = []
+    # Modes and their parameters may come in separate arguments, e.g.
+    # "+o-v Nick Other", or several groups of them. Each mode which takes a
+    # parameter takes the next one which isn't a mode string.
+    changes = []
+    params = []
     for arg in line:
-        if len(arg) == 0:
-            continue
-        if arg[0] in '+-':
-            # There was a comment claiming IRC allows e.g. MODE +aB-c foo, but
-            # I don't see it in any RFCs. Leaving in the extra parsing for now.
-            sign = ''
-            modes = []
+        if arg[:1] in ('+', '-'):
+            sign = '+'
             for char in arg:
-                if char == '+' or char == '-':
+                if char in '+-':
                     sign = char
                 else:
-                    modes.append(sign + char)
+                    changes.append((sign, char))
+        elif arg:
+            params.append(arg)
+
+    params.reverse()
+    for sign, mode in changes:
+        takes_param = (mode in prefix_modes or mode in list_modes or
+                       mode in always_param or
+                       (sign == '+' and mode in set_param))
+        if not takes_param:
+            continue
+        if not params:
+            break
+        param = params.pop()
+        value = _privileges.get(mode)
+        if mode not in prefix_modes or value is None:
+            continue
+        nick = Identifier(param)
+        priv = bot.privileges[channel].get(nick, 0)
+        if sign == '+':
+            priv = priv | value
         else:
-            arg = Identifier(arg)
-            for mode in modes:
-                priv = bot.privileges[channel].get(arg, 0)
-                value = mapping.get(mode[1])
-                if value is not None:
-                    if mode[0] == '+':
-                        priv = priv | value
-                    else:
-                        priv = priv & ~value
-                    bot.privileges[channel][arg] = priv
+            priv = priv & ~value
+        bot.privileges[channel][nick] = priv
 
 
 @sopel.module.rule('.*')
@@ -302,8 +347,10 @@ def track_kick(bot, trigger):
 
 def _remove_from_channel(bot, nick, channel):
     if nick == bot.nick:
+        bot.channel_sync.parted(channel)
         bot.privileges.pop(channel, None)
         bot.channels.pop(channel, None)
+        bot.history.forget_channel(channel)
 
         lost_users = []
         for nick_, user in bot.users.items():
@@ -325,9 +372,11 @@ def _remove_from_channel(bot, nick, channel):
 def _whox_enabled(bot):
     # Either privilege tracking or away notification. For simplicity, both
     # account notify and extended join must be there for account tracking.
-    return (('account-notify' in bot.enabled_capabilities and
-             'extended-join' in bot.enabled_capabilities) or
-            'away-notify' in bot.enabled_capabilities)
+    # The server must also say it understands WHOX.
+    return bot.isupport.whox and (
+        ('account-notify' in bot.enabled_capabilities and
+         'extended-join' in bot.enabled_capabilities) or
+        'away-notify' in bot.enabled_capabilities)
 
 
 def _send_who(bot, channel):
@@ -354,11 +403,13 @@ def _send_who(bot, channel):
 @sopel.module.unblockable
 def track_join(bot, trigger):
     if trigger.nick == bot.nick and trigger.sender not in bot.channels:
-        bot.write(('TOPIC', trigger.sender))
-
+        # The topic comes with the join (RPL_TOPIC), and WHO is paced so
+        # as not to flood the server when joining many channels.
         bot.privileges[trigger.sender] = dict()
         bot.channels[trigger.sender] = Channel(trigger.sender)
-        _send_who(bot, trigger.sender)
+        bot.channel_sync.joined(trigger.sender,
+                                functools.partial(_send_who, bot,
+                                                  trigger.sender))
 
     bot.privileges[trigger.sender][trigger.nick] = 0
 
@@ -690,6 +741,7 @@ def recv_who(bot, trigger):
 def end_who(bot, trigger):
     if _whox_enabled(bot):
         who_reqs.pop(trigger.args[1], None)
+    bot.channel_sync.who_done(trigger.args[1])
 
 
 @sopel.module.rule('.*')
@@ -5,8 +5,10 @@ import json
 import os.path
 import sys
 import sqlite3
+import time
 
 from sopel.tools import Identifier
+from sopel.tools.metrics import Histogram
 
 if sys.version_info.major >= 3:
     unicode = str
@@ -48,6 +50,11 @@ class SopelDB(object):
         if not os.path.isabs(path):
             path = os.path.normpath(os.path.join(config_dir, path))
         self.filename = path
+        self.query_durations = Histogram()
+        """How long each query made through :meth:`execute` took.
+
+        Updated without locking, so counts may be slightly off when many
+        threads query at once."""
         self._create()
 
     def connect(self):
@@ -59,9 +66,13 @@ class SopelDB(object):
 
         Returns a cursor object, on which things like `.fetchall()` can be
         called per PEP 249."""
-        with self.connect() as conn:
-            cur = conn.cursor()
-            return cur.execute(*args, **kwargs)
+        start = time.time()
+        try:
+            with self.connect() as conn:
+                cur = conn.cursor()
+                return cur.execute(*args, **kwargs)
+        finally:
+            self.query_durations.observe(time.time() - start)
 
     def _create(self):
         """Create the basic database structure."""
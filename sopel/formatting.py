@@ -1,12 +1,15 @@
 # coding=utf-8
-"""The formatting module includes functions to apply IRC formatting to text.
+"""The formatting module includes functions to apply IRC formatting to text,
+to remove it, and to split formatted text to fit in a line.
 
 *Availability: 4.5+*
 """
 # Copyright 2014, Elsie Powell, embolalia.com
 # Licensed under the Eiffel Forum License 2.
 from __future__ import unicode_literals, absolute_import, print_function, division
+import re
 import sys
+import unicodedata
 if sys.version_info.major >= 3:
     unicode = str
 
@@ -20,6 +23,30 @@ CONTROL_UNDERLINE = '\x1f'
 """The control code to start or end underlining"""
 CONTROL_BOLD = '\x02'
 """The control code to start or end bold formatting"""
+CONTROL_ITALIC = '\x1d'
+"""The control code to start or end italic formatting"""
+CONTROL_STRIKETHROUGH = '\x1e'
+"""The control code to start or end strikethrough formatting"""
+CONTROL_MONOSPACE = '\x11'
+"""The control code to start or end monospace formatting"""
+CONTROL_REVERSE = '\x16'
+"""The control code to start or end reversing foreground and background"""
+CONTROL_HEX_COLOR = '\x04'
+"""The control code to start or end hexadecimal (RRGGBB) color formatting"""
+
+# A color code takes up to two digits for each color, and a hex color code
+# six hex digits; a comma not followed by a color is part of the text.
+_COLOR_PATTERN = ('\x03(?:[0-9]{1,2}(?:,[0-9]{1,2})?)?'
+                  '|\x04(?:[0-9A-Fa-f]{6}(?:,[0-9A-Fa-f]{6})?)?')
+_SIMPLE_CODES = '\x02\x0f\x11\x16\x1d\x1e\x1f'
+_COLOR_CODES = re.compile(_COLOR_PATTERN)
+_CODES_BYTES = re.compile(
+    (_COLOR_PATTERN + '|[' + _SIMPLE_CODES + ']').encode('ascii'))
+_HEX_COLOR = re.compile('[0-9A-Fa-f]{6}$')
+_LONGEST_CODE = 15  # \x04RRGGBB,RRGGBB
+# Characters which belong with the one before (variation selectors), or
+# join it to the next (zero width joiner)
+_JOINERS = '\u200d\ufe0e\ufe0f'
 
 
 # TODO when we can move to 3.3+ completely, make this an Enum.
@@ -105,3 +132,141 @@ def bold(text):
 def underline(text):
     """Return the text, with underline IRC formatting."""
     return ''.join([CONTROL_UNDERLINE, text, CONTROL_UNDERLINE])
+
+
+def italic(text):
+    """Return the text, with italic IRC formatting."""
+    return ''.join([CONTROL_ITALIC, text, CONTROL_ITALIC])
+
+
+def strikethrough(text):
+    """Return the text, with strikethrough IRC formatting."""
+    return ''.join([CONTROL_STRIKETHROUGH, text, CONTROL_STRIKETHROUGH])
+
+
+def monospace(text):
+    """Return the text, with monospace IRC formatting."""
+    return ''.join([CONTROL_MONOSPACE, text, CONTROL_MONOSPACE])
+
+
+def reverse(text):
+    """Return the text, with its foreground and background colors swapped."""
+    return ''.join([CONTROL_REVERSE, text, CONTROL_REVERSE])
+
+
+def _get_hex_color(color):
+    if color is None:
+        return None
+    code = color.lstrip('#')
+    if not _HEX_COLOR.match(code):
+        raise ValueError('Not a hex color: {}'.format(color))
+    return code.upper()
+
+
+def hex_color(text, fg=None, bg=None):
+    """Return the text, with the given hex colors (e.g. ``'#FF8800'``)
+    applied in IRC formatting.
+
+    Fewer clients show these than the colors of :func:`color`."""
+    if not fg and not bg:
+        return text
+
+    fg = _get_hex_color(fg)
+    bg = _get_hex_color(bg)
+
+    if not bg:
+        text = ''.join([CONTROL_HEX_COLOR, fg, text, CONTROL_HEX_COLOR])
+    else:
+        text = ''.join([CONTROL_HEX_COLOR, fg, ',', bg, text,
+                        CONTROL_HEX_COLOR])
+    return text
+
+
+def plain(text):
+    """Return the text, without any IRC formatting.
+
+    Colors and hex colors are removed along with their color numbers, so
+    ``'\\x0304,01red'`` becomes ``'red'``."""
+    # Faster than one regex for every code: most text has no formatting, or
+    # only a few kinds, and each check for one is a quick scan.
+    if CONTROL_COLOR in text or CONTROL_HEX_COLOR in text:
+        text = _COLOR_CODES.sub('', text)
+    for code in _SIMPLE_CODES:
+        if code in text:
+            text = text.replace(code, '')
+    return text
+
+
+def _joins_previous(char):
+    return bool(char) and (unicodedata.combining(char) or char in _JOINERS)
+
+
+def _char_at(data, index):
+    # The character starting at byte ``index`` of UTF-8 ``data``
+    return data[index:index + 4].decode('utf-8', 'ignore')[:1]
+
+
+def _char_start(data, index):
+    # Back ``index`` up to the start of the UTF-8 sequence it's in
+    while index > 0 and ord(data[index:index + 1]) & 0xC0 == 0x80:
+        index -= 1
+    return index
+
+
+def _cut(data, limit):
+    """Where to cut UTF-8 ``data`` to at most ``limit`` bytes, outside of any
+    character, formatting code, or combined character."""
+    cut = _char_start(data, limit)
+    # Keep a character with the marks and joiners around it
+    while cut > 0 and (_joins_previous(_char_at(data, cut)) or
+                       _char_at(data, _char_start(data, cut - 1)) == '\u200d'):
+        cut = _char_start(data, cut - 1)
+    if cut == 0:
+        # One combined character too long for a line; split it after all
+        cut = _char_start(data, limit)
+    # Keep a formatting code whole
+    for match in _CODES_BYTES.finditer(data, max(0, cut - _LONGEST_CODE),
+                                       cut + _LONGEST_CODE):
+        if match.start() < cut < match.end():
+            cut = match.start()
+            break
+    if cut == 0:
+        # Less than one character or code fits; send it anyway
+        match = _CODES_BYTES.match(data)
+        if match:
+            cut = match.end()
+        else:
+            cut = len(_char_at(data, 0).encode('utf-8'))
+    return cut
+
+
+def split(text, max_bytes, max_pieces=None):
+    """Split the text into pieces of at most ``max_bytes`` bytes in UTF-8.
+
+    Pieces end at the last space which fits, if there is one, and are never
+    cut inside a character, a formatting code, or a character with its
+    combining marks. Spaces around the cuts are dropped, and no piece is
+    only spaces. Formatting isn't carried over from one piece to the next.
+    If ``max_pieces`` is given, the last piece holds all the rest of the
+    text, however long.
+    """
+    data = text.encode('utf-8')
+    if len(data) <= max_bytes:
+        return [text]
+    pieces = []
+    while len(data) > max_bytes and (max_pieces is None or
+                                     len(pieces) < max_pieces - 1):
+        space = data.rfind(b' ', 0, max_bytes + 1)
+        if space > 0:
+            piece = data[:space].rstrip(b' ')
+            data = data[space + 1:]
+        else:
+            cut = _cut(data, max_bytes)
+            piece = data[:cut]
+            data = data[cut:]
+        if piece.strip(b' '):
+            pieces.append(piece.decode('utf-8'))
+        data = data.lstrip(b' ')
+    if data:
+        pieces.append(data.decode('utf-8'))
+    return pieces
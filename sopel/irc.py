@@ -18,8 +18,12 @@ import asynchat
 import os
 import codecs
 import traceback
-from sopel.logger import get_logger
+from sopel.logger import get_logger, ExceptionLog
 from sopel.tools import stderr, Identifier
+from sopel.tools.coalesce import Coalescer
+from sopel.tools.isupport import ISupport
+from sopel.tools.metrics import Metrics
+from sopel.tools.sync import ChannelSync
 from sopel.trigger import PreTrigger
 try:
     import ssl
@@ -67,6 +71,36 @@ class Bot(asynchat.async_chat):
         self.writing_lock = threading.Lock()
         self.raw = None
 
+        self.isupport = ISupport()
+        """The features the server announced support for in ``RPL_ISUPPORT``.
+
+        See :class:`sopel.tools.isupport.ISupport`."""
+        self.coalescer = Coalescer(self, config.core.coalesce_window)
+        """Combines JOIN, PART, MODE, KICK and multi-target messages into
+        fewer lines. See :class:`sopel.tools.coalesce.Coalescer`."""
+        rate = config.core.sync_rate
+        burst = config.core.sync_burst
+        if config.core.throttle_join:
+            rate = burst = config.core.throttle_join
+        self.channel_sync = ChannelSync(self, rate, burst)
+        """Paces joining channels and asking for their users on connect,
+        and tracks which channels are synced. See
+        :class:`sopel.tools.sync.ChannelSync`."""
+        self.exception_log = ExceptionLog(
+            os.path.join(config.core.logdir, 'exceptions.log'),
+            json_lines=config.core.exception_log_json,
+            max_bytes=config.core.exception_log_max_bytes,
+            reply_interval=config.core.reply_errors_interval)
+        """Where exceptions from modules and the core are recorded."""
+        self.metrics = Metrics(config.core.profile_every,
+                               config.core.profile_slower_than,
+                               config.core.logdir)
+        """Traffic counters, and timings and error counts for each callable
+        and job.
+
+        A :class:`sopel.tools.metrics.Metrics`.
+        """
+
         # Right now, only accounting for two op levels.
         # This might be expanded later.
         # These lists are filled in startup.py, as of right now.
@@ -140,13 +174,20 @@ class Bot(asynchat.async_chat):
             # including the trailing CR-LF. Thus, there are 510 characters
             # maximum allowed for the command and its parameters.  There is no
             # provision for continuation of message lines.
+            #
+            # Servers which allow longer lines announce it with LINELEN.
+            max_length = self.isupport.linelen - 2
 
             if text is not None:
-                temp = (' '.join(args) + ' :' + text)[:510] + '\r\n'
+                temp = ' '.join(args) + ' :' + text
             else:
-                temp = ' '.join(args)[:510] + '\r\n'
+                temp = ' '.join(args)
+            # The limit is in bytes; don't leave half a character at the end
+            temp = temp.encode('utf-8')[:max_length].decode('utf-8', 'ignore')
+            temp += '\r\n'
             self.log_raw(temp, '>>')
             self.send(temp.encode('utf-8'))
+            self.metrics.lines_sent += 1
         finally:
             self.writing_lock.release()
 
@@ -200,6 +241,8 @@ class Bot(asynchat.async_chat):
         self.close()
 
     def handle_connect(self):
+        self.isupport = ISupport()
+        self.channel_sync.reset()
         if self.config.core.use_ssl and has_ssl:
             if not self.config.core.verify_ssl:
                 self.ssl = ssl.wrap_socket(self.socket,
@@ -332,46 +375,45 @@ class Bot(asynchat.async_chat):
             stderr('Nickname already in use!')
             self.handle_close()
 
+        self.metrics.lines_received += 1
+        start = time.time()
         self.dispatch(pretrigger)
+        self.metrics.dispatch_durations.observe(time.time() - start)
 
     def dispatch(self, pretrigger):
         pass
 
+    @staticmethod
+    def _signature(trace):
+        """Sum up a formatted traceback as the error and where it was raised."""
+        lines = list(reversed(trace.splitlines()))
+        report = [lines[0].strip()]
+        for line in lines:
+            line = line.strip()
+            if line.startswith('File "'):
+                report.append(line[0].lower() + line[1:])
+                break
+        else:
+            report.append('source unknown')
+        return '%s (%s)' % (report[0], report[1])
+
     def error(self, trigger=None):
         """Called internally when a module causes an error."""
         try:
             trace = traceback.format_exc()
             if sys.version_info.major < 3:
                 trace = trace.decode('utf-8', errors='xmlcharrefreplace')
-            stderr(trace)
-            try:
-                lines = list(reversed(trace.splitlines()))
-                report = [lines[0].strip()]
-                for line in lines:
-                    line = line.strip()
-                    if line.startswith('File "'):
-                        report.append(line[0].lower() + line[1:])
-                        break
-                else:
-                    report.append('source unknown')
-
-                signature = '%s (%s)' % (report[0], report[1])
-                # TODO: make not hardcoded
-                log_filename = os.path.join(self.config.core.logdir, 'exceptions.log')
-                with codecs.open(log_filename, 'a', encoding='utf-8') as logfile:
-                    logfile.write('Signature: %s\n' % signature)
-                    if trigger:
-                        logfile.write('from {} at {}. Message was: {}\n'.format(
-                            trigger.nick, str(datetime.now()), trigger.group(0)))
-                    logfile.write(trace)
-                    logfile.write(
-                        '----------------------------------------\n\n'
-                    )
-            except Exception as e:
-                stderr("Could not save full traceback!")
-                LOGGER.error("Could not save traceback from %s to file: %s", trigger.sender, str(e))
-
-            if trigger and self.config.core.reply_errors and trigger.sender is not None:
+            signature = self._signature(trace)
+            context = {}
+            if trigger:
+                context = {'nick': trigger.nick, 'sender': trigger.sender,
+                           'message': trigger.group(0)}
+            if self.exception_log.record(signature, trace, context):
+                stderr(trace)
+
+            if (trigger and self.config.core.reply_errors and
+                    trigger.sender is not None and
+                    self.exception_log.should_reply(signature)):
                 self.msg(trigger.sender, signature)
             if trigger:
                 LOGGER.error('Exception from {}: {} ({})'.format(trigger.sender, str(signature), trigger.raw))
@@ -390,22 +432,14 @@ class Bot(asynchat.async_chat):
         trace = traceback.format_exc()
         stderr(trace)
         LOGGER.error('Fatal error in core, please review exception log')
-        # TODO: make not hardcoded
-        logfile = codecs.open(
-            os.path.join(self.config.core.logdir, 'exceptions.log'),
-            'a',
-            encoding='utf-8'
-        )
-        logfile.write('Fatal error in core, handle_error() was called\n')
-        logfile.write('last raw line was %s' % self.raw)
-        logfile.write(trace)
-        logfile.write('Buffer:\n')
-        logfile.write(self.buffer)
-        logfile.write('----------------------------------------\n\n')
-        logfile.close()
+        self.exception_log.record(
+            'Fatal error in core: %s' % self._signature(trace), trace,
+            {'last raw line': self.raw, 'buffer': self.buffer})
         if self.error_count > 10:
             if (datetime.now() - self.last_error_timestamp).seconds < 5:
                 stderr("Too many errors, can't continue")
+                # os._exit skips the exception log's writer thread
+                self.exception_log.flush(5)
                 os._exit(1)
         self.last_error_timestamp = datetime.now()
         self.error_count = self.error_count + 1
@@ -1,15 +1,23 @@
 # coding=utf-8
 from __future__ import unicode_literals, absolute_import, print_function, division
 
+import hashlib
 import imp
+import json
 import os.path
 import re
 import sys
+import threading
+import time
 
 from sopel.tools import itervalues, get_command_regexp
 
 if sys.version_info.major >= 3:
     basestring = (str, bytes)
+    # Universal newlines are the default, and the 'U' mode is gone in 3.11
+    _source_mode = 'r'
+else:
+    _source_mode = 'U'
 
 # Can be implementation-dependent
 _regex_type = type(re.compile(''))
@@ -30,13 +38,48 @@ def get_module_description(path):
         return None
 
 
-def _update_modules_from_dir(modules, directory):
-    # Note that this modifies modules in place
+# Directory -> (directory mtime, {name: (path, type_)})
+_discovery_cache = {}
+# ('rule', nick, pattern) or ('command', prefix, command) -> compiled regex
+_rule_cache = {}
+
+
+def clear_caches():
+    """Forget the cached module directory listings and compiled rules."""
+    _discovery_cache.clear()
+    _rule_cache.clear()
+
+
+def _scan_directory(directory):
+    """Return the modules in ``directory`` as a dict of name to
+    ``(path, type_)``.
+
+    The result is cached until the directory's mtime changes, which happens
+    whenever a file or package is added, removed or renamed in it. Edits to
+    an existing module don't change what is found, so they don't need a new
+    scan.
+    """
+    try:
+        mtime = os.path.getmtime(directory)
+    except OSError:
+        _discovery_cache.pop(directory, None)
+        return {}
+    cached = _discovery_cache.get(directory)
+    if cached and cached[0] == mtime:
+        return cached[1]
+    found = {}
     for path in os.listdir(directory):
         path = os.path.join(directory, path)
         result = get_module_description(path)
         if result:
-            modules[result[0]] = result[1:]
+            found[result[0]] = result[1:]
+    _discovery_cache[directory] = (mtime, found)
+    return found
+
+
+def _update_modules_from_dir(modules, directory):
+    # Note that this modifies modules in place
+    modules.update(_scan_directory(directory))
 
 
 def enumerate_modules(config, show_all=False):
@@ -61,8 +104,6 @@ def enumerate_modules(config, show_all=False):
     main_dir = os.path.dirname(os.path.abspath(__file__))
     modules_dir = os.path.join(main_dir, 'modules')
     _update_modules_from_dir(modules, modules_dir)
-    for path in os.listdir(modules_dir):
-        break
 
     # Then, find PyPI installed modules
     # TODO does this work with all possible install mechanisms?
@@ -115,13 +156,28 @@ def compile_rule(nick, pattern):
     if isinstance(pattern, _regex_type):
         return pattern
 
+    key = ('rule', nick, pattern)
+    compiled = _rule_cache.get(key)
+    if compiled is not None:
+        return compiled
+
     nick = re.escape(nick)
     pattern = pattern.replace('$nickname', nick)
     pattern = pattern.replace('$nick', r'{}[,:]\s+'.format(nick))
     flags = re.IGNORECASE
     if '\n' in pattern:
         flags |= re.VERBOSE
-    return re.compile(pattern, flags)
+    compiled = _rule_cache[key] = re.compile(pattern, flags)
+    return compiled
+
+
+def compile_command(prefix, command):
+    """Like :func:`sopel.tools.get_command_regexp`, but cached."""
+    key = ('command', prefix, command)
+    compiled = _rule_cache.get(key)
+    if compiled is None:
+        compiled = _rule_cache[key] = get_command_regexp(prefix, command)
+    return compiled
 
 
 def trim_docstring(doc):
@@ -178,8 +234,7 @@ def clean_callable(func, config):
     if hasattr(func, 'commands'):
         func.rule = getattr(func, 'rule', [])
         for command in func.commands:
-            regexp = get_command_regexp(prefix, command)
-            func.rule.append(regexp)
+            func.rule.append(compile_command(prefix, command))
         if hasattr(func, 'example'):
             example = func.example[0]["example"]
             example = example.replace('$nickname', nick)
@@ -194,7 +249,8 @@ def load_module(name, path, type_):
     """Load a module, and sort out the callables and shutdowns"""
     if type_ == imp.PY_SOURCE:
         with open(path) as mod:
-            module = imp.load_module(name, mod, path, ('.py', 'U', type_))
+            module = imp.load_module(name, mod, path,
+                                     ('.py', _source_mode, type_))
     elif type_ == imp.PKG_DIRECTORY:
         module = imp.load_module(name, None, path, ('', '', type_))
     else:
@@ -202,6 +258,193 @@ def load_module(name, path, type_):
     return module, os.path.getmtime(path)
 
 
+def load_modules(modules, names, threads=1):
+    """Import the named modules, using up to ``threads`` threads at once.
+
+    ``modules`` is a dict as returned by :func:`enumerate_modules`. Returns a
+    dict mapping each name to a ``(module, exc_info, seconds)`` tuple, where
+    ``module`` is ``None`` and ``exc_info`` is the result of
+    ``sys.exc_info()`` if the import failed, and ``seconds`` is how long the
+    import took.
+
+    Modules are imported independently of each other, so this only helps
+    when a good part of the time goes to I/O, like reading files and
+    importing large third-party libraries.
+    """
+    results = {}
+    pending = list(names)
+    lock = threading.Lock()
+
+    def worker():
+        while True:
+            with lock:
+                if not pending:
+                    return
+                name = pending.pop(0)
+            path, type_ = modules[name]
+            start = time.time()
+            try:
+                module, _ = load_module(name, path, type_)
+            except Exception:
+                results[name] = (None, sys.exc_info(), time.time() - start)
+            else:
+                results[name] = (module, None, time.time() - start)
+
+    workers = [threading.Thread(target=worker)
+               for _ in range(max(1, min(threads, len(pending))))]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    return results
+
+
+def get_module_mtime(path, type_):
+    """Return the last modification time of a module's source.
+
+    For packages, this is the newest of the ``.py`` files inside it.
+    """
+    if type_ != imp.PKG_DIRECTORY:
+        return os.path.getmtime(path)
+    mtime = os.path.getmtime(path)
+    for dirpath, _, filenames in os.walk(path):
+        for filename in filenames:
+            if filename.endswith('.py'):
+                filepath = os.path.join(dirpath, filename)
+                mtime = max(mtime, os.path.getmtime(filepath))
+    return mtime
+
+
+def get_module_hash(path, type_):
+    """Return a hash of a module's source, to tell whether it has changed.
+
+    For packages, all the ``.py`` files inside it are hashed together.
+    """
+    if type_ == imp.PKG_DIRECTORY:
+        filenames = []
+        for dirpath, _, names in os.walk(path):
+            filenames.extend(os.path.join(dirpath, name)
+                             for name in names if name.endswith('.py'))
+        filenames.sort()
+    else:
+        filenames = [path]
+    digest = hashlib.sha1()
+    for filename in filenames:
+        digest.update(filename.encode('utf-8'))
+        with open(filename, 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+_metadata_attrs = ('event', 'priority', 'thread', 'unblockable', 'rate',
+                   'channel_rate', 'global_rate', 'intents', 'commands',
+                   'category')
+
+
+def get_module_metadata(path, type_, config, module, callables, jobs,
+                        shutdowns):
+    """Describe a cleaned module's callables, for :func:`deferred_callable`.
+
+    The result can be stored as JSON. It is only valid for the same module
+    source and the same nick and prefixes, which :func:`metadata_is_fresh`
+    checks.
+    """
+    described = []
+    for func in callables:
+        meta = {
+            'name': func.__name__,
+            'rule': [(rule.pattern, rule.flags) for rule in func.rule],
+            'docs': func._docs,
+        }
+        for attr in _metadata_attrs:
+            if hasattr(func, attr):
+                meta[attr] = getattr(func, attr)
+        described.append(meta)
+    return {
+        'path': path,
+        'mtime': get_module_mtime(path, type_),
+        'nick': config.core.nick,
+        'prefix': config.core.prefix,
+        'help_prefix': config.core.help_prefix,
+        # Jobs and shutdown methods can't wait for a trigger, so modules with
+        # them are always imported up front. So are modules with a setup
+        # function, which may register URL callbacks or check the config.
+        'deferrable': (not jobs and not shutdowns and
+                       not hasattr(module, 'setup')),
+        'callables': described,
+    }
+
+
+def metadata_is_fresh(metadata, path, type_, config):
+    """Whether ``metadata`` still describes the module at ``path``."""
+    if not metadata or metadata.get('path') != path:
+        return False
+    try:
+        mtime = get_module_mtime(path, type_)
+    except OSError:
+        return False
+    return (metadata.get('mtime') == mtime and
+            metadata.get('nick') == config.core.nick and
+            metadata.get('prefix') == config.core.prefix and
+            metadata.get('help_prefix') == config.core.help_prefix)
+
+
+def get_metadata_cache_path(config):
+    """Return the file in which module metadata is cached for ``config``."""
+    config_dir, config_file = os.path.split(config.filename)
+    config_name, _ = os.path.splitext(config_file)
+    return os.path.join(config_dir, config_name + '.modules.json')
+
+
+def load_metadata_cache(config):
+    """Return the cached module metadata for ``config``, or an empty dict."""
+    try:
+        with open(get_metadata_cache_path(config), 'r') as f:
+            return json.load(f)
+    except (IOError, OSError, ValueError):
+        return {}
+
+
+def save_metadata_cache(config, metadata):
+    """Store module metadata for ``config``, as from
+    :func:`get_module_metadata`."""
+    path = get_metadata_cache_path(config)
+    try:
+        with open(path + '.tmp', 'w') as f:
+            json.dump(metadata, f)
+        os.rename(path + '.tmp', path)
+    except (IOError, OSError):
+        pass  # It's only a cache
+
+
+def deferred_callable(module_name, meta, load):
+    """Return a stand-in for a callable described by ``meta``.
+
+    The stand-in has the attributes of the original, so it can be registered
+    in its place. When first triggered, it calls ``load()``, which should
+    import the real module and register its callables, and returns the real
+    module; the trigger is then passed on to the real callable.
+    """
+    def deferred(bot, trigger):
+        module = load()
+        for obj in itervalues(vars(module)):
+            if (callable(obj) and is_triggerable(obj) and
+                    getattr(obj, '__name__', None) == meta['name']):
+                return obj(bot, trigger)
+
+    deferred.__name__ = str(meta['name'])
+    deferred.__module__ = module_name
+    deferred.rule = [re.compile(pattern, flags)
+                     for pattern, flags in meta['rule']]
+    deferred._docs = dict((command, tuple(doc))
+                          for command, doc in meta['docs'].items())
+    for attr in _metadata_attrs:
+        if attr in meta:
+            setattr(deferred, attr, meta[attr])
+    deferred.deferred = True
+    return deferred
+
+
 def is_triggerable(obj):
     return any(hasattr(obj, attr) for attr in ('rule', 'rule', 'intent',
                                                'commands'))
@@ -1,24 +1,226 @@
 # coding=utf-8
 from __future__ import unicode_literals, absolute_import, print_function, division
 
+import collections
+import json
 import logging
+import threading
+import time
+from datetime import datetime
+
+try:
+    import Queue
+except ImportError:
+    import queue as Queue
+
+from sopel.tools import _LogFile
 
 
 class IrcLoggingHandler(logging.Handler):
-    def __init__(self, bot, level):
+    """Sends log records to the bot's logging channel.
+
+    :meth:`emit` only formats the record and queues it, so whatever thread
+    logged never waits for the bot's send throttle; one worker thread sends
+    the messages. Within each ``window`` of seconds, a record that repeats one
+    already sent (same logger, level and message template) is not sent
+    again, and at most ``max_per_window`` messages are sent. What was held
+    back is summarized in one line when the window ends. If the queue is
+    full, further records are dropped and counted in the same way.
+    """
+    def __init__(self, bot, level, max_per_window=10, window=60,
+                 queue_size=1000):
         super(IrcLoggingHandler, self).__init__(level)
         self._bot = bot
         self._channel = bot.config.core.logging_channel
+        self.max_per_window = max_per_window
+        self.window = window
+        self._queue = Queue.Queue(queue_size)
+        self._dropped = 0
+        self._seen = set()
+        self._sent = 0
+        self._suppressed = 0
+        self._window_end = time.time() + window
+        self._worker = threading.Thread(target=self._work,
+                                        name='IrcLoggingHandler')
+        self._worker.daemon = True
+        self._worker.start()
 
     def emit(self, record):
         try:
-            msg = self.format(record)
-            self._bot.msg(self._channel, msg)
+            key = (record.name, record.levelno, record.msg)
+            self._queue.put_nowait((key, self.format(record)))
+        except Queue.Full:
+            self._dropped += 1
         except (KeyboardInterrupt, SystemExit):
             raise
         except:
             self.handleError(record)
 
+    def _work(self):
+        while True:
+            timeout = max(0, self._window_end - time.time())
+            try:
+                item = self._queue.get(timeout=timeout)
+            except Queue.Empty:
+                item = None
+            if time.time() >= self._window_end:
+                self._end_window()
+            if item is not None:
+                self._handle(*item)
+
+    def _handle(self, key, msg):
+        if key in self._seen or self._sent >= self.max_per_window:
+            self._suppressed += 1
+            return
+        self._seen.add(key)
+        self._sent += 1
+        self._send(msg)
+
+    def _end_window(self):
+        suppressed = self._suppressed + self._dropped
+        self._dropped = 0
+        self._suppressed = 0
+        self._seen.clear()
+        self._sent = 0
+        self._window_end = time.time() + self.window
+        if suppressed:
+            self._send('%d similar messages suppressed' % suppressed)
+
+    def _send(self, msg):
+        try:
+            self._bot.msg(self._channel, msg)
+        except Exception:
+            pass  # Logging this would only feed it back to us
+
+
+class ExceptionLog(object):
+    """Records exceptions from modules and the core to ``exceptions.log``.
+
+    Exceptions are grouped by signature (the error and where it was raised).
+    The first occurrence of a signature is written in full; further ones
+    within ``group_interval`` seconds are only counted, and that count is
+    written along with the next occurrence after the interval. Writing
+    happens on a background thread, into a file which is kept open and
+    rotated once it reaches ``max_bytes``. If ``json_lines`` is true, each
+    entry is written as one JSON object per line instead of as text.
+
+    Only the ``max_signatures`` most recently seen signatures are
+    remembered; a forgotten one is treated as new if it comes up again.
+    """
+    def __init__(self, path, json_lines=False, max_bytes=0,
+                 group_interval=60, reply_interval=60, max_signatures=1000):
+        self.path = path
+        self.json_lines = json_lines
+        self.max_bytes = max_bytes
+        self.group_interval = group_interval
+        self.reply_interval = reply_interval
+        self.max_signatures = max_signatures
+        self.counts = collections.OrderedDict()
+        """The number of times each signature has been seen, least recently
+        seen first."""
+        # signature -> [last written, count since]
+        self._logged = collections.OrderedDict()
+        self._replied = collections.OrderedDict()  # signature -> last reply
+        self._lock = threading.Lock()
+        self._queue = Queue.Queue()
+        self._writer = None
+
+    def record(self, signature, trace, context=None):
+        """Record an exception, with its formatted ``trace``.
+
+        ``context`` is a dict of extra details to log (e.g. the nick and
+        message that triggered it). Returns whether this occurrence is
+        written in full, as opposed to only counted.
+        """
+        now = time.time()
+        with self._lock:
+            self._remember(self.counts, signature,
+                           self.counts.get(signature, 0) + 1)
+            logged = self._logged.get(signature)
+            if logged is not None and now - logged[0] < self.group_interval:
+                logged[1] += 1
+                self._remember(self._logged, signature, logged)
+                return False
+            repeats = logged[1] if logged else 0
+            self._remember(self._logged, signature, [now, 0])
+            if self._writer is None:
+                self._writer = threading.Thread(target=self._write_loop,
+                                                name='ExceptionLog')
+                self._writer.daemon = True
+                self._writer.start()
+        self._queue.put((now, signature, trace, context or {}, repeats))
+        return True
+
+    def should_reply(self, signature):
+        """Whether to tell the channel about ``signature`` this time.
+
+        True at most once every ``reply_interval`` seconds per signature.
+        """
+        now = time.time()
+        with self._lock:
+            last = self._replied.get(signature)
+            if last is not None and now - last < self.reply_interval:
+                return False
+            self._remember(self._replied, signature, now)
+            return True
+
+    def flush(self, timeout=None):
+        """Wait up to ``timeout`` seconds for everything recorded so far to
+        be written. Returns whether it was.
+
+        Call this before exiting abruptly (e.g. with ``os._exit``), which
+        would lose what the background thread hasn't written yet.
+        """
+        with self._lock:
+            if self._writer is None:
+                return True
+        done = threading.Event()
+        self._queue.put(done)
+        return done.wait(timeout)
+
+    def _remember(self, mapping, signature, value):
+        # Must be called with the lock held. Moves ``signature`` to the most
+        # recent end, forgetting the oldest beyond ``max_signatures``.
+        mapping.pop(signature, None)
+        mapping[signature] = value
+        while len(mapping) > self.max_signatures:
+            mapping.popitem(last=False)
+
+    def _write_loop(self):
+        logfile = _LogFile.get(self.path, self.max_bytes)
+        while True:
+            entry = self._queue.get()
+            if isinstance(entry, threading.Event):
+                logfile.flush()
+                entry.set()
+                continue
+            try:
+                logfile.write(self._format(*entry))
+                if self._queue.empty():
+                    logfile.flush()
+            except Exception:
+                pass  # There's nowhere left to report this
+
+    def _format(self, when, signature, trace, context, repeats):
+        if self.json_lines:
+            entry = dict(context)
+            entry.update({
+                'time': datetime.fromtimestamp(when).isoformat(),
+                'signature': signature,
+                'repeats': repeats,
+                'trace': trace,
+            })
+            return json.dumps(entry, sort_keys=True) + '\n'
+        lines = ['Signature: %s' % signature]
+        if repeats:
+            lines.append('(%d more times since it was last logged)' % repeats)
+        lines.append('at %s' % datetime.fromtimestamp(when))
+        for key, value in sorted(context.items()):
+            lines.append('%s: %s' % (key, value))
+        lines.append(trace)
+        lines.append('----------------------------------------\n\n')
+        return '\n'.join(lines)
+
 
 class ChannelOutputFormatter(logging.Formatter):
     def __init__(self):
@@ -37,7 +239,8 @@ def setup_logging(bot):
     logging.basicConfig(level=level)
     logger = logging.getLogger('sopel')
     if bot.config.core.logging_channel:
-        handler = IrcLoggingHandler(bot, level)
+        handler = IrcLoggingHandler(
+            bot, level, bot.config.core.logging_channel_rate)
         handler.setFormatter(ChannelOutputFormatter())
         logger.addHandler(handler)
 
@@ -45,7 +45,7 @@ def kick(bot, trigger):
         reasonidx = 3
     reason = ' '.join(text[reasonidx:])
     if nick != bot.config.core.nick:
-        bot.write(['KICK', channel, nick], reason)
+        bot.coalescer.kick(channel, nick, reason)
 
 
 def configureHostMask(mask):
@@ -96,7 +96,7 @@ def ban(bot, trigger):
     banmask = configureHostMask(banmask)
     if banmask == '':
         return
-    bot.write(['MODE', channel, '+b', banmask])
+    bot.coalescer.mode(channel, '+b', banmask)
 
 
 @require_chanmsg
@@ -124,7 +124,7 @@ def unban(bot, trigger):
     banmask = configureHostMask(banmask)
     if banmask == '':
         return
-    bot.write(['MODE', channel, '-b', banmask])
+    bot.coalescer.mode(channel, '-b', banmask)
 
 
 @require_chanmsg
@@ -152,7 +152,7 @@ def quiet(bot, trigger):
     quietmask = configureHostMask(quietmask)
     if quietmask == '':
         return
-    bot.write(['MODE', channel, '+q', quietmask])
+    bot.coalescer.mode(channel, '+q', quietmask)
 
 
 @require_chanmsg
@@ -180,7 +180,7 @@ def unquiet(bot, trigger):
     quietmask = configureHostMask(quietmask)
     if quietmask == '':
         return
-    bot.write(['MODE', channel, '-q', quietmask])
+    bot.coalescer.mode(channel, '-q', quietmask)
 
 
 @require_chanmsg
@@ -215,6 +215,8 @@ def kickban(bot, trigger):
     mask = configureHostMask(mask)
     if mask == '':
         return
+    # Not through the coalescer, which might hold the ban back (behind one
+    # made just before) and send the kick first, letting them rejoin.
     bot.write(['MODE', channel, '+b', mask])
     bot.write(['KICK', channel, nick], reason)
 
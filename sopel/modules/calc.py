@@ -11,7 +11,7 @@ from __future__ import unicode_literals, absolute_import, print_function, divisi
 import re
 from sopel import web
 from sopel.module import commands, example
-from sopel.tools.calculation import eval_equation
+from sopel.tools.calculation import equation_pool
 from socket import timeout
 import sys
 if sys.version_info.major < 3:
@@ -24,6 +24,15 @@ else:
 BASE_TUMBOLIA_URI = 'https://tumbolia-two.appspot.com/'
 
 
+def setup(bot):
+    # Start the worker processes now rather than on the first calculation
+    equation_pool.start()
+
+
+def shutdown(bot):
+    equation_pool.close()
+
+
 @commands('c', 'calc')
 @example('.c 5 + 3', '8')
 @example('.c 0.9*10', '9')
@@ -39,7 +48,7 @@ def c(bot, trigger):
     # Account for the silly non-Anglophones and their silly radix point.
     eqn = trigger.group(2).replace(',', '.')
     try:
-        result = eval_equation(eqn)
+        result = equation_pool(eqn)
         result = "{:.10g}".format(result)
     except ZeroDivisionError:
         result = "Division by zero is not supported in this universe."
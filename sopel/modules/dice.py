@@ -13,7 +13,16 @@ import re
 import operator
 
 import sopel.module
-from sopel.tools.calculation import eval_equation
+from sopel.tools.calculation import equation_pool
+
+
+def setup(bot):
+    # Start the worker processes now rather than on the first roll
+    equation_pool.start()
+
+
+def shutdown(bot):
+    equation_pool.close()
 
 
 class DicePouch:
@@ -164,10 +173,10 @@ class DicePouch:
         if self.addition > 0:
             plus_str+=("+ "+str(self.addition))
         if self.addition < 0:
-            plus_str+=("- "+abs(str(self.addition)))
+            plus_str+=("- "+str(abs(self.addition)))
 
         success_str = "" 
-        if successes =< 0 and 1 in self.dice.keys(): 
+        if successes <= 0 and 1 in self.dice.keys(): 
             success_str+="BOTCH"
         elif successes == 1:
             success_str+=("1 Success")
@@ -274,7 +283,7 @@ def roll(bot, trigger):
     # Showing the actual error will hopefully give a better hint of what is
     # wrong with the syntax than a generic error message.
     try:
-        result = eval_equation(eval_str)
+        result = equation_pool(eval_str)
     except Exception as e:
         bot.reply("SyntaxError, eval(%s), %s" % (eval_str, e))
         return
@@ -314,10 +323,10 @@ if __name__ == "__main__":
 
 @sopel.module.commands("ex")
 @sopel.module.priority("medium")
-@sopel.module.example(".ex 3", 'You roll [3, 6, 7]: 1 Success') #Basic
-@sopel.module.example(".ex 3 d0", 'You roll [3, 6, 10]: 1 Successes') #No Doubles
-@sopel.module.example(".ex 3 d7", 'You roll [3, 6, 7]: 2 Successes') #Double 7s
-@sopel.module.example(".ex 3 t4", 'Target 4: You roll [1, 4, 5]: 2 Successes') #Target number is 4
+@sopel.module.example(".ex 3", r'3: \[\d+: \d(, \d+: \d)*\]  - (BOTCH|\d+ Success(es)?)$', re=True) #Basic
+@sopel.module.example(".ex 3 d0", r'3 d0: \[.*\]  - (BOTCH|\d+ Success(es)?)$', re=True) #No Doubles
+@sopel.module.example(".ex 3 d7", r'3 d7: \[.*\]  - (BOTCH|\d+ Success(es)?)$', re=True) #Double 7s
+@sopel.module.example(".ex 3 t4", r'3 t4: \[.*\]  - (BOTCH|\d+ Success(es)?)$', re=True) #Target number is 4
 
 def exRoll(bot, trigger):
     dice_regexp = r"\d*"
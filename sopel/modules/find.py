@@ -3,6 +3,10 @@
 
 This module will fix spelling errors if someone corrects them
 using the sed notation (s///) commonly found in vi/vim.
+
+It searches the channel's recent history, kept by the bot, which holds the
+last ``history_depth`` lines (see the ``[core]`` section) of everyone in the
+channel together.
 """
 # Copyright 2011, Michael Yanovich, yanovich.net
 # Copyright 2013, Elsie Powell, embolalia.com
@@ -10,45 +14,139 @@ using the sed notation (s///) commonly found in vi/vim.
 # Contributions from: Matt Meinwald and Morgan Goose
 from __future__ import unicode_literals, absolute_import, print_function, division
 
+import collections
 import re
+import threading
+import time
 from sopel.tools import Identifier, SopelMemory
-from sopel.module import rule, priority
-from sopel.formatting import bold
+from sopel.tools.history import HistoryEntry
+from sopel.module import (rule, priority, event, unblockable, commands,
+                          require_admin)
+from sopel.formatting import bold, plain
+
+LINES_PER_NICK = 10
+"""How many of a nick's lines to search for a replacement."""
+NICKS_PER_CHANNEL = 200
+"""How many nicks to remember corrected lines for in each channel.
+
+When a new nick speaks in a channel which is full, the lines of the nick who
+spoke least recently are forgotten."""
+
+
+class ChannelHistory(object):
+    """The recent corrected lines of each nick in a channel.
+
+    What people actually said comes from ``bot.history``; this holds the
+    "meant to say" versions, so that corrections can themselves be corrected.
+
+    Each nick's lines are kept in a ``deque`` of at most ``lines_per_nick``
+    entries, and at most ``max_nicks`` nicks are tracked, least recently
+    active first out.
+    """
+    def __init__(self, lines_per_nick=LINES_PER_NICK,
+                 max_nicks=NICKS_PER_CHANNEL):
+        self.lines_per_nick = lines_per_nick
+        self.max_nicks = max_nicks
+        self._nicks = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def add(self, nick, line):
+        """Remember ``line`` for ``nick``."""
+        with self._lock:
+            lines = self._nicks.pop(nick, None)
+            if lines is None:
+                lines = collections.deque(maxlen=self.lines_per_nick)
+            lines.append(line)
+            self._nicks[nick] = lines
+            while len(self._nicks) > self.max_nicks:
+                self._nicks.popitem(last=False)
+
+    def lines(self, nick):
+        """Return a list of the lines remembered for ``nick``, oldest first."""
+        with self._lock:
+            return list(self._nicks.get(nick, ()))
+
+    def forget(self, nick):
+        """Forget the lines remembered for ``nick``."""
+        with self._lock:
+            self._nicks.pop(nick, None)
+
+    def rename(self, old, new):
+        """Move the lines of ``old`` to ``new``, e.g. after a nick change."""
+        with self._lock:
+            lines = self._nicks.pop(old, None)
+            if lines is not None:
+                self._nicks[new] = lines
+
+    def __contains__(self, nick):
+        return nick in self._nicks
+
+    def __len__(self):
+        return len(self._nicks)
+
+    def stats(self):
+        """Return a dict with the number of ``nicks`` and ``lines`` stored."""
+        with self._lock:
+            return {'nicks': len(self._nicks),
+                    'lines': sum(len(lines) for lines in self._nicks.values())}
 
 
 def setup(bot):
     bot.memory['find_lines'] = SopelMemory()
 
 
+def history_stats(bot):
+    """Return the number of channels, nicks and corrected lines remembered."""
+    stats = {'channels': 0, 'nicks': 0, 'lines': 0}
+    for history in list(bot.memory['find_lines'].values()):
+        channel_stats = history.stats()
+        stats['channels'] += 1
+        stats['nicks'] += channel_stats['nicks']
+        stats['lines'] += channel_stats['lines']
+    return stats
+
+
+@require_admin
+@commands('findstats')
+def find_stats(bot, trigger):
+    """Show how many lines s/// remembers, for admins only."""
+    bot.reply('Remembering %(lines)d lines of %(nicks)d nicks in '
+              '%(channels)d channels' % history_stats(bot))
+
+
 @rule('.*')
+@event('PART')
 @priority('low')
-def collectlines(bot, trigger):
-    """Create a temporary log of what people say"""
-
-    # Don't log things in PM
-    if trigger.is_privmsg:
+@unblockable
+def forget_parted(bot, trigger):
+    """Forget the corrections of users who leave a channel"""
+    if trigger.nick == bot.nick:
+        bot.memory['find_lines'].pop(trigger.sender, None)
         return
+    history = bot.memory['find_lines'].get(trigger.sender)
+    if history is not None:
+        history.forget(trigger.nick)
 
-    # Add a log for the channel and nick, if there isn't already one
-    if trigger.sender not in bot.memory['find_lines']:
-        bot.memory['find_lines'][trigger.sender] = SopelMemory()
-    if Identifier(trigger.nick) not in bot.memory['find_lines'][trigger.sender]:
-        bot.memory['find_lines'][trigger.sender][Identifier(trigger.nick)] = list()
 
-    # Create a temporary list of the user's lines in a channel
-    templist = bot.memory['find_lines'][trigger.sender][Identifier(trigger.nick)]
-    line = trigger.group()
-    if line.startswith("s/"):  # Don't remember substitutions
-        return
-    elif line.startswith("\x01ACTION"):  # For /me messages
-        line = line[:-1]
-        templist.append(line)
-    else:
-        templist.append(line)
+@rule('.*')
+@event('QUIT')
+@priority('low')
+@unblockable
+def forget_quit(bot, trigger):
+    """Forget the corrections of users who quit"""
+    for history in list(bot.memory['find_lines'].values()):
+        history.forget(trigger.nick)
 
-    del templist[:-10]  # Keep the log to 10 lines per person
 
-    bot.memory['find_lines'][trigger.sender][Identifier(trigger.nick)] = templist
+@rule('.*')
+@event('NICK')
+@priority('low')
+@unblockable
+def rename_nick(bot, trigger):
+    """Keep corrections attached to users who change nick"""
+    new = Identifier(trigger)
+    for history in list(bot.memory['find_lines'].values()):
+        history.rename(trigger.nick, new)
 
 
 #Match nick, s/find/replace/flags. Flags and nick are optional, nick can be
@@ -76,12 +174,17 @@ def findandreplace(bot, trigger):
     # Correcting other person vs self.
     rnick = Identifier(trigger.group(1) or trigger.nick)
 
-    search_dict = bot.memory['find_lines']
-    # only do something if there is conversation to work with
-    if trigger.sender not in search_dict:
-        return
-    if Identifier(rnick) not in search_dict[trigger.sender]:
+    # only do something if there is conversation to work with. Substitutions
+    # aren't worth correcting, so skip them.
+    said = [entry for entry in
+            bot.history.recent(trigger.sender, rnick, LINES_PER_NICK + 1)
+            if not entry.text.startswith('s/')]
+    corrections = bot.memory['find_lines'].get(trigger.sender)
+    if corrections is not None:
+        said.extend(corrections.lines(rnick))
+    if not said:
         return
+    said.sort(key=lambda entry: entry.time, reverse=True)
 
     #TODO rest[0] is find, rest[1] is replace. These should be made variables of
     #their own at some point.
@@ -108,12 +211,9 @@ def findandreplace(bot, trigger):
     # Look back through the user's lines in the channel until you find a line
     # where the replacement works
     new_phrase = None
-    for line in reversed(search_dict[trigger.sender][rnick]):
-        if line.startswith("\x01ACTION"):
-            me = True  # /me command
-            line = line[8:]
-        else:
-            me = False
+    for entry in said[:LINES_PER_NICK]:
+        line = plain(entry.text)
+        me = entry.ctcp == 'ACTION'  # /me command
         new_phrase = repl(line)
         if new_phrase != line:  # we are done
             break
@@ -122,11 +222,11 @@ def findandreplace(bot, trigger):
         return  # Didn't find anything
 
     # Save the new "edited" message.
-    action = (me and '\x01ACTION ') or ''  # If /me message, prepend \x01ACTION
-    templist = search_dict[trigger.sender][rnick]
-    templist.append(action + new_phrase)
-    search_dict[trigger.sender][rnick] = templist
-    bot.memory['find_lines'] = search_dict
+    if corrections is None:
+        corrections = ChannelHistory()
+        bot.memory['find_lines'][trigger.sender] = corrections
+    corrections.add(rnick, HistoryEntry(
+        time.time(), rnick, new_phrase, entry.ctcp))
 
     # output
     if not me:
@@ -10,6 +10,8 @@ import pygeoip
 import socket
 import os
 import gzip
+import threading
+import time
 
 urlretrieve = None
 try:
@@ -26,9 +28,15 @@ except ImportError:
 from sopel.config.types import StaticSection, FilenameAttribute
 from sopel.module import commands, example
 from sopel.logger import get_logger
+from sopel.tools.cache import ExpiringLRUCache
 
 LOGGER = get_logger(__name__)
 
+# How often, in seconds, to check whether the database files have changed.
+RELOAD_CHECK_INTERVAL = 60
+# How long, in seconds, a lookup waits for the databases to be downloaded.
+DOWNLOAD_WAIT = 300
+
 
 class GeoipSection(StaticSection):
     GeoIP_db_path = FilenameAttribute('GeoIP_db_path', directory=True)
@@ -47,6 +55,73 @@ def setup(bot=None):
 
     bot.config.define_section('ip', GeoipSection)
 
+    databases = GeoIPDatabases()
+    bot.memory['geoip'] = databases
+    db_path = _find_geoip_db(bot)
+    if db_path:
+        databases.open(db_path)
+    elif urlretrieve:
+        # Fetch the databases without holding up the rest of the bot; .ip
+        # will wait until this is done.
+        databases.downloading = True
+        t = threading.Thread(target=_download_geoip_db,
+                             args=(bot, databases))
+        t.daemon = True
+        t.start()
+
+
+class GeoIPDatabases(object):
+    """The GeoIP city and ASN readers, opened once and shared by lookups.
+
+    The database files are memory-mapped, and reopened if they change on disk.
+    Recent lookup responses are kept in a small LRU cache, which is emptied
+    whenever the databases are reopened.
+    """
+    def __init__(self):
+        self.path = None
+        self.city = None
+        self.org = None
+        self.downloading = False
+        self.downloaded = threading.Event()
+        self.lookups = ExpiringLRUCache(256, ttl=60 * 60)
+        self._mtimes = None
+        self._last_check = 0
+        self._lock = threading.Lock()
+
+    def _files(self):
+        return (os.path.join(self.path, 'GeoLiteCity.dat'),
+                os.path.join(self.path, 'GeoIPASNum.dat'))
+
+    def open(self, path):
+        """Open the databases in the directory ``path``."""
+        with self._lock:
+            self.path = path
+            city_file, org_file = self._files()
+            self._mtimes = (os.path.getmtime(city_file),
+                            os.path.getmtime(org_file))
+            self.city = pygeoip.GeoIP(city_file, pygeoip.MMAP_CACHE)
+            self.org = pygeoip.GeoIP(org_file, pygeoip.MMAP_CACHE)
+            self._last_check = time.time()
+            self.lookups.clear()
+
+    def reload_if_changed(self):
+        """Reopen the databases if their files changed since they were opened.
+
+        The files are only checked once every ``RELOAD_CHECK_INTERVAL``
+        seconds.
+        """
+        now = time.time()
+        if self.path is None or now - self._last_check < RELOAD_CHECK_INTERVAL:
+            return
+        self._last_check = now
+        try:
+            mtimes = tuple(os.path.getmtime(f) for f in self._files())
+        except OSError:
+            return  # Probably mid-update; keep using what we have
+        if mtimes != self._mtimes:
+            LOGGER.info('GeoIP database changed on disk, reloading')
+            self.open(self.path)
+
 
 def _decompress(source, target, delete_after_decompression=True):
     """ Decompress a GZip file """
@@ -77,9 +152,14 @@ def _find_geoip_db(bot):
     elif (os.path.isfile(os.path.join('/usr/share/GeoIP', 'GeoLiteCity.dat')) and
             os.path.isfile(os.path.join('/usr/share/GeoIP', 'GeoIPASNum.dat'))):
         return '/usr/share/GeoIP'
-    elif urlretrieve:
+    else:
+        return False
+
+
+def _download_geoip_db(bot, databases):
+    """Download the GeoIP databases into the home directory and open them."""
+    try:
         LOGGER.warning('Downloading GeoIP database')
-        bot.say('Downloading GeoIP database, please wait...')
         geolite_city_url = 'http://geolite.maxmind.com/download/geoip/database/GeoLiteCity.dat.gz'
         geolite_ASN_url = 'http://download.maxmind.com/download/geoip/database/asnum/GeoIPASNum.dat.gz'
         geolite_city_filepath = os.path.join(bot.config.core.homedir, 'GeoLiteCity.dat.gz')
@@ -88,9 +168,12 @@ def _find_geoip_db(bot):
         urlretrieve(geolite_ASN_url, geolite_ASN_filepath)
         _decompress(geolite_city_filepath, geolite_city_filepath[:-3])
         _decompress(geolite_ASN_filepath, geolite_ASN_filepath[:-3])
-        return bot.config.core.homedir
-    else:
-        return False
+        databases.open(bot.config.core.homedir)
+    except Exception:
+        LOGGER.error('Could not download GeoIP database', exc_info=True)
+    finally:
+        databases.downloading = False
+        databases.downloaded.set()
 
 
 @commands('iplookup', 'ip')
@@ -103,23 +186,36 @@ def ip(bot, trigger):
     if not trigger.group(2):
         return bot.reply("No search term.")
     query = trigger.group(2)
-    db_path = _find_geoip_db(bot)
-    if db_path is False:
+    databases = bot.memory['geoip']
+    if databases.downloading:
+        bot.say('Downloading GeoIP database, please wait...')
+        databases.downloaded.wait(DOWNLOAD_WAIT)
+    if databases.path is None:
         LOGGER.error('Can\'t find (or download) usable GeoIP database')
         bot.say('Sorry, I don\'t have a GeoIP database to use for this lookup')
         return False
-    geolite_city_filepath = os.path.join(_find_geoip_db(bot), 'GeoLiteCity.dat')
-    geolite_ASN_filepath = os.path.join(_find_geoip_db(bot), 'GeoIPASNum.dat')
-    gi_city = pygeoip.GeoIP(geolite_city_filepath)
-    gi_org = pygeoip.GeoIP(geolite_ASN_filepath)
+    databases.reload_if_changed()
+
+    response = databases.lookups.get(query)
+    if response is None:
+        try:
+            response = _lookup(databases, query)
+        except socket.gaierror:
+            return bot.say('[IP/Host Lookup] Unable to resolve IP/Hostname')
+        databases.lookups.set(query, response)
+    bot.say(response)
+
+
+def _lookup(databases, query):
+    """Build the response for ``query`` from the open databases."""
+    gi_city = databases.city
+    gi_org = databases.org
     host = socket.getfqdn(query)
     response = "[IP/Host Lookup] Hostname: %s" % host
     try:
         response += " | Location: %s" % gi_city.country_name_by_name(query)
     except AttributeError:
         response += ' | Location: Unknown'
-    except socket.gaierror:
-        return bot.say('[IP/Host Lookup] Unable to resolve IP/Hostname')
 
     region_data = gi_city.region_by_name(query)
     try:
@@ -131,7 +227,7 @@ def ip(bot, trigger):
 
     isp = gi_org.org_by_name(query)
     response += " | ISP: %s" % isp
-    bot.say(response)
+    return response
 
 
 if __name__ == "__main__":
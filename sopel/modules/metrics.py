@@ -0,0 +1,226 @@
+# coding=utf-8
+"""
+metrics.py - Sopel Callable Metrics Module
+Licensed under the Eiffel Forum License 2.
+
+https://sopel.chat
+
+Reports how often, how slowly and how unsuccessfully each module callable and
+job has run, from the statistics the bot keeps in ``bot.metrics``.
+"""
+from __future__ import unicode_literals, absolute_import, print_function, division
+
+import json
+import os
+import threading
+
+try:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+except ImportError:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+
+from sopel.config.types import (
+    StaticSection, FilenameAttribute, ValidatedAttribute
+)
+from sopel.logger import get_logger
+from sopel.tools.metrics import format_histogram
+import sopel.module
+
+LOGGER = get_logger(__name__)
+
+server = None
+
+
+class MetricsSection(StaticSection):
+    export_file = FilenameAttribute('export_file')
+    """A file to which all metrics are written as JSON every minute."""
+    listen_port = ValidatedAttribute('listen_port', int)
+    """A port on which to serve metrics over HTTP for Prometheus to scrape.
+
+    Nothing is served if this isn't set."""
+    listen_host = ValidatedAttribute('listen_host', default='127.0.0.1')
+    """The address on which to serve metrics."""
+
+
+def configure(config):
+    config.define_section('metrics', MetricsSection)
+    config.metrics.configure_setting(
+        'export_file',
+        'File to write callable metrics to (leave blank for none)'
+    )
+
+
+def setup(bot):
+    global server
+    bot.config.define_section('metrics', MetricsSection)
+    if bot.config.metrics.listen_port:
+        address = (bot.config.metrics.listen_host,
+                   bot.config.metrics.listen_port)
+        server = HTTPServer(address, MetricsHandler)
+        server.bot = bot
+        thread = threading.Thread(target=server.serve_forever,
+                                  name='MetricsServer')
+        thread.daemon = True
+        thread.start()
+        LOGGER.info('Serving metrics on http://%s:%d/metrics', *address)
+
+
+def shutdown(bot):
+    global server
+    if server is not None:
+        server.shutdown()
+        server.server_close()
+        server = None
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?')[0] not in ('/', '/metrics'):
+            self.send_error(404)
+            return
+        body = render_prometheus(self.server.bot).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        LOGGER.debug('Metrics request from %s: %s',
+                     self.client_address[0], format % args)
+
+
+def render_prometheus(bot):
+    """Return the bot's metrics in the Prometheus text format.
+
+    The counters are read as they are, without locking. Only the per-callable
+    stats are copied under their lock (by ``top()``), which holds it briefly.
+    """
+    metrics = bot.metrics
+    lines = []
+
+    def add(name, kind, help_text, values):
+        # values is either a number, or a list of already formatted lines
+        lines.append('# HELP %s %s' % (name, help_text))
+        lines.append('# TYPE %s %s' % (name, kind))
+        if isinstance(values, list):
+            lines.extend(values)
+        else:
+            lines.append('%s %s' % (name, values))
+
+    add('sopel_lines_received_total', 'counter',
+        'Lines received from the IRC server.', metrics.lines_received)
+    add('sopel_lines_sent_total', 'counter',
+        'Lines sent to the IRC server.', metrics.lines_sent)
+    add('sopel_send_queue_depth', 'gauge',
+        'Messages waiting for their turn to be sent.',
+        len(metrics.send_waiting))
+    add('sopel_dispatch_duration_seconds', 'histogram',
+        'Time taken to hand a received line to the callables.',
+        format_histogram('sopel_dispatch_duration_seconds',
+                         metrics.dispatch_durations))
+    add('sopel_threads', 'gauge', 'Threads in the bot process.',
+        threading.active_count())
+    add('sopel_db_query_duration_seconds', 'histogram',
+        'Time taken by database queries.',
+        format_histogram('sopel_db_query_duration_seconds',
+                         bot.db.query_durations))
+    add('sopel_scheduler_lag_seconds', 'histogram',
+        'How late jobs started, compared to when they were due.',
+        format_histogram('sopel_scheduler_lag_seconds', bot.scheduler.lag))
+    add('sopel_channels', 'gauge', 'Channels the bot is in.',
+        len(bot.channels))
+    add('sopel_users', 'gauge', 'Users the bot shares a channel with.',
+        len(bot.users))
+
+    stats = metrics.top(limit=None)
+    histograms = []
+    calls = []
+    errors = []
+    rejected = []
+    for stat in stats:
+        label = '{callable="%s"}' % stat.name
+        histograms.extend(format_histogram(
+            'sopel_callable_duration_seconds', stat.durations,
+            {'callable': stat.name}))
+        calls.append('sopel_callable_calls_total%s %d' % (label, stat.calls))
+        errors.append('sopel_callable_errors_total%s %d' %
+                      (label, stat.errors))
+        for limit, count in sorted(stat.rejected.items()):
+            rejected.append(
+                'sopel_callable_rejected_total{callable="%s",limit="%s"} %d'
+                % (stat.name, limit, count))
+    add('sopel_callable_duration_seconds', 'histogram',
+        'Time taken by each callable or job.', histograms)
+    add('sopel_callable_calls_total', 'counter',
+        'Calls of each callable or job.', calls)
+    add('sopel_callable_errors_total', 'counter',
+        'Calls of each callable or job which raised an exception.', errors)
+    add('sopel_callable_rejected_total', 'counter',
+        'Calls of each callable refused by a rate limit.', rejected)
+
+    return '\n'.join(lines) + '\n'
+
+
+def describe(stats):
+    durations = stats.durations
+    parts = ['%d calls' % stats.calls,
+             '%.2fs total' % durations.sum]
+    if stats.calls:
+        parts.append('p95 <= %gs' % durations.quantile(0.95))
+        parts.append('max %.3fs' % durations.max)
+    if stats.errors:
+        parts.append('%d errors' % stats.errors)
+    rejected = sum(stats.rejected.values())
+    if rejected:
+        parts.append('%d rate-limited' % rejected)
+    return '%s: %s' % (stats.name, ', '.join(parts))
+
+
+@sopel.module.require_admin
+@sopel.module.commands('metrics')
+@sopel.module.example('.metrics calls')
+def metrics(bot, trigger):
+    """Show the busiest callables. Sort by total (default), max, calls or
+    errors; or give a module or callable name to show it; or reset."""
+    arg = (trigger.group(3) or 'total').lower()
+    if arg == 'reset':
+        bot.metrics.reset()
+        return bot.reply('Metrics reset.')
+    if arg in ('total', 'max', 'calls', 'errors'):
+        top = bot.metrics.top(arg)
+        if not top:
+            return bot.reply('Nothing has run yet.')
+        for stats in top:
+            bot.say(describe(stats))
+        return
+
+    name = trigger.group(3)
+    stats = bot.metrics.get(name)
+    if stats is not None:
+        bot.say(describe(stats))
+        if stats.last_profile:
+            # The first line of a pstats report says how long the run took.
+            summary = stats.last_profile.strip().splitlines()[0].strip()
+            bot.say('Last profiled call: %s' % summary)
+        return
+
+    found = [s for s in bot.metrics.top(limit=None)
+             if s.name.startswith(name + '.')]
+    if not found:
+        return bot.reply('No metrics for %s.' % name)
+    for stats in found[:5]:
+        bot.say(describe(stats))
+
+
+@sopel.module.interval(60)
+def export_metrics(bot):
+    filename = bot.config.metrics.export_file
+    if not filename:
+        return
+    try:
+        with open(filename + '.tmp', 'w') as f:
+            json.dump(bot.metrics.snapshot(), f)
+        os.rename(filename + '.tmp', filename)
+    except (IOError, OSError) as e:
+        LOGGER.error('Could not write metrics to %s: %s', filename, e)
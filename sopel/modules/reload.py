@@ -8,71 +8,217 @@ http://sopel.chat
 """
 from __future__ import unicode_literals, absolute_import, print_function, division
 
-import collections
-import sys
+import imp
+import os.path
+import threading
 import time
-from sopel.tools import iteritems
+try:
+    import pyinotify
+except ImportError:
+    pyinotify = None
+from sopel import tools
+from sopel.config.types import StaticSection, ValidatedAttribute
+from sopel.logger import get_logger
 import sopel.loader
 import sopel.module
 import subprocess
 
+LOGGER = get_logger(__name__)
+
+watcher = None
+
+
+class ReloadSection(StaticSection):
+    auto_reload = ValidatedAttribute('auto_reload', bool, default=False)
+    """Whether to reload modules automatically when their source changes."""
+    poll_interval = ValidatedAttribute('poll_interval', float, default=1.0)
+    """How often to look for changes, in seconds, if pyinotify is missing."""
+    debounce = ValidatedAttribute('debounce', float, default=0.5)
+    """How long a module must go unchanged before it is reloaded, in
+    seconds, so that a save in several steps causes only one reload."""
+
+
+def configure(config):
+    config.define_section('reload', ReloadSection)
+    config.reload.configure_setting(
+        'auto_reload',
+        'Reload modules automatically when their files change?'
+    )
+
+
+def setup(bot):
+    global watcher
+    bot.config.define_section('reload', ReloadSection)
+    if bot.config.reload.auto_reload:
+        watcher = ModuleWatcher(bot, bot.config.reload.poll_interval,
+                                bot.config.reload.debounce)
+        watcher.start()
+
+
+def shutdown(bot):
+    global watcher
+    if watcher is not None:
+        watcher.stop()
+        watcher = None
+
+
+class ModuleWatcher(threading.Thread):
+    """Reloads loaded modules when their source files change.
+
+    Changes are noticed through inotify if pyinotify is installed, and by
+    checking the modules' mtimes every ``poll_interval`` seconds otherwise.
+    Only the changed module is reloaded, through
+    :meth:`sopel.bot.Sopel.reload_module`, once it has gone ``debounce``
+    seconds without changing again.
+    """
+    def __init__(self, bot, poll_interval=1.0, debounce=0.5):
+        threading.Thread.__init__(self, name='ModuleWatcher')
+        self.daemon = True
+        self.bot = bot
+        self.poll_interval = poll_interval
+        self.debounce = debounce
+        self._stopping = threading.Event()
+        self._pending = {}  # name -> [first change, last change]
+        self._mtimes = {}  # name -> last seen mtime, when polling
+
+    def stop(self):
+        self._stopping.set()
+
+    def run(self):
+        LOGGER.info('Watching modules for changes, using %s',
+                    'inotify' if pyinotify else 'polling')
+        if pyinotify is not None:
+            self._run_inotify()
+        else:
+            self._run_polling()
+
+    def _run_polling(self):
+        while not self._stopping.wait(min(self.poll_interval, self.debounce)):
+            now = time.time()
+            paths = self._module_paths()
+            for name, loaded in list(self.bot._loaded_modules.items()):
+                if name not in paths:
+                    continue
+                try:
+                    mtime = sopel.loader.get_module_mtime(*paths[name])
+                except OSError:
+                    continue
+                if mtime != self._mtimes.get(name, loaded.mtime):
+                    self._mtimes[name] = mtime
+                    self._changed(name, now)
+            self._reload_settled()
+
+    def _run_inotify(self):
+        manager = pyinotify.WatchManager()
+        notifier = pyinotify.Notifier(manager, self._on_event,
+                                      timeout=int(self.debounce * 1000))
+        directories = set(os.path.dirname(path)
+                          for path, _ in self._module_paths().values())
+        mask = (pyinotify.IN_CLOSE_WRITE | pyinotify.IN_MOVED_TO |
+                pyinotify.IN_DELETE)
+        manager.add_watch(list(directories), mask, rec=True)
+        try:
+            while not self._stopping.is_set():
+                if notifier.check_events():
+                    notifier.read_events()
+                    notifier.process_events()
+                self._reload_settled()
+        finally:
+            notifier.stop()
+
+    def _on_event(self, event):
+        if not event.pathname.endswith('.py'):
+            return
+        for name, (path, type_) in self._module_paths().items():
+            if (event.pathname == path or
+                    (type_ == imp.PKG_DIRECTORY and
+                     event.pathname.startswith(path + os.sep))):
+                if name in self.bot._loaded_modules:
+                    self._changed(name, time.time())
+
+    def _module_paths(self):
+        # Cheap, since the loader caches directory listings.
+        return sopel.loader.enumerate_modules(self.bot.config)
+
+    def _changed(self, name, when):
+        if name in self._pending:
+            self._pending[name][1] = when
+        else:
+            self._pending[name] = [when, when]
+
+    def _reload_settled(self):
+        now = time.time()
+        for name, (first, last) in list(self._pending.items()):
+            if now - last < self.debounce:
+                continue
+            del self._pending[name]
+            start = time.time()
+            try:
+                module = self.bot.reload_module(name)
+            except Exception as e:
+                LOGGER.error('Automatic reload of %s failed: %s', name, e)
+                continue
+            if module is not None:
+                done = time.time()
+                LOGGER.info('Reloaded %s in %.3fs, %.2fs after it changed',
+                            name, done - start, done - first)
+
 
 @sopel.module.nickname_commands("reload")
 @sopel.module.priority("low")
 @sopel.module.thread(False)
 def f_reload(bot, trigger):
-    """Reloads a module, for use by admins only."""
+    """Reloads a module (or all changed modules), for use by admins only.
+
+    Only modules whose source has changed are reloaded; add "force" after the
+    module name to reload it anyway."""
     if not trigger.admin:
         return
 
-    name = trigger.group(2)
-
-    if not name or name == '*' or name.upper() == 'ALL THE THINGS':
-        bot._callables = {
-            'high': collections.defaultdict(list),
-            'medium': collections.defaultdict(list),
-            'low': collections.defaultdict(list)
-        }
-        bot._command_groups = collections.defaultdict(list)
-        bot.setup()
-        return bot.reply('done')
-
-    if name not in sys.modules:
-        return bot.reply('%s: not loaded, try the `load` command' % name)
-
-    old_module = sys.modules[name]
-
-    old_callables = {}
-    for obj_name, obj in iteritems(vars(old_module)):
-        bot.unregister(obj)
-
-    # Also remove all references to sopel callables from top level of the
-    # module, so that they will not get loaded again if reloading the
-    # module does not override them.
-    for obj_name in old_callables.keys():
-        delattr(old_module, obj_name)
+    name = trigger.group(3)
+    force = (trigger.group(4) or '').lower() == 'force'
 
-    # Also delete the setup function
-    if hasattr(old_module, "setup"):
-        delattr(old_module, "setup")
+    if not name or name == '*' or trigger.group(2).upper() == 'ALL THE THINGS':
+        return reload_all(bot)
 
-    modules = sopel.loader.enumerate_modules(bot.config)
-    path, type_ = modules[name]
-    load_module(bot, name, path, type_)
-
-
-def load_module(bot, name, path, type_):
-    module, mtime = sopel.loader.load_module(name, path, type_)
-    relevant_parts = sopel.loader.clean_module(module, bot.config)
-
-    bot.register(*relevant_parts)
-
-    # TODO sys.modules[name] = module
-    if hasattr(module, 'setup'):
-        module.setup(bot)
+    if name not in bot._loaded_modules and name not in bot._deferred_modules:
+        return bot.reply('%s: not loaded, try the `load` command' % name)
 
+    try:
+        module = bot.reload_module(name, force)
+    except Exception as e:
+        filename, lineno = tools.get_raising_file_and_line()
+        return bot.reply('Error reloading %s: %s (%s:%d); the old version '
+                         'is still loaded' % (name, e, filename, lineno))
+    if module is None:
+        return bot.reply('%s is unchanged' % name)
+    reply_loaded(bot, module)
+
+
+def reload_all(bot):
+    reloaded = []
+    failed = []
+    unchanged = 0
+    for name in sorted(bot._loaded_modules):
+        try:
+            module = bot.reload_module(name)
+        except Exception as e:
+            failed.append('%s (%s)' % (name, e))
+            continue
+        if module is None:
+            unchanged += 1
+        else:
+            reloaded.append(name)
+    reply = 'Reloaded %s; %d unchanged' % (', '.join(reloaded) or 'nothing',
+                                           unchanged)
+    if failed:
+        reply += '; failed: ' + ', '.join(failed)
+    bot.reply(reply)
+
+
+def reply_loaded(bot, module):
+    mtime = bot._loaded_modules[module.__name__].mtime
     modified = time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(mtime))
-
     bot.reply('%r (version: %s)' % (module, modified))
 
 
@@ -103,14 +249,18 @@ def f_load(bot, trigger):
     if not name:
         return bot.reply('Load what?')
 
-    if name in sys.modules:
+    if name in bot._deferred_modules:
+        module = bot._load_deferred(name)
+        return bot.reply('%r (loaded on demand)' % module)
+
+    if name in bot._loaded_modules:
         return bot.reply('Module already loaded, use reload')
 
     mods = sopel.loader.enumerate_modules(bot.config)
     if name not in mods:
         return bot.reply('Module %s not found' % name)
     path, type_ = mods[name]
-    load_module(bot, name, path, type_)
+    reply_loaded(bot, bot.load_module(name, path, type_))
 
 
 # Catch PM based messages
@@ -14,8 +14,13 @@ from sopel.formatting import color, bold
 from sopel.logger import get_logger
 from sopel.module import OP
 import sopel.tools
+from sopel.tools import normalize_url
+from sopel.tools.cache import ExpiringLRUCache
+from sopel.tools.ratelimit import TokenBucket
 import sys
 import json
+import marshal
+import threading
 import time
 import os.path
 import re
@@ -31,8 +36,19 @@ else:
 LOGGER = get_logger(__name__)
 
 vt_base_api_url = 'https://www.virustotal.com/vtapi/v2/url/'
-malware_domains = set()
+malware_domains = None  # DomainIndex, created in setup
 known_good = []
+url_finder = re.compile(r'(?u)(https?://\S+)', re.IGNORECASE)
+vt_limiter = None
+# Maps URLs currently being looked up on VirusTotal to an Event which is set
+# when the lookup finishes.
+_pending_lookups = {}
+_pending_lock = threading.Lock()
+# Held while the malwaredomains list is refreshed, so the startup thread and
+# the daily job don't download it at the same time.
+_refresh_lock = threading.Lock()
+# Python 2 has no os.replace; its os.rename replaces the file on POSIX.
+_replace = getattr(os, 'replace', os.rename)
 
 
 class SafetySection(StaticSection):
@@ -42,6 +58,17 @@ class SafetySection(StaticSection):
     """List of "known good" domains to ignore."""
     vt_api_key = ValidatedAttribute('vt_api_key')
     """Optional VirusTotal API key."""
+    vt_requests_per_minute = ValidatedAttribute('vt_requests_per_minute', int,
+                                                default=4)
+    """How many VirusTotal lookups the API key allows per minute."""
+    vt_max_wait = ValidatedAttribute('vt_max_wait', int, default=30)
+    """How long to wait for the VirusTotal quota before skipping a lookup."""
+    cache_size = ValidatedAttribute('cache_size', int, default=1024)
+    """How many VirusTotal results to keep in memory."""
+    cache_ttl = ValidatedAttribute('cache_ttl', int, default=24 * 60 * 60)
+    """How long, in seconds, a VirusTotal result is reused."""
+    cache_persist = ValidatedAttribute('cache_persist', bool, default=False)
+    """Whether to keep VirusTotal results in the bot's database."""
 
 
 def configure(config):
@@ -64,27 +91,123 @@ def configure(config):
 def setup(bot):
     bot.config.define_section('safety', SafetySection)
 
-    bot.memory['safety_cache'] = sopel.tools.SopelMemory()
+    global vt_limiter, malware_domains
+    bot.memory['safety_cache'] = ExpiringLRUCache(
+        max(bot.config.safety.cache_size, 1), bot.config.safety.cache_ttl)
+    vt_limiter = TokenBucket(max(bot.config.safety.vt_requests_per_minute, 1))
+    if bot.config.safety.cache_persist:
+        bot.db.execute(
+            'CREATE TABLE IF NOT EXISTS safety_cache '
+            '(url STRING PRIMARY KEY, positives INTEGER, total INTEGER, '
+            'age REAL)'
+        )
+
     for item in bot.config.safety.known_good:
         known_good.append(re.compile(item, re.I))
 
+    malware_domains = DomainIndex()
+    # Downloading and indexing the list can take a while, so don't hold up
+    # the bot's startup for it. Until it's loaded, only VirusTotal is used.
+    t = threading.Thread(target=_refresh_malwaredomains, args=(bot,))
+    t.daemon = True
+    t.start()
+
+
+class DomainIndex(object):
+    """A set of domains which also matches any of their subdomains.
+
+    ``'evil.example.com' in index`` is true if ``evil.example.com``,
+    ``example.com`` or ``com`` was listed; each lookup costs one hash lookup
+    per label.
+    """
+    def __init__(self, domains=()):
+        self._domains = frozenset(domains)
+        self.loaded = False
+        """Whether a domain list has been loaded yet."""
+
+    def __len__(self):
+        return len(self._domains)
+
+    def __contains__(self, host):
+        domains = self._domains
+        host = host.lower().rstrip('.')
+        while host:
+            if host in domains:
+                return True
+            dot = host.find('.')
+            if dot == -1:
+                return False
+            host = host[dot + 1:]
+        return False
+
+    def load(self, path):
+        """Load the newline-separated domain list at ``path``.
+
+        The parsed list is cached next to it in ``path + '.idx'``, which is
+        used instead of re-parsing the text file as long as it's newer.
+        """
+        index_path = path + '.idx'
+        domains = None
+        if (os.path.isfile(index_path) and
+                os.path.getmtime(index_path) >= os.path.getmtime(path)):
+            try:
+                with open(index_path, 'rb') as f:
+                    domains = marshal.load(f)
+            except (EOFError, ValueError, TypeError):
+                LOGGER.info('Malware domain index is unreadable, rebuilding.')
+        if domains is None:
+            domains = set()
+            with open(path, 'r') as f:
+                for line in f:
+                    clean_line = unicode(line).strip().lower()
+                    if clean_line != '' and not clean_line.startswith('#'):
+                        domains.add(clean_line)
+            domains = sorted(domains)
+            try:
+                with open(index_path, 'wb') as f:
+                    marshal.dump(domains, f)
+            except (IOError, OSError):
+                LOGGER.warning('Could not write malware domain index to %s',
+                               index_path)
+        # Swapping in a new frozenset is atomic, so lookups never see a
+        # half-built index.
+        self._domains = frozenset(domains)
+        self.loaded = True
+
+
+def _refresh_malwaredomains(bot):
+    """Update the malwaredomains list if it's stale, then (re)load it."""
+    with _refresh_lock:
+        _refresh_malwaredomains_locked(bot)
+
+
+def _refresh_malwaredomains_locked(bot):
     loc = os.path.join(bot.config.homedir, 'malwaredomains.txt')
-    if os.path.isfile(loc):
-        if os.path.getmtime(loc) < time.time() - 24 * 60 * 60 * 7:
-            # File exists but older than one week, update
+    try:
+        if (not os.path.isfile(loc) or
+                os.path.getmtime(loc) < time.time() - 24 * 60 * 60 * 7):
+            # Missing, or older than one week, update
             _download_malwaredomains_db(loc)
-    else:
-        _download_malwaredomains_db(loc)
-    with open(loc, 'r') as f:
-        for line in f:
-            clean_line = unicode(line).strip().lower()
-            if clean_line != '':
-                malware_domains.add(clean_line)
+    except Exception:
+        LOGGER.warning('Could not download malwaredomains db.', exc_info=True)
+    if not os.path.isfile(loc):
+        return
+    if malware_domains.loaded and os.path.isfile(loc + '.idx') and (
+            os.path.getmtime(loc + '.idx') >= os.path.getmtime(loc)):
+        return  # Nothing changed since we last loaded it
+    try:
+        malware_domains.load(loc)
+    except Exception:
+        LOGGER.warning('Could not load malwaredomains db.', exc_info=True)
 
 
 def _download_malwaredomains_db(path):
     print('Downloading malwaredomains db...')
-    urlretrieve('http://mirror1.malwaredomains.com/files/justdomains', path)
+    # Download next to the real file and move it into place, so a failed
+    # download doesn't leave us with a truncated list.
+    tmp_path = path + '.tmp'
+    urlretrieve('http://mirror1.malwaredomains.com/files/justdomains', tmp_path)
+    _replace(tmp_path, path)
 
 
 @sopel.module.rule('(?u).*(https?://\S+).*')
@@ -93,8 +216,6 @@ def url_handler(bot, trigger):
     """ Check for malicious URLs """
     check = True    # Enable URL checking
     strict = False  # Strict mode: kick on malicious URL
-    positives = 0   # Number of engines saying it's malicious
-    total = 0       # Number of total engines
     use_vt = True   # Use VirusTotal
     check = bot.config.safety.enabled_by_default
     if check is None:
@@ -115,53 +236,123 @@ def url_handler(bot, trigger):
     if not check:
         return  # Not overriden by DB, configured default off
 
-    netloc = urlparse(trigger.group(1)).netloc
-    if any(regex.search(netloc) for regex in known_good):
-        return  # Whitelisted
+    urls = []
+    for url in url_finder.findall(trigger):
+        netloc = urlparse(url).netloc
+        if any(regex.search(netloc) for regex in known_good):
+            continue  # Whitelisted
+        if url not in urls:
+            urls.append(url)
 
+    results = {}
     apikey = bot.config.safety.vt_api_key
+    if apikey is not None and use_vt and urls:
+        # Look up every URL in the line at once; the rate limiter keeps us
+        # within the API quota.
+        threads = []
+        for url in urls:
+            t = threading.Thread(target=_check_url_vt,
+                                 args=(bot, url, apikey, results))
+            t.start()
+            threads.append(t)
+        for t in threads:
+            t.join()
+
+    for url in urls:
+        result = results.get(url) or {'positives': 0, 'total': 0}
+        positives = result['positives']
+        total = result['total']
+
+        hostname = urlparse(url).hostname or ''
+        if unicode(hostname) in malware_domains:
+            # malwaredomains is more trustworthy than some VT engines
+            # therefor it gets a weight of 10 engines when calculating
+            # confidence
+            positives += 10
+            total += 10
+
+        if positives > 1:
+            # Possibly malicious URL detected!
+            confidence = '{}%'.format(round((positives / total) * 100))
+            msg = 'link posted by %s is possibly malicious ' % bold(trigger.nick)
+            msg += '(confidence %s - %s/%s)' % (confidence, positives, total)
+            bot.say('[' + bold(color('WARNING', 'red')) + '] ' + msg)
+            if strict:
+                bot.write(['KICK', trigger.sender, trigger.nick,
+                           'Posted a malicious link'])
+                return
+
+
+def _check_url_vt(bot, url, apikey, results):
+    """Store the VirusTotal verdict for ``url`` in ``results``.
+
+    Results come from the cache where possible. If the same URL is already
+    being looked up by another thread, wait for that lookup instead of
+    spending quota on a duplicate request.
+    """
+    key = normalize_url(url)
+    cache = bot.memory['safety_cache']
     try:
-        if apikey is not None and use_vt:
-            payload = {'resource': unicode(trigger),
+        result = cache.get(key)
+        if result is None and bot.config.safety.cache_persist:
+            result = _load_cached(bot, key)
+        if result is not None:
+            results[url] = result
+            return
+
+        with _pending_lock:
+            event = _pending_lookups.get(key)
+            owner = event is None
+            if owner:
+                event = threading.Event()
+                _pending_lookups[key] = event
+        if not owner:
+            event.wait(bot.config.safety.vt_max_wait)
+            results[url] = cache.get(key)
+            return
+
+        try:
+            if not vt_limiter.acquire(bot.config.safety.vt_max_wait):
+                LOGGER.debug('VirusTotal quota exhausted, skipping %s', url)
+                return
+            payload = {'resource': unicode(url),
                        'apikey': apikey,
                        'scan': '1'}
-
-            if trigger not in bot.memory['safety_cache']:
-                result = web.post(vt_base_api_url + 'report', payload)
-                if sys.version_info.major > 2:
-                    result = result.decode('utf-8')
-                result = json.loads(result)
-                age = time.time()
-                data = {'positives': result['positives'],
-                        'total': result['total'],
-                        'age': age}
-                bot.memory['safety_cache'][trigger] = data
-                if len(bot.memory['safety_cache']) > 1024:
-                    _clean_cache(bot)
-            else:
-                print('using cache')
-                result = bot.memory['safety_cache'][trigger]
-            positives = result['positives']
-            total = result['total']
+            result = web.post(vt_base_api_url + 'report', payload)
+            if sys.version_info.major > 2:
+                result = result.decode('utf-8')
+            result = json.loads(result)
+            data = {'positives': result['positives'],
+                    'total': result['total'],
+                    'age': time.time()}
+            cache.set(key, data)
+            if bot.config.safety.cache_persist:
+                bot.db.execute(
+                    'INSERT OR REPLACE INTO safety_cache VALUES (?, ?, ?, ?)',
+                    [key, data['positives'], data['total'], data['age']])
+            results[url] = data
+        finally:
+            with _pending_lock:
+                _pending_lookups.pop(key, None)
+            event.set()
     except Exception:
         LOGGER.debug('Error from checking URL with VT.', exc_info=True)
-        pass  # Ignoring exceptions with VT so MalwareDomains will always work
+        # Ignoring exceptions with VT so MalwareDomains will always work
 
-    if unicode(netloc).lower() in malware_domains:
-        # malwaredomains is more trustworthy than some VT engines
-        # therefor it gets a weight of 10 engines when calculating confidence
-        positives += 10
-        total += 10
 
-    if positives > 1:
-        # Possibly malicious URL detected!
-        confidence = '{}%'.format(round((positives / total) * 100))
-        msg = 'link posted by %s is possibly malicious ' % bold(trigger.nick)
-        msg += '(confidence %s - %s/%s)' % (confidence, positives, total)
-        bot.say('[' + bold(color('WARNING', 'red')) + '] ' + msg)
-        if strict:
-            bot.write(['KICK', trigger.sender, trigger.nick,
-                       'Posted a malicious link'])
+def _load_cached(bot, key):
+    """Load a still-valid VirusTotal result for ``key`` from the database."""
+    ttl = bot.config.safety.cache_ttl
+    row = bot.db.execute(
+        'SELECT positives, total, age FROM safety_cache '
+        'WHERE url = ? AND age > ?',
+        [key, time.time() - ttl]
+    ).fetchone()
+    if row is None:
+        return None
+    data = {'positives': row[0], 'total': row[1], 'age': row[2]}
+    bot.memory['safety_cache'].set(key, data, data['age'] + ttl - time.time())
+    return data
 
 
 @sopel.module.commands('safety')
@@ -181,17 +372,18 @@ def toggle_safety(bot, trigger):
     bot.reply('Safety is now set to "%s" on this channel' % trigger.group(2))
 
 
-# Clean the cache every day, also when > 1024 entries
+# Check for an updated malwaredomains list every day; this runs in its own
+# thread, so the download never blocks the bot.
+@sopel.module.interval(24 * 60 * 60)
+def _update_malwaredomains(bot):
+    _refresh_malwaredomains(bot)
+
+
+# Clean the cache every day
 @sopel.module.interval(24 * 60 * 60)
 def _clean_cache(bot):
-    """ Cleanup old entries in URL cache """
-    # TODO probably should be using locks here, to make sure stuff doesn't
-    # explode
-    oldest_key_age = 0
-    oldest_key = ''
-    for key, data in sopel.tools.iteritems(bot.memory['safety_cache']):
-        if data['age'] > oldest_key_age:
-            oldest_key_age = data['age']
-            oldest_key = key
-    if oldest_key in bot.memory['safety_cache']:
-        del bot.memory['safety_cache'][oldest_key]
+    """ Cleanup expired entries in URL cache """
+    bot.memory['safety_cache'].expire()
+    if bot.config.safety.cache_persist:
+        bot.db.execute('DELETE FROM safety_cache WHERE age <= ?',
+                       [time.time() - bot.config.safety.cache_ttl])
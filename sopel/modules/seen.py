@@ -13,6 +13,7 @@ import time
 import datetime
 from sopel.tools import Identifier
 from sopel.tools.time import get_timezone, format_time
+from sopel.formatting import plain
 from sopel.module import commands, rule, priority, thread
 
 
@@ -29,7 +30,7 @@ def seen(bot, trigger):
     timestamp = bot.db.get_nick_value(nick, 'seen_timestamp')
     if timestamp:
         channel = bot.db.get_nick_value(nick, 'seen_channel')
-        message = bot.db.get_nick_value(nick, 'seen_message')
+        message = plain(bot.db.get_nick_value(nick, 'seen_message'))
         action = bot.db.get_nick_value(nick, 'seen_action')
 
         tz = get_timezone(bot.db, bot.config, None, trigger.nick,
@@ -14,7 +14,6 @@ import json
 import sys
 import random
 import requests
-mangle_lines = {}
 if sys.version_info.major >= 3:
     unicode = str
 
@@ -152,18 +151,18 @@ def get_random_lang(long_list, short_list):
 @commands('mangle', 'mangle2')
 def mangle(bot, trigger):
     """Repeatedly translate the input until it makes absolutely no sense."""
-    global mangle_lines
     long_lang_list = ['fr', 'de', 'es', 'it', 'no', 'he', 'la', 'ja', 'cy', 'ar', 'yi', 'zh', 'nl', 'ru', 'fi', 'hi', 'af', 'jw', 'mr', 'ceb', 'cs', 'ga', 'sv', 'eo', 'el', 'ms', 'lv']
     lang_list = []
     for __ in range(0, 8):
         lang_list = get_random_lang(long_lang_list, lang_list)
     random.shuffle(lang_list)
     if trigger.group(2) is None:
-        try:
-            phrase = (mangle_lines[trigger.sender.lower()], '')
-        except:
+        # The newest line in the history is this command, so skip it
+        last = bot.history.last(trigger.sender, skip=1)
+        if trigger.is_privmsg or last is None:
             bot.reply("What do you want me to mangle?")
             return
+        phrase = ("%s said '%s'" % (last.nick, last.text.strip()), '')
     else:
         phrase = (trigger.group(2).strip(), '')
     if phrase[0] == '':
@@ -191,13 +190,6 @@ def mangle(bot, trigger):
     bot.reply(phrase[0])
 
 
-@rule('(.*)')
-@priority('low')
-def collect_mangle_lines(bot, trigger):
-    global mangle_lines
-    mangle_lines[trigger.sender.lower()] = "%s said '%s'" % (trigger.nick, (trigger.group(0).strip()))
-
-
 if __name__ == "__main__":
     from sopel.test_tools import run_example_tests
     run_example_tests(__file__)
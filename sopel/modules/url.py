@@ -8,14 +8,19 @@
 from __future__ import unicode_literals, absolute_import, print_function, division
 
 import re
+import time
 from contextlib import closing
 from sopel import web, tools
-from sopel.module import commands, rule, example
+from sopel.formatting import plain
+from sopel.module import commands, rule, example, require_admin
 from sopel.config.types import ValidatedAttribute, ListAttribute, StaticSection
+from sopel.tools import normalize_url
+from sopel.tools.cache import ExpiringLRUCache
 
 import requests
 
 url_finder = None
+title_cache = None
 # These are used to clean up the title tag before actually parsing it. Not the
 # world's best way to do this, but it'll do for now.
 title_tag_data = re.compile('<(/?)title( [^>]+)?>', re.IGNORECASE)
@@ -33,6 +38,103 @@ class UrlSection(StaticSection):
     # TODO some validation rules maybe?
     exclude = ListAttribute('exclude')
     exclusion_char = ValidatedAttribute('exclusion_char', default='!')
+    title_cache_size = ValidatedAttribute('title_cache_size', int, default=512)
+    """How many URLs to remember titles for. 0 disables the cache."""
+    title_cache_ttl = ValidatedAttribute('title_cache_ttl', int, default=3600)
+    """How long, in seconds, a fetched title is reused."""
+    title_cache_negative_ttl = ValidatedAttribute('title_cache_negative_ttl',
+                                                  int, default=300)
+    """How long, in seconds, to remember URLs which had no usable title."""
+    title_cache_persist = ValidatedAttribute('title_cache_persist', bool,
+                                             default=False)
+    """Whether to keep cached titles in the bot's database across restarts."""
+
+
+class TitleCache(object):
+    """Remembers recently fetched titles, keyed by normalized URL.
+
+    Each entry is a dict with the ``title`` (``None`` if the URL failed to
+    load or was not HTML), the ``url`` the request finally ended up at, and
+    the time it was ``fetched``. Entries are stored under both the requested
+    and the final URL, so links which redirect to a page we've already seen
+    don't trigger another fetch.
+
+    If ``db`` is given, entries are also written to the ``url_titles`` table,
+    and looked up there when they aren't in memory.
+    """
+    def __init__(self, size, ttl, negative_ttl, db=None):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.db = db
+        self._cache = ExpiringLRUCache(size)
+        if db is not None:
+            db.execute(
+                'CREATE TABLE IF NOT EXISTS url_titles '
+                '(url STRING PRIMARY KEY, title STRING, final_url STRING, '
+                'fetched REAL, expires REAL)'
+            )
+
+    # Lookups answered from the database count as misses, since they had to
+    # go to the database.
+    @property
+    def hits(self):
+        return self._cache.hits
+
+    @property
+    def misses(self):
+        return self._cache.misses
+
+    @property
+    def hit_rate(self):
+        return self._cache.hit_rate
+
+    def __len__(self):
+        return len(self._cache)
+
+    def get(self, url):
+        """Return the cached entry for ``url``, or ``None``."""
+        key = normalize_url(url)
+        entry = self._cache.get(key)
+        if entry is None and self.db is not None:
+            entry = self._load(key)
+        return entry
+
+    def put(self, url, title, final_url=None):
+        """Cache ``title`` for ``url`` and the URL it redirected to."""
+        final_url = final_url or url
+        ttl = self.ttl if title else self.negative_ttl
+        entry = {'title': title, 'url': final_url, 'fetched': time.time()}
+        keys = set([normalize_url(url), normalize_url(final_url)])
+        for key in keys:
+            self._cache.set(key, entry, ttl)
+        if self.db is not None:
+            expires = entry['fetched'] + ttl
+            for key in keys:
+                self.db.execute(
+                    'INSERT OR REPLACE INTO url_titles VALUES (?, ?, ?, ?, ?)',
+                    [key, title, final_url, entry['fetched'], expires]
+                )
+
+    def _load(self, key):
+        now = time.time()
+        row = self.db.execute(
+            'SELECT title, final_url, fetched, expires FROM url_titles '
+            'WHERE url = ? AND expires > ?',
+            [key, now]
+        ).fetchone()
+        if row is None:
+            return None
+        title, final_url, fetched, expires = row
+        entry = {'title': title, 'url': final_url, 'fetched': fetched}
+        self._cache.set(key, entry, expires - now)
+        return entry
+
+    def clean(self):
+        """Forget expired entries, in memory and in the database."""
+        self._cache.expire()
+        if self.db is not None:
+            self.db.execute('DELETE FROM url_titles WHERE expires <= ?',
+                            [time.time()])
 
 
 def configure(config):
@@ -81,6 +183,18 @@ def setup(bot=None):
     url_finder = re.compile(r'(?u)(%s?(?:http|https|ftp)(?:://\S+))' %
                             (bot.config.url.exclusion_char), re.IGNORECASE)
 
+    global title_cache
+    if bot.config.url.title_cache_size > 0:
+        db = bot.db if bot.config.url.title_cache_persist else None
+        title_cache = TitleCache(bot.config.url.title_cache_size,
+                                 bot.config.url.title_cache_ttl,
+                                 bot.config.url.title_cache_negative_ttl,
+                                 db)
+        title_cache.clean()
+    else:
+        title_cache = None
+    bot.memory['url_title_cache'] = title_cache
+
 
 @commands('title')
 @example('.title http://google.com', '[ Google ] - google.com')
@@ -100,7 +214,7 @@ def title_command(bot, trigger):
         else:
             urls = [bot.memory['last_seen_url'][trigger.sender]]
     else:
-        urls = re.findall(url_finder, trigger)
+        urls = re.findall(url_finder, plain(trigger))
 
     results = process_urls(bot, trigger, urls)
     for title, domain in results[:4]:
@@ -117,15 +231,17 @@ def title_auto(bot, trigger):
     if re.match(bot.config.core.prefix + 'title', trigger):
         return
 
-    # Avoid fetching known malicious links
-    if 'safety_cache' in bot.memory and trigger in bot.memory['safety_cache']:
-        if bot.memory['safety_cache'][trigger]['positives'] > 1:
-            return
-
-    urls = re.findall(url_finder, trigger)
+    urls = re.findall(url_finder, plain(trigger))
     if len(urls) == 0:
         return
 
+    # Avoid fetching known malicious links
+    if 'safety_cache' in bot.memory:
+        for url in urls:
+            result = bot.memory['safety_cache'].get(normalize_url(url))
+            if result and result['positives'] > 1:
+                return
+
     results = process_urls(bot, trigger, urls)
     bot.memory['last_seen_url'][trigger.sender] = urls[-1]
 
@@ -136,6 +252,18 @@ def title_auto(bot, trigger):
             bot.say(message)
 
 
+@commands('titlecache')
+@require_admin
+def title_cache_stats(bot, trigger):
+    """Show how well the URL title cache is doing."""
+    if title_cache is None:
+        bot.reply('The title cache is disabled.')
+        return
+    bot.reply('%d URLs cached, %.1f%% hit rate (%d hits, %d misses)' % (
+        len(title_cache), title_cache.hit_rate * 100,
+        title_cache.hits, title_cache.misses))
+
+
 def process_urls(bot, trigger, urls):
     """
     For each URL in the list, ensure that it isn't handled by another module.
@@ -173,7 +301,7 @@ def check_callbacks(bot, trigger, url, run=True):
     # Check if it matches the exclusion list first
     matched = any(regex.search(url) for regex in bot.memory['url_exclude'])
     # Then, check if there's anything in the callback list
-    for regex, function in tools.iteritems(bot.memory['url_callbacks']):
+    for regex, function in bot.memory['url_callbacks'].items():
         match = regex.search(url)
         if match:
             if run:
@@ -183,8 +311,34 @@ def check_callbacks(bot, trigger, url, run=True):
 
 
 def find_title(url, verify=True):
-    """Return the title for the given URL."""
+    """Return the title for the given URL.
+
+    If the title cache is enabled, recently seen URLs are answered from it,
+    including those which previously failed or weren't HTML.
+    """
+    if title_cache is None:
+        return _fetch_title(url, verify)[0]
+
+    entry = title_cache.get(url)
+    if entry is not None:
+        return entry['title']
+    try:
+        title, final_url = _fetch_title(url, verify)
+    except requests.RequestException:
+        title, final_url = None, url
+    title_cache.put(url, title, final_url)
+    return title
+
+
+def _fetch_title(url, verify=True):
+    """Fetch ``url``, and return its title and the URL it redirected to."""
     response = requests.get(url, stream=True, verify=verify)
+    final_url = response.url or url
+    content_type = response.headers.get('content-type', '')
+    if content_type and 'html' not in content_type.lower():
+        # Don't download images and such just to find there's no title.
+        response.close()
+        return None, final_url
     try:
         content = ''
         for byte in response.iter_content(chunk_size=512, decode_unicode=True):
@@ -195,7 +349,7 @@ def find_title(url, verify=True):
             if '</title>' in content or len(content) > max_bytes:
                 break
     except UnicodeDecodeError:
-        return  # Fail silently when data can't be decoded
+        return None, final_url  # Fail silently when data can't be decoded
     finally:
         # need to close the connexion because we have not read all the data
         response.close()
@@ -208,7 +362,7 @@ def find_title(url, verify=True):
     start = content.find('<title>')
     end = content.find('</title>')
     if start == -1 or end == -1:
-        return
+        return None, final_url
     title = web.decode(content[start + 7:end])
     title = title.strip()[:200]
 
@@ -217,7 +371,7 @@ def find_title(url, verify=True):
     # More cryptic regex substitutions. This one looks to be myano's invention.
     title = re_dcc.sub('', title)
 
-    return title or None
+    return title or None, final_url
 
 
 def get_hostname(url):
@@ -149,8 +149,15 @@ def main(argv=None):
 
         config_module._is_daemonized = opts.daemonize
 
-        sys.stderr = tools.OutputRedirect(logfile, True, opts.quiet)
-        sys.stdout = tools.OutputRedirect(logfile, False, opts.quiet)
+        max_bytes = config_module.core.stdio_log_max_bytes
+        backups = config_module.core.stdio_log_backups
+        sys.stderr = tools.OutputRedirect(logfile, True, opts.quiet,
+                                          max_bytes, backups)
+        sys.stdout = tools.OutputRedirect(logfile, False, opts.quiet,
+                                          max_bytes, backups)
+        if hasattr(signal, 'SIGHUP'):
+            signal.signal(signal.SIGHUP,
+                          lambda sig, frame: tools.OutputRedirect.reopen())
 
         # Handle --quit, --kill and saving the PID to file
         pid_dir = config_module.core.pid_dir
@@ -190,6 +197,9 @@ def main(argv=None):
             stderr('Sopel is not running!')
             sys.exit(1)
         if opts.daemonize:
+            # Write out what's buffered, or both processes would write it
+            sys.stdout.flush()
+            sys.stderr.flush()
             child_pid = os.fork()
             if child_pid is not 0:
                 sys.exit()
@@ -13,6 +13,7 @@ import os
 import re
 import sys
 import tempfile
+import time
 
 try:
     import ConfigParser
@@ -22,6 +23,8 @@ except ImportError:
 import sopel.config
 import sopel.config.core_section
 import sopel.tools
+import sopel.tools.history
+import sopel.tools.isupport
 import sopel.trigger
 
 
@@ -50,11 +53,16 @@ class MockSopel(object):
         self.channels = ["#channel"]
 
         self.memory = sopel.tools.SopelMemory()
+        self.history = sopel.tools.history.MessageHistory()
 
         self.ops = {}
         self.halfplus = {}
         self.voices = {}
 
+        self.isupport = sopel.tools.isupport.ISupport()
+        self.written = []
+        """The lines sent with :meth:`write` (or :meth:`msg`)."""
+
         self.config = MockConfig()
         self._init_config()
 
@@ -72,6 +80,29 @@ class MockSopel(object):
             os.mkdir(home_dir)
         cfg.parser.set('core', 'homedir', home_dir)
 
+    def write(self, args, text=None):
+        line = ' '.join(args)
+        if text is not None:
+            line += ' :' + text
+        self.written.append(line)
+
+    def msg(self, recipient, text):
+        self.write(('PRIVMSG', recipient), text)
+
+    def error(self, trigger=None):
+        # Let the test see the exception instead of logging it
+        raise
+
+
+def wait_for(condition, timeout=2):
+    """Wait until ``condition()`` is true, or ``timeout`` seconds pass.
+
+    For testing what the bot does in other threads.
+    """
+    end = time.time() + timeout
+    while not condition() and time.time() < end:
+        time.sleep(0.01)
+
 
 class MockSopelWrapper(object):
     def __init__(self, bot, pretrigger):
@@ -17,10 +17,13 @@ from __future__ import unicode_literals, absolute_import, print_function, divisi
 import sys
 import os
 import re
+import atexit
 import threading
-import codecs
 import traceback
+import collections
 from collections import defaultdict
+# Not ``import time``: importing sopel.tools.time replaces that name here.
+from time import sleep as _sleep
 
 from sopel.tools._events import events  # NOQA
 
@@ -30,13 +33,22 @@ if sys.version_info.major >= 3:
     iteritems = dict.items
     itervalues = dict.values
     iterkeys = dict.keys
+    from urllib.parse import urlsplit, urlunsplit
 else:
     iteritems = dict.iteritems
     itervalues = dict.itervalues
     iterkeys = dict.iterkeys
+    from urlparse import urlsplit, urlunsplit
 
 _channel_prefixes = ('#', '&', '+', '!')
 
+if hasattr(collections.OrderedDict, 'move_to_end'):
+    _move_to_end = collections.OrderedDict.move_to_end
+else:
+    # Python 2
+    def _move_to_end(ordered, key):
+        ordered[key] = ordered.pop(key)
+
 
 def get_input(prompt):
     """Get decoded input from the terminal (equivalent to python 3's ``input``).
@@ -122,6 +134,29 @@ class Ddict(dict):
         return dict.__getitem__(self, key)
 
 
+def _lower_rfc1459(identifier):
+    # The tilde replacement isn't needed for identifiers, but is for
+    # channels, which may be useful at some point in the future.
+    low = identifier.lower().replace('{', '[').replace('}', ']')
+    return low.replace('|', '\\').replace('^', '~')
+
+
+def _lower_strict_rfc1459(identifier):
+    low = identifier.lower().replace('{', '[').replace('}', ']')
+    return low.replace('|', '\\')
+
+
+def _lower_ascii(identifier):
+    return identifier.lower()
+
+
+_casemappings = {
+    'rfc1459': _lower_rfc1459,
+    'strict-rfc1459': _lower_strict_rfc1459,
+    'ascii': _lower_ascii,
+}
+
+
 class Identifier(unicode):
     """A `unicode` subclass which acts appropriately for IRC identifiers.
 
@@ -129,31 +164,86 @@ class Identifier(unicode):
     However, when comparing two Identifier objects, or comparing a Identifier
     object with a `unicode` object, the comparison will be case insensitive.
     This case insensitivity includes the case convention conventions regarding
-    ``[]``, ``{}``, ``|``, ``\\``, ``^`` and ``~`` described in RFC 2812.
+    ``[]``, ``{}``, ``|``, ``\\``, ``^`` and ``~`` described in RFC 2812, or
+    whichever of them the server's ``CASEMAPPING`` calls for (see
+    :meth:`set_casemapping`). Letters outside ASCII are lowered as well,
+    whatever the casemapping.
+
+    Identifiers made from the same string are shared: up to
+    :attr:`cache_size` of the most recently used ones are kept and returned
+    again instead of being lowered afresh. Plain strings which are only
+    compared with Identifiers aren't kept.
     """
 
+    casemapping = 'rfc1459'
+    """The name of the casemapping in use."""
+    cache_size = 10000
+    """How many Identifiers to keep for reuse."""
+    _lower_func = staticmethod(_lower_rfc1459)
+    _cache = collections.OrderedDict()  # Least recently used first
+    _cache_lock = threading.Lock()
+
     def __new__(cls, identifier):
         # According to RFC2812, identifiers have to be in the ASCII range.
         # However, I think it's best to let the IRCd determine that, and we'll
         # just assume unicode. It won't hurt anything, and is more internally
         # consistent. And who knows, maybe there's another use case for this
         # weird case convention.
+        if cls is not Identifier:
+            s = unicode.__new__(cls, identifier)
+            s._lowered = Identifier._lower(identifier)
+            return s
+        if type(identifier) is Identifier:
+            return identifier
+        if type(identifier) is not unicode:
+            s = unicode.__new__(cls, identifier)
+            s._lowered = Identifier._lower(identifier)
+            return s
+        cache = Identifier._cache
+        with Identifier._cache_lock:
+            s = cache.get(identifier)
+            if s is not None:
+                _move_to_end(cache, identifier)
+                return s
         s = unicode.__new__(cls, identifier)
-        s._lowered = Identifier._lower(identifier)
+        s._lowered = Identifier._lower_func(identifier)
+        with Identifier._cache_lock:
+            # Another thread may have made the same one meanwhile
+            s = cache.setdefault(identifier, s)
+            if len(cache) > Identifier.cache_size:
+                cache.popitem(last=False)
         return s
 
+    @staticmethod
+    def set_casemapping(name):
+        """Compare Identifiers made from now on by the ``name`` casemapping.
+
+        ``name`` is one of ``rfc1459`` (the default), ``strict-rfc1459`` and
+        ``ascii``, as given in the server's ``CASEMAPPING`` ISUPPORT token;
+        :exc:`ValueError` is raised for any other. Identifiers which already
+        exist keep the lowered form they were made with, so this should be
+        called before any are stored, i.e. while connecting.
+        """
+        name = name.lower()
+        if name not in _casemappings:
+            raise ValueError('Unknown casemapping %s' % name)
+        Identifier._lower_func = staticmethod(_casemappings[name])
+        Identifier.casemapping = name
+        with Identifier._cache_lock:
+            Identifier._cache.clear()
+
     def lower(self):
-        """Return the identifier converted to lower-case per RFC 2812."""
+        """Return the identifier converted to lower-case per the casemapping."""
         return self._lowered
 
     @staticmethod
     def _lower(identifier):
-        """Returns `identifier` in lower case per RFC 2812."""
-        # The tilde replacement isn't needed for identifiers, but is for
-        # channels, which may be useful at some point in the future.
-        low = identifier.lower().replace('{', '[').replace('}', ']')
-        low = low.replace('|', '\\').replace('^', '~')
-        return low
+        """Returns `identifier` in lower case per the casemapping."""
+        if isinstance(identifier, Identifier):
+            return identifier._lowered
+        # Not cached: arbitrary text compared with an Identifier mustn't
+        # push the Identifiers themselves out of the cache
+        return Identifier._lower_func(identifier)
 
     def __repr__(self):
         return "%s(%r)" % (
@@ -167,27 +257,27 @@ class Identifier(unicode):
     def __lt__(self, other):
         if isinstance(other, Identifier):
             return self._lowered < other._lowered
-        return self._lowered < Identifier._lower(other)
+        return self._lowered < Identifier._lower_func(other)
 
     def __le__(self, other):
         if isinstance(other, Identifier):
             return self._lowered <= other._lowered
-        return self._lowered <= Identifier._lower(other)
+        return self._lowered <= Identifier._lower_func(other)
 
     def __gt__(self, other):
         if isinstance(other, Identifier):
             return self._lowered > other._lowered
-        return self._lowered > Identifier._lower(other)
+        return self._lowered > Identifier._lower_func(other)
 
     def __ge__(self, other):
         if isinstance(other, Identifier):
             return self._lowered >= other._lowered
-        return self._lowered >= Identifier._lower(other)
+        return self._lowered >= Identifier._lower_func(other)
 
     def __eq__(self, other):
         if isinstance(other, Identifier):
             return self._lowered == other._lowered
-        return self._lowered == Identifier._lower(other)
+        return self._lowered == Identifier._lower_func(other)
 
     def __ne__(self, other):
         return not (self == other)
@@ -198,6 +288,137 @@ class Identifier(unicode):
         return self and not self.startswith(_channel_prefixes)
 
 
+class _LogFile(object):
+    """An append-only log file, shared by everything writing to its path.
+
+    The file is kept open and line-buffered: a write that ends a line is
+    flushed right away, and a background thread flushes any partial line
+    left over every ``flush_interval`` seconds. Once the file would grow
+    past ``max_bytes`` (if that isn't 0), it is renamed to ``path.1`` (and
+    older ones to ``path.2`` and so on, up to ``backups``) and a new one is
+    started. :meth:`reopen_all` makes every log file be reopened before its
+    next write, for use after an external tool like logrotate has moved it.
+    """
+    _files = {}
+    _files_lock = threading.Lock()
+    _flusher_pid = None  # The process the flusher thread was started in
+    flush_interval = 1.0
+
+    def __init__(self, path, max_bytes=0, backups=3):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self._file = None
+        self._size = 0
+        self._dirty = False
+        self._reopen = False
+        self._lock = threading.Lock()
+
+    @classmethod
+    def get(cls, path, max_bytes=0, backups=3):
+        """Return the log file for ``path``, opening it if needed."""
+        path = os.path.abspath(path)
+        with cls._files_lock:
+            logfile = cls._files.get(path)
+            if logfile is None:
+                logfile = cls._files[path] = cls(path, max_bytes, backups)
+            cls._start_flusher()
+            return logfile
+
+    @classmethod
+    def _start_flusher(cls):
+        # Must be called with _files_lock held. A forked child doesn't
+        # inherit the parent's thread, so it starts its own.
+        pid = os.getpid()
+        if cls._flusher_pid == pid:
+            return
+        if cls._flusher_pid is None:
+            atexit.register(cls.flush_all)
+        cls._flusher_pid = pid
+        flusher = threading.Thread(target=cls._flush_loop, name='LogFlusher')
+        flusher.daemon = True
+        flusher.start()
+
+    @classmethod
+    def _flush_loop(cls):
+        while True:
+            _sleep(cls.flush_interval)
+            cls.flush_all()
+
+    @classmethod
+    def flush_all(cls):
+        with cls._files_lock:
+            logfiles = list(cls._files.values())
+        for logfile in logfiles:
+            logfile.flush()
+
+    @classmethod
+    def reopen_all(cls):
+        """Reopen every log file before its next write.
+
+        This only sets a flag, so it's safe to call from a signal handler.
+        """
+        for logfile in list(cls._files.values()):
+            logfile._reopen = True
+
+    def _open(self):
+        self._file = open(self.path, 'ab')
+        self._size = self._file.tell()
+
+    def _close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        self._dirty = False
+
+    def _rotate(self):
+        self._close()
+        try:
+            for i in range(self.backups - 1, 0, -1):
+                older = '%s.%d' % (self.path, i)
+                if os.path.exists(older):
+                    os.rename(older, '%s.%d' % (self.path, i + 1))
+            if self.backups > 0:
+                os.rename(self.path, self.path + '.1')
+            else:
+                os.remove(self.path)
+        except OSError:
+            pass  # Someone else moved it; carry on with a fresh file
+        self._open()
+
+    def write(self, string):
+        if isinstance(string, unicode):
+            data = string.encode('utf-8', 'xmlcharrefreplace')
+        else:
+            # we got an undecoded string; keep whatever is valid utf-8 of it
+            data = string.decode('utf-8', 'replace').encode('utf-8')
+        if _LogFile._flusher_pid != os.getpid():
+            with _LogFile._files_lock:
+                _LogFile._start_flusher()
+        with self._lock:
+            if self._reopen:
+                self._reopen = False
+                self._close()
+            if self._file is None:
+                self._open()
+            if (self.max_bytes and self._size and
+                    self._size + len(data) > self.max_bytes):
+                self._rotate()
+            self._file.write(data)
+            self._size += len(data)
+            if data.endswith(b'\n'):
+                self._file.flush()
+                self._dirty = False
+            else:
+                self._dirty = True
+
+    def flush(self):
+        with self._lock:
+            if self._dirty and self._file is not None:
+                self._file.flush()
+                self._dirty = False
+
+
 class OutputRedirect(object):
 
     """Redirect te output to the terminal and a log file.
@@ -206,7 +427,8 @@ class OutputRedirect(object):
 
     """
 
-    def __init__(self, logpath, stderr=False, quiet=False):
+    def __init__(self, logpath, stderr=False, quiet=False, max_bytes=0,
+                 backups=3):
         """Create an object which will to to a file and the terminal.
 
         Create an object which will log to the file at ``logpath`` as well as
@@ -215,11 +437,18 @@ class OutputRedirect(object):
         stdout.
         If ``quiet`` is given and True, data will be written to the log file
         only, but not the terminal.
+        If ``max_bytes`` is given and not 0, the log file is rotated when it
+        would grow larger than that, keeping ``backups`` old files.
 
+        The log file is kept open, and shared with any other
+        ``OutputRedirect`` for the same path; it is flushed at the end of each
+        line. Call :meth:`reopen` (e.g. on ``SIGHUP``) after moving
+        the file away.
         """
         self.logpath = logpath
         self.stderr = stderr
         self.quiet = quiet
+        self._logfile = _LogFile.get(logpath, max_bytes, backups)
 
     def write(self, string):
         """Write the given ``string`` to the logfile and terminal."""
@@ -232,19 +461,19 @@ class OutputRedirect(object):
             except:
                 pass
 
-        with codecs.open(self.logpath, 'ab', encoding="utf8",
-                         errors='xmlcharrefreplace') as logfile:
-            try:
-                logfile.write(string)
-            except UnicodeDecodeError:
-                # we got an invalid string, safely encode it to utf-8
-                logfile.write(unicode(string, 'utf8', errors="replace"))
+        self._logfile.write(string)
 
     def flush(self):
         if self.stderr:
             sys.__stderr__.flush()
         else:
             sys.__stdout__.flush()
+        self._logfile.flush()
+
+    @staticmethod
+    def reopen():
+        """Reopen all the redirected log files before their next write."""
+        _LogFile.reopen_all()
 
 
 # These seems to trace back to when we thought we needed a try/except on prints,
@@ -287,66 +516,119 @@ def get_hostmask_regex(mask):
     return re.compile(mask + '$', re.I)
 
 
+def normalize_url(url):
+    """Return ``url`` in a canonical form, suitable for use as a cache key.
+
+    The scheme and host are lower-cased, default ports and fragments are
+    dropped, and an empty path becomes ``/``.
+    """
+    try:
+        parts = urlsplit(url)
+    except ValueError:
+        return url
+    scheme = parts.scheme.lower()
+    netloc = parts.netloc.lower()
+    if ((scheme == 'http' and netloc.endswith(':80')) or
+            (scheme == 'https' and netloc.endswith(':443'))):
+        netloc = netloc.rsplit(':', 1)[0]
+    return urlunsplit((scheme, netloc, parts.path or '/', parts.query, ''))
+
+
 class SopelMemory(dict):
 
-    """A simple thread-safe dict implementation.
+    """A thread-safe dict, for data shared between callables.
 
     *Availability: 4.0; available as ``Sopel.SopelMemory`` in 3.1.0 - 3.2.0*
 
-    In order to prevent exceptions when iterating over the values and changing
-    them at the same time from different threads, we use a blocking lock on
-    ``__setitem__`` and ``contains``.
+    It is made for data which is read far more often than it is changed.
+    Reading (``memory[key]``, ``get``, ``in`` and ``len``) takes no lock,
+    since each of those is a single operation on the dict, which is atomic.
+    Everything which changes the dict holds :attr:`lock`, so changes made of
+    several steps, like :meth:`setdefault` and :meth:`update`, can't be
+    interleaved with others.
+
+    Iterating over it, and ``keys()``, ``values()`` and ``items()``, work on
+    a list copied under the lock, so they never fail because another thread
+    changed the dict in the meantime, and always see it as it was at one
+    moment. To make several operations atomic together, hold :attr:`lock`
+    (a reentrant lock) around them.
 
     """
-    def __init__(self, *args):
-        dict.__init__(self, *args)
-        self.lock = threading.Lock()
+    def __init__(self, *args, **kwargs):
+        dict.__init__(self, *args, **kwargs)
+        self.lock = threading.RLock()
 
     def __setitem__(self, key, value):
-        self.lock.acquire()
-        result = dict.__setitem__(self, key, value)
-        self.lock.release()
-        return result
+        with self.lock:
+            dict.__setitem__(self, key, value)
 
-    def __contains__(self, key):
-        """Check if a key is in the dict.
+    def __delitem__(self, key):
+        with self.lock:
+            dict.__delitem__(self, key)
 
-        It locks it for writes when doing so.
+    def setdefault(self, key, default=None):
+        with self.lock:
+            return dict.setdefault(self, key, default)
 
-        """
-        self.lock.acquire()
-        result = dict.__contains__(self, key)
-        self.lock.release()
-        return result
+    def update(self, *args, **kwargs):
+        with self.lock:
+            dict.update(self, *args, **kwargs)
 
-    def contains(self, key):
-        """Backwards compatability with 3.x, use `in` operator instead."""
-        return self.__contains__(key)
+    def pop(self, key, *default):
+        with self.lock:
+            return dict.pop(self, key, *default)
 
+    def popitem(self):
+        with self.lock:
+            return dict.popitem(self)
 
-class SopelMemoryWithDefault(defaultdict):
-    """Same as SopelMemory, but subclasses from collections.defaultdict."""
-    def __init__(self, *args):
-        defaultdict.__init__(self, *args)
-        self.lock = threading.Lock()
+    def clear(self):
+        with self.lock:
+            dict.clear(self)
 
-    def __setitem__(self, key, value):
-        self.lock.acquire()
-        result = defaultdict.__setitem__(self, key, value)
-        self.lock.release()
-        return result
+    def copy(self):
+        """Return a plain dict copy of the current contents."""
+        with self.lock:
+            return dict(dict.items(self))
 
-    def __contains__(self, key):
-        """Check if a key is in the dict.
+    def keys(self):
+        with self.lock:
+            return list(dict.keys(self))
 
-        It locks it for writes when doing so.
+    def values(self):
+        with self.lock:
+            return list(dict.values(self))
 
-        """
-        self.lock.acquire()
-        result = defaultdict.__contains__(self, key)
-        self.lock.release()
-        return result
+    def items(self):
+        with self.lock:
+            return list(dict.items(self))
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def iterkeys(self):
+        return iter(self.keys())
+
+    def itervalues(self):
+        return iter(self.values())
+
+    def iteritems(self):
+        return iter(self.items())
 
     def contains(self, key):
         """Backwards compatability with 3.x, use `in` operator instead."""
         return self.__contains__(key)
+
+
+class SopelMemoryWithDefault(SopelMemory, defaultdict):
+    """Same as SopelMemory, but subclasses from collections.defaultdict."""
+    def __init__(self, *args, **kwargs):
+        defaultdict.__init__(self, *args, **kwargs)
+        self.lock = threading.RLock()
+
+    def __missing__(self, key):
+        # Another thread may have filled it in since the lookup failed
+        with self.lock:
+            if dict.__contains__(self, key):
+                return dict.__getitem__(self, key)
+            return defaultdict.__missing__(self, key)
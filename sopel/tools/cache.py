@@ -0,0 +1,121 @@
+# coding=utf-8
+"""Bounded in-memory caches for module data.
+
+*Availability: 6.4+*
+"""
+from __future__ import unicode_literals, absolute_import, print_function, division
+
+import collections
+import threading
+import time
+
+
+class ExpiringLRUCache(object):
+    """A thread-safe, size-bounded cache whose entries may expire.
+
+    At most ``maxsize`` entries are kept; once that is exceeded, the least
+    recently used entry is evicted. Entries stored with a ``ttl`` (either the
+    one given to :meth:`set` or the cache-wide default ``ttl``) are treated as
+    missing once that many seconds have passed. A ``ttl`` of ``None`` means
+    the entry never expires.
+
+    Lookups are counted so that :attr:`hit_rate` can be reported to admins.
+    """
+    def __init__(self, maxsize=128, ttl=None):
+        if maxsize < 1:
+            raise ValueError('maxsize must be at least 1')
+        self.maxsize = maxsize
+        """The maximum number of entries kept in the cache."""
+        self.ttl = ttl
+        """The default lifetime of an entry, in seconds."""
+        self.hits = 0
+        """The number of lookups which found a live entry."""
+        self.misses = 0
+        """The number of lookups which found nothing, or an expired entry."""
+        self._data = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def _expired(self, entry, now):
+        expires = entry[0]
+        return expires is not None and expires <= now
+
+    def get(self, key, default=None):
+        """Return the value for ``key``, or ``default`` if it is not cached."""
+        now = time.time()
+        with self._lock:
+            entry = self._data.pop(key, None)
+            if entry is None or self._expired(entry, now):
+                self.misses += 1
+                return default
+            # Re-inserting moves the key to the most recently used end.
+            self._data[key] = entry
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value, ttl=None):
+        """Store ``value`` for ``key``, evicting old entries if needed.
+
+        ``ttl`` overrides the cache-wide default lifetime for this entry.
+        """
+        if ttl is None:
+            ttl = self.ttl
+        expires = time.time() + ttl if ttl is not None else None
+        with self._lock:
+            self._data.pop(key, None)
+            self._data[key] = (expires, value)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key, default=None):
+        """Remove ``key`` and return its value, or ``default``."""
+        with self._lock:
+            entry = self._data.pop(key, None)
+        if entry is None or self._expired(entry, time.time()):
+            return default
+        return entry[1]
+
+    def expire(self):
+        """Drop every expired entry, and return how many were removed."""
+        now = time.time()
+        with self._lock:
+            stale = [key for key, entry in self._data.items()
+                     if self._expired(entry, now)]
+            for key in stale:
+                del self._data[key]
+        return len(stale)
+
+    def clear(self):
+        """Remove every entry and reset the hit counters."""
+        with self._lock:
+            self._data.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def items(self):
+        """Return a list of ``(key, value)`` pairs for the live entries.
+
+        The list is a snapshot, ordered from least to most recently used.
+        """
+        now = time.time()
+        with self._lock:
+            return [(key, entry[1]) for key, entry in self._data.items()
+                    if not self._expired(entry, now)]
+
+    @property
+    def hit_rate(self):
+        """The fraction of lookups that were hits, from 0.0 to 1.0."""
+        lookups = self.hits + self.misses
+        if not lookups:
+            return 0.0
+        return self.hits / lookups
+
+    def __contains__(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+        return entry is not None and not self._expired(entry, time.time())
+
+    def __len__(self):
+        now = time.time()
+        with self._lock:
+            return sum(1 for entry in self._data.values()
+                       if not self._expired(entry, now))
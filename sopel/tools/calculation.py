@@ -6,8 +6,30 @@ import time
 import numbers
 import operator
 import ast
+import multiprocessing
+import threading
 
-__all__ = ['eval_equation']
+try:
+    import Queue
+except ImportError:
+    import queue as Queue
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows; the timeout still applies there.
+    resource = None
+
+from sopel.tools.cache import ExpiringLRUCache
+
+__all__ = ['eval_equation', 'EvaluatorPool', 'equation_pool']
+
+try:
+    # A forked child would inherit the bot's threads' locks, possibly held.
+    _processes = multiprocessing.get_context('spawn')
+except AttributeError:
+    # Python 2 can only fork
+    _processes = multiprocessing
 
 
 class ExpressionEvaluator:
@@ -193,3 +215,190 @@ eval_equation = EquationEvaluator()
 Supports addition (+), subtraction (-), multiplication (*), division (/),
 power (**) and modulo (%).
 """
+
+
+def _set_limit(limit, value):
+    soft, hard = resource.getrlimit(limit)
+    if hard != resource.RLIM_INFINITY:
+        value = min(value, hard)
+    resource.setrlimit(limit, (value, hard))
+
+
+def _evaluate_forever(conn, evaluator, cpu_seconds, memory_bytes):
+    """Run in a worker process of an :class:`EvaluatorPool`."""
+    if resource is not None and memory_bytes:
+        _set_limit(resource.RLIMIT_AS, memory_bytes)
+    conn.send(None)  # Ready; starting up doesn't count towards the timeout
+    while True:
+        try:
+            expression = conn.recv()
+        except (EOFError, IOError, OSError, KeyboardInterrupt):
+            # The pool was closed, or the bot is shutting down
+            return
+        if resource is not None and cpu_seconds:
+            # The limit counts all the CPU time the process has used, so it
+            # is moved along for each expression. Going over kills the worker.
+            usage = resource.getrusage(resource.RUSAGE_SELF)
+            _set_limit(resource.RLIMIT_CPU,
+                       int(usage.ru_utime + usage.ru_stime) + cpu_seconds)
+        try:
+            outcome = (True, evaluator(expression))
+        except Exception as e:
+            outcome = (False, e)
+        try:
+            conn.send(outcome)
+        except (IOError, OSError):
+            return
+        except Exception:
+            # The result or exception couldn't be pickled
+            conn.send((False, ValueError(str(outcome[1]))))
+
+
+class EvaluatorPool(object):
+    """Evaluates expressions in a pool of worker processes.
+
+    An expression evaluated in the bot's own process can't be stopped once
+    a single operation on huge numbers starts, and holds up every other
+    thread meanwhile. The ``evaluator`` (which must be picklable, like
+    :data:`eval_equation`) is instead called in one of ``processes`` worker
+    processes, which is killed if it takes more than ``timeout`` seconds,
+    more than ``cpu_seconds`` of CPU time, or more than ``memory_bytes`` of
+    memory (the last two where the ``resource`` module is available).
+
+    The outcome of the last ``cache_size`` distinct expressions is cached,
+    so repeating one, even one which timed out, costs nothing.
+
+    The workers are started by :meth:`start`, or when the pool is first
+    called, and stopped by :meth:`close`; a closed pool starts again when
+    called. Each module using a shared pool should call :meth:`start` in its
+    ``setup`` and :meth:`close` in its ``shutdown``; the workers are only
+    stopped once every :meth:`start` has been matched by a :meth:`close`, so
+    reloading one module doesn't kill them under another.
+    """
+    def __init__(self, evaluator, processes=2, timeout=5.0, cpu_seconds=5,
+                 memory_bytes=512 * 1024 * 1024, cache_size=256):
+        self.evaluator = evaluator
+        self.processes = processes
+        self.timeout = timeout
+        self.cpu_seconds = cpu_seconds
+        self.memory_bytes = memory_bytes
+        self.cache = ExpiringLRUCache(cache_size)
+        self._lock = threading.Lock()
+        self._idle = None  # Queue of [process, conn, ready], None if closed
+        self._workers = []
+        self._users = 0
+
+    def __call__(self, expression):
+        """Evaluate ``expression``, raising what the evaluator raised.
+
+        Raises :class:`ExpressionEvaluator.Error` if it took too long or
+        used too much memory, or if every worker stayed busy for
+        ``timeout`` seconds.
+        """
+        outcome = self.cache.get(expression)
+        if outcome is None:
+            outcome = self._evaluate(expression)
+            if outcome is None:
+                raise ExpressionEvaluator.Error(
+                    "Too many expressions being evaluated; try again later.")
+            ok, value = outcome
+            if not ok:
+                # Cache how to make the exception rather than the exception
+                # itself, whose traceback would grow each time it's raised
+                outcome = (False, (type(value), value.args))
+            self.cache.set(expression, outcome)
+        ok, value = outcome
+        if ok:
+            return value
+        error_type, args = value
+        raise error_type(*args)
+
+    def start(self):
+        """Start the worker processes, if they aren't running."""
+        with self._lock:
+            self._users += 1
+            self._start_workers()
+
+    def close(self):
+        """Stop the worker processes, unless another user of the pool still
+        hasn't closed it."""
+        with self._lock:
+            self._users = max(0, self._users - 1)
+            if self._users:
+                return
+            workers = self._workers
+            self._workers = []
+            self._idle = None
+        for process, conn, _ in workers:
+            conn.close()
+            process.terminate()
+            process.join()
+
+    def _start_workers(self):
+        # Must be called with the lock held.
+        if self._idle is not None:
+            return
+        self._idle = Queue.Queue()
+        for _ in range(self.processes):
+            self._idle.put(self._spawn())
+
+    def _spawn(self):
+        # Must be called with the lock held.
+        conn, child_conn = _processes.Pipe()
+        process = _processes.Process(
+            target=_evaluate_forever, name='EvaluatorPool',
+            args=(child_conn, self.evaluator, self.cpu_seconds,
+                  self.memory_bytes))
+        process.daemon = True
+        process.start()
+        child_conn.close()
+        worker = [process, conn, False]
+        self._workers.append(worker)
+        return worker
+
+    def _replace(self, idle, worker):
+        process, conn, _ = worker
+        conn.close()
+        process.terminate()
+        process.join()
+        with self._lock:
+            if worker not in self._workers:
+                return  # Closed meanwhile
+            self._workers.remove(worker)
+            idle.put(self._spawn())
+
+    def _evaluate(self, expression):
+        """Return ``(True, result)`` or ``(False, exception)``, or None if
+        no worker was free in time."""
+        with self._lock:
+            self._start_workers()
+            idle = self._idle
+        try:
+            worker = idle.get(timeout=self.timeout)
+        except Queue.Empty:
+            return None
+        process, conn, ready = worker
+        try:
+            if not ready:
+                conn.recv()
+                worker[2] = True
+            conn.send(expression)
+            if conn.poll(self.timeout):
+                outcome = conn.recv()
+                idle.put(worker)
+                return outcome
+            error = "Time for evaluating expression ran out."
+        except (EOFError, IOError, OSError):
+            # Killed for going over its CPU time or memory, or closed
+            error = "Evaluating expression took too many resources."
+        self._replace(idle, worker)
+        return (False, ExpressionEvaluator.Error(error))
+
+
+equation_pool = EvaluatorPool(eval_equation)
+"""Evaluates equations like :data:`eval_equation`, in worker processes.
+
+This is shared by the modules which evaluate equations from users, so that
+they don't start a pool each; see :class:`EvaluatorPool` for how they
+should start and close it.
+"""
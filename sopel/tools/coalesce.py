@@ -0,0 +1,191 @@
+# coding=utf-8
+"""Combining commands to the server into fewer lines.
+
+*Availability: 6.4+*
+
+Many commands take several targets or changes in one line: ``JOIN #a,#b``,
+``MODE #chan +bb mask1 mask2``, ``KICK #chan nick1,nick2``. The bot keeps one
+:class:`Coalescer` as ``bot.coalescer``; commands given to it are held for a
+short window, and those which can go together are then sent in as few
+lines as the server's limits (from ``bot.isupport``) allow. Sending fewer
+lines means less time lost to the server's flood protection, most of all
+when joining many channels on connect.
+"""
+from __future__ import unicode_literals, absolute_import, print_function, division
+
+import collections
+import threading
+import time
+
+
+class Coalescer(object):
+    """Holds commands for up to ``window`` seconds to send them together.
+
+    A command which nothing like it has been sent for in the last
+    ``window`` seconds is sent right away; those which follow it within the
+    window are held, and sent together when it ends. Held commands are sent
+    in the order in which their first command was given; anything written
+    directly with ``bot.write`` meanwhile may overtake them. A ``window`` of
+    0 sends everything right away, one command per line.
+    """
+    def __init__(self, bot, window=0.1):
+        self.bot = bot
+        self.window = window
+        # key -> [deadline, items held, item sent when the window opened]
+        self._pending = collections.OrderedDict()
+        self._cond = threading.Condition()
+        self._thread = None
+
+    def join(self, channel, key=None):
+        """Join ``channel``, with ``key`` if it has one."""
+        self._add(('JOIN',), (channel, key))
+
+    def part(self, channel, reason=None):
+        """Leave ``channel``."""
+        self._add(('PART', reason), channel)
+
+    def mode(self, channel, change, param=None):
+        """Make a mode ``change`` (e.g. ``'+b'``) on ``channel``."""
+        self._add(('MODE', channel), (change, param))
+
+    def kick(self, channel, nick, reason=None):
+        """Kick ``nick`` from ``channel``."""
+        self._add(('KICK', channel, reason), nick)
+
+    def flush(self):
+        """Send everything held right away."""
+        with self._cond:
+            batches = list(self._pending.items())
+            self._pending.clear()
+        for key, batch in batches:
+            if batch[1]:
+                self._send(key, batch[1])
+
+    def _add(self, key, item):
+        if not self.window:
+            self._send(key, [item])
+            return
+        send_now = False
+        with self._cond:
+            batch = self._pending.get(key)
+            if batch is None:
+                # Nothing like it sent lately: send it now, and hold what
+                # follows within the window
+                self._pending[key] = [time.time() + self.window, [], item]
+                send_now = True
+            elif key[0] == 'MODE':
+                # Not deduplicated: with e.g. +b, -b, +b of one mask, dropping
+                # the repeat would leave the mask unbanned.
+                batch[1].append(item)
+            elif item != batch[2] and item not in batch[1]:
+                batch[1].append(item)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._flush_loop,
+                                                name='Coalescer')
+                self._thread.daemon = True
+                self._thread.start()
+            self._cond.notify()
+        if send_now:
+            self._send(key, [item])
+
+    def _flush_loop(self):
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+                key = next(iter(self._pending))
+                deadline, items, _ = self._pending[key]
+                wait = deadline - time.time()
+                if wait > 0:
+                    self._cond.wait(wait)
+                    continue
+                del self._pending[key]
+            if not items:
+                continue  # The window closed with nothing more to send
+            try:
+                self._send(key, items)
+            except Exception:
+                self.bot.error()
+
+    def _send(self, key, items):
+        for args, text in self.lines(key, items):
+            self.bot.write(args, text)
+
+    def lines(self, key, items):
+        """Return the ``(args, text)`` of the lines which send ``items``."""
+        isupport = self.bot.isupport
+        command = key[0]
+        text = None
+        weight = None
+        limit = isupport.max_targets(command)
+        if command == 'JOIN':
+            # Channels with keys have to come first, so the keys line up
+            items = ([item for item in items if item[1]] +
+                     [item for item in items if not item[1]])
+            make_args = _join_args
+        elif command == 'MODE':
+            limit = isupport.modes
+            make_args = lambda chunk: _mode_args(key[1], chunk)
+            # MODES limits the number of changes with a parameter
+            weight = lambda item: int(item[1] is not None)
+        elif command == 'KICK':
+            text = key[2]
+            make_args = lambda chunk: ['KICK', key[1], ','.join(chunk)]
+        else:
+            # PART
+            text = key[1]
+            make_args = lambda chunk: [command, ','.join(chunk)]
+        chunks = _chunks(items, limit, isupport.linelen, make_args, text,
+                         weight)
+        return [(make_args(chunk), text) for chunk in chunks]
+
+
+def _join_args(chunk):
+    args = ['JOIN', ','.join(channel for channel, _ in chunk)]
+    keys = [key for _, key in chunk if key]
+    if keys:
+        args.append(','.join(keys))
+    return args
+
+
+def _mode_args(channel, chunk):
+    changes = ''
+    sign = None
+    for change, _ in chunk:
+        if change[0] != sign:
+            sign = change[0]
+            changes += sign
+        changes += change[1:]
+    return ['MODE', channel, changes] + [
+        param for _, param in chunk if param is not None]
+
+
+def _line_length(args, text):
+    line = ' '.join(args)
+    if text is not None:
+        line += ' :' + text
+    return len(line.encode('utf-8')) + 2
+
+
+def _chunks(items, limit, linelen, make_args, text, weight=None):
+    """Split ``items`` into as few chunks as fit ``limit`` (of total
+    ``weight``, or ``None`` for no limit) and ``linelen``."""
+    if weight is None:
+        weight = lambda item: 1
+    chunks = []
+    chunk = []
+    total = 0
+    for item in items:
+        candidate = chunk + [item]
+        if chunk and ((limit is not None and
+                       total + weight(item) > limit) or
+                      _line_length(make_args(candidate), text) > linelen):
+            chunks.append(chunk)
+            chunk = [item]
+            total = weight(item)
+        else:
+            chunk = candidate
+            total += weight(item)
+    if chunk:
+        chunks.append(chunk)
+    return chunks
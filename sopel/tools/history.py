@@ -0,0 +1,118 @@
+# coding=utf-8
+"""A bounded record of what was recently said in each channel.
+
+*Availability: 6.4+*
+
+The bot keeps one :class:`MessageHistory` as ``bot.history``, and records
+every channel ``PRIVMSG`` (except from blocked nicks and hosts) into it
+before dispatching the line to modules.
+Modules which need to look back at the conversation should query it rather
+than registering their own catch-all rule to copy every line.
+"""
+from __future__ import unicode_literals, absolute_import, print_function, division
+
+import collections
+import threading
+import time
+
+
+HistoryEntry = collections.namedtuple('HistoryEntry',
+                                      'time nick text ctcp')
+"""A line said in a channel.
+
+``time`` is a Unix timestamp, ``nick`` is an
+:class:`~sopel.tools.Identifier`, ``text`` is the message with any CTCP
+markers removed, and ``ctcp`` is the CTCP command (e.g. ``'ACTION'``) or
+``None``."""
+
+
+class MessageHistory(object):
+    """The last ``depth`` lines said in each channel.
+
+    Besides the per-channel limit, the total length of stored text is kept
+    under ``max_bytes`` (counted in characters, as an approximation). When
+    that is exceeded, the oldest lines of the least recently active channels
+    are dropped first.
+    """
+    def __init__(self, depth=100, max_bytes=1024 * 1024):
+        self.depth = depth
+        """The maximum number of lines kept per channel."""
+        self.max_bytes = max_bytes
+        """The approximate maximum size of all stored text."""
+        self._channels = collections.OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def record(self, channel, nick, text, ctcp=None, when=None):
+        """Add a line said by ``nick`` in ``channel``."""
+        if self.depth < 1:
+            return
+        entry = HistoryEntry(when or time.time(), nick, text, ctcp)
+        with self._lock:
+            lines = self._channels.pop(channel, None)
+            if lines is None:
+                lines = collections.deque()
+            self._channels[channel] = lines
+            lines.append(entry)
+            self._size += len(text)
+            while len(lines) > self.depth:
+                self._size -= len(lines.popleft().text)
+            self._trim()
+
+    def _trim(self):
+        # Must be called with the lock held.
+        while self._size > self.max_bytes and self._channels:
+            channel, lines = next(iter(self._channels.items()))
+            self._size -= len(lines.popleft().text)
+            if not lines:
+                del self._channels[channel]
+
+    def recent(self, channel, nick=None, limit=None):
+        """Return the latest lines said in ``channel``, newest first.
+
+        If ``nick`` is given, only that nick's lines are returned. At most
+        ``limit`` lines are returned, if given.
+        """
+        with self._lock:
+            lines = list(self._channels.get(channel, ()))
+        result = []
+        for entry in reversed(lines):
+            if nick is not None and entry.nick != nick:
+                continue
+            result.append(entry)
+            if limit is not None and len(result) >= limit:
+                break
+        return result
+
+    def last(self, channel, nick=None, skip=0):
+        """Return the latest line in ``channel`` (by ``nick``, if given).
+
+        ``skip`` lines are passed over first; since a line is recorded before
+        modules are triggered by it, ``skip=1`` gives the line before the one
+        being handled. Returns ``None`` if there is no such line.
+        """
+        lines = self.recent(channel, nick, skip + 1)
+        if len(lines) <= skip:
+            return None
+        return lines[skip]
+
+    def forget_channel(self, channel):
+        """Drop everything recorded for ``channel``."""
+        with self._lock:
+            lines = self._channels.pop(channel, None)
+            if lines:
+                self._size -= sum(len(entry.text) for entry in lines)
+
+    def channels(self):
+        """Return a list of the channels which have recorded lines."""
+        with self._lock:
+            return list(self._channels)
+
+    def stats(self):
+        """Return a dict with the number of ``channels``, ``lines`` and
+        ``bytes`` stored."""
+        with self._lock:
+            return {'channels': len(self._channels),
+                    'lines': sum(len(lines)
+                                 for lines in self._channels.values()),
+                    'bytes': self._size}
@@ -0,0 +1,141 @@
+# coding=utf-8
+"""The server features announced in ``RPL_ISUPPORT`` (005).
+
+*Availability: 6.4+*
+
+The bot keeps one :class:`ISupport` as ``bot.isupport``, filled in as the
+server sends its 005 lines while connecting. Where the server says nothing
+about a feature, the defaults are what Sopel assumed before it read them.
+"""
+from __future__ import unicode_literals, absolute_import, print_function, division
+
+import re
+
+_escape = re.compile(r'\\x([0-9A-Fa-f]{2})')
+
+
+class ISupport(object):
+    """The features the server supports, and their parameters.
+
+    Tokens can be read raw: ``'WHOX' in isupport`` tells whether it was
+    announced and ``isupport['NETWORK']`` (or :meth:`get`) gives its value, or
+    ``''`` if it has none. The properties give the commonly needed ones
+    parsed, with defaults for servers which don't announce them.
+    """
+    def __init__(self):
+        self._tokens = {}
+
+    def parse(self, tokens):
+        """Update from the tokens of one 005 line (without the bot's nick at
+        the start and the text at the end).
+
+        ``-NAME`` removes a feature the server no longer supports.
+        """
+        for token in tokens:
+            if token.startswith('-'):
+                self._tokens.pop(token[1:].upper(), None)
+                continue
+            name, _, value = token.partition('=')
+            value = _escape.sub(lambda m: '%c' % int(m.group(1), 16), value)
+            self._tokens[name.upper()] = value
+
+    def __contains__(self, name):
+        return name.upper() in self._tokens
+
+    def __getitem__(self, name):
+        return self._tokens[name.upper()]
+
+    def get(self, name, default=None):
+        """Return the value of the ``name`` token, or ``default``."""
+        return self._tokens.get(name.upper(), default)
+
+    def _int(self, name, default):
+        try:
+            return int(self._tokens[name])
+        except (KeyError, ValueError):
+            return default
+
+    @property
+    def prefix(self):
+        """The privilege modes and the prefixes for them in nick lists, as
+        a list of ``(mode, prefix)`` pairs, highest privilege first."""
+        value = self._tokens.get('PREFIX', '(qaohv)~&@%+')
+        match = re.match(r'\((\w*)\)(\S*)$', value)
+        if not match or len(match.group(1)) != len(match.group(2)):
+            return []
+        return list(zip(match.group(1), match.group(2)))
+
+    @property
+    def chantypes(self):
+        """The characters with which channel names start."""
+        return self._tokens.get('CHANTYPES', '#&+!')
+
+    @property
+    def chanmodes(self):
+        """The channel modes other than :attr:`prefix` ones, as four strings:
+        list modes (always with a parameter), modes always with a parameter,
+        modes with a parameter only when set, and modes without one."""
+        value = self._tokens.get('CHANMODES', 'beI,k,l,imnpst')
+        groups = value.split(',')
+        groups.extend([''] * (4 - len(groups)))
+        return tuple(groups[:4])
+
+    @property
+    def modes(self):
+        """The most modes with a parameter allowed in one MODE command, or
+        ``None`` if there's no limit."""
+        if 'MODES' in self._tokens and not self._tokens['MODES']:
+            return None
+        return self._int('MODES', 3)
+
+    @property
+    def targmax(self):
+        """The most targets each command accepts, as a dict of upper case
+        command names to a number, or to ``None`` if there's no limit."""
+        targmax = {}
+        for entry in self._tokens.get('TARGMAX', '').split(','):
+            command, _, limit = entry.partition(':')
+            if command:
+                targmax[command.upper()] = int(limit) if limit.isdigit() else None
+        return targmax
+
+    def max_targets(self, command):
+        """The most targets ``command`` accepts at once, or ``None`` if
+        there's no limit.
+
+        If the server doesn't say, that's no limit for JOIN and PART, which
+        have always taken lists, and 1 for anything else.
+        """
+        command = command.upper()
+        targmax = self.targmax
+        if command in targmax:
+            return targmax[command]
+        if command in ('JOIN', 'PART'):
+            return None
+        if command in ('PRIVMSG', 'NOTICE'):
+            return self._int('MAXTARGETS', 1)
+        return 1
+
+    @property
+    def linelen(self):
+        """The most bytes a line may have, including the CR-LF."""
+        return self._int('LINELEN', 512)
+
+    @property
+    def casemapping(self):
+        """How the server compares nicks and channels; see
+        :meth:`sopel.tools.Identifier.set_casemapping`."""
+        return self._tokens.get('CASEMAPPING', 'rfc1459')
+
+    @property
+    def whox(self):
+        """Whether the server supports the extended WHO syntax."""
+        return 'WHOX' in self._tokens
+
+    @property
+    def monitor(self):
+        """The most nicks that can be monitored, 0 if there's no limit, or
+        ``None`` if the server doesn't support MONITOR."""
+        if 'MONITOR' not in self._tokens:
+            return None
+        return self._int('MONITOR', 0)
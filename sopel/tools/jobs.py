@@ -19,6 +19,8 @@ try:
 except ImportError:
     import queue as Queue
 
+from sopel.tools.metrics import Histogram
+
 
 class released(object):
     """A context manager that releases a lock temporarily."""
@@ -34,12 +36,21 @@ class released(object):
 
 class PriorityQueue(Queue.PriorityQueue):
     """A priority queue with a peek method."""
-    def peek(self):
-        """Return a copy of the first element without removing it."""
+    def peek(self, timeout=None):
+        """Return a copy of the first element without removing it.
+
+        If the queue stays empty for ``timeout`` seconds, return None.
+        """
         self.not_empty.acquire()
         try:
+            end = None if timeout is None else time.time() + timeout
             while not self._qsize():
-                self.not_empty.wait()
+                if end is None:
+                    self.not_empty.wait()
+                elif end - time.time() > 0:
+                    self.not_empty.wait(end - time.time())
+                else:
+                    return None
             # Return a copy to avoid corrupting the heap. This is important
             # for thread safety if the object is mutable.
             return copy.deepcopy(self.queue[0])
@@ -75,6 +86,10 @@ class JobScheduler(threading.Thread):
         self._mutex = threading.Lock()
         # self.cleared is used for more fine grained locking.
         self._cleared = False
+        # The job being run, which is out of the queue in the meantime.
+        self._running = None
+        self.lag = Histogram()
+        """How late each job started, compared to when it was due."""
 
     def add_job(self, job):
         """Add a Job to the current job queue."""
@@ -82,13 +97,33 @@ class JobScheduler(threading.Thread):
 
     def clear_jobs(self):
         """Clear current Job queue and start fresh."""
-        if self._jobs.empty():
-            # Guards against getting stuck waiting for self._mutex when
-            # thread is waiting for self._jobs to not be empty.
-            return
         with self._mutex:
             self._cleared = True
-            self._jobs = PriorityQueue()
+            self._take_jobs()
+
+    def remove_jobs(self, funcs):
+        """Remove the Jobs which call any of ``funcs``, keeping the others."""
+        funcs = set(funcs)
+        with self._mutex:
+            # A job is either in the queue or running, as long as the mutex
+            # is held.
+            running = self._running
+            if running is not None and running.func in funcs:
+                running.cancelled = True
+            for job in self._take_jobs():
+                if job.func not in funcs:
+                    self._jobs.put(job)
+
+    def _take_jobs(self):
+        """Empty the queue (in place, as the run loop may be waiting on it),
+        returning the jobs which were in it. Must be called with the mutex
+        held."""
+        jobs = []
+        while True:
+            try:
+                jobs.append(self._jobs.get_nowait())
+            except Queue.Empty:
+                return jobs
 
     def run(self):
         """Run forever."""
@@ -111,7 +146,13 @@ class JobScheduler(threading.Thread):
             # Wait until the next job should be executed.
             # This has to be a loop, because signals stop time.sleep().
             while True:
-                job = self._jobs.peek()
+                job = self._jobs.peek(0)
+                if job is None:
+                    # Wait for a job without the mutex, so that jobs can be
+                    # cleared or removed meanwhile.
+                    with released(self._mutex):
+                        self._jobs.peek()
+                    continue
                 difference = job.next_time - time.time()
                 duration = min(difference, self.min_reaction_time)
                 if duration <= 0:
@@ -121,6 +162,8 @@ class JobScheduler(threading.Thread):
 
             self._cleared = False
             job = self._jobs.get()
+            self._running = job
+            self.lag.observe(max(0, time.time() - job.next_time))
             with released(self._mutex):
                 if job.func.thread:
                     t = threading.Thread(
@@ -130,18 +173,28 @@ class JobScheduler(threading.Thread):
                 else:
                     self._call(job.func)
                 job.next()
-            # If jobs were cleared during the call, don't put an old job
-            # into the new job queue.
-            if not self._cleared:
+            self._running = None
+            # If jobs were cleared or removed during the call, don't put an
+            # old job into the new job queue.
+            if not self._cleared and not job.cancelled:
                 self._jobs.put(job)
 
     def _call(self, func):
         """Wrapper for collecting errors from modules."""
         # Sopel.bot.call is way too specialized to be used instead.
+        metrics = self.bot.metrics
+        profiler = metrics.start_profile(func)
+        start = time.time()
         try:
             func(self.bot)
         except Exception:
+            metrics.record_call(func, time.time() - start, error=True)
             self.bot.error()
+        else:
+            metrics.record_call(func, time.time() - start)
+        finally:
+            if profiler is not None:
+                metrics.finish_profile(func, profiler)
 
 
 class Job(object):
@@ -178,6 +231,7 @@ class Job(object):
         self.next_time = time.time() + interval
         self.interval = interval
         self.func = func
+        self.cancelled = False
 
     def next(self):
         """Update self.next_time with the assumption func was just called.
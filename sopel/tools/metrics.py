@@ -0,0 +1,264 @@
+# coding=utf-8
+"""Timing and error statistics for module callables and jobs.
+
+*Availability: 6.4+*
+
+The bot keeps one :class:`Metrics` as ``bot.metrics``. Every triggered
+callable and every job run by the scheduler is timed into it, along with
+errors and calls refused because of a rate limit.
+"""
+from __future__ import unicode_literals, absolute_import, print_function, division
+
+import bisect
+import collections
+import cProfile
+import os
+import pstats
+import threading
+import time
+
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10, 60)
+"""The upper bounds, in seconds, of the buckets used for call durations."""
+
+
+class Histogram(object):
+    """Counts of observed values, bucketed by upper bound.
+
+    ``counts[i]`` is the number of values no greater than ``buckets[i]`` (and
+    greater than the previous bound); the last count is for values greater
+    than every bound.
+    """
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def quantile(self, q):
+        """Estimate the ``q`` quantile (e.g. 0.95), as a bucket bound."""
+        if not self.count:
+            return 0.0
+        target = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= target:
+                return bound
+        return self.max
+
+
+def format_histogram(name, histogram, labels=None):
+    """Return the lines describing ``histogram`` in the Prometheus text
+    format, as the metric ``name`` with the given ``labels`` dict."""
+    labels = sorted((labels or {}).items())
+
+    def label_text(extra=()):
+        pairs = labels + list(extra)
+        if not pairs:
+            return ''
+        return '{%s}' % ','.join(
+            '%s="%s"' % (key, ('%s' % value).replace('\\', '\\\\')
+                                            .replace('"', '\\"'))
+            for key, value in pairs)
+
+    lines = []
+    cumulative = 0
+    for bound, count in zip(histogram.buckets, histogram.counts):
+        cumulative += count
+        lines.append('%s_bucket%s %d' % (
+            name, label_text([('le', repr(float(bound)))]), cumulative))
+    lines.append('%s_bucket%s %d' % (
+        name, label_text([('le', '+Inf')]), histogram.count))
+    lines.append('%s_sum%s %r' % (name, label_text(), histogram.sum))
+    lines.append('%s_count%s %d' % (name, label_text(), histogram.count))
+    return lines
+
+
+class CallableStats(object):
+    """What is known about one callable or job."""
+    def __init__(self, name, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.calls = 0
+        self.errors = 0
+        self.rejected = {}
+        """Calls refused by a rate limit, by limit (``'user'``,
+        ``'channel'`` or ``'global'``)."""
+        self.durations = Histogram(buckets)
+        self.last_profile = None
+        """The report of the latest profiled call, if any."""
+
+    def as_dict(self):
+        return {
+            'calls': self.calls,
+            'errors': self.errors,
+            'rejected': dict(self.rejected),
+            'total_seconds': self.durations.sum,
+            'max_seconds': self.durations.max,
+            'buckets': list(self.durations.buckets),
+            'bucket_counts': list(self.durations.counts),
+        }
+
+
+def callable_name(func):
+    """Return the ``module.function`` name under which ``func`` is counted.
+
+    Names rather than function objects are used, so that a module's counts
+    carry on when it is reloaded.
+    """
+    return '%s.%s' % (func.__module__, getattr(func, '__name__', repr(func)))
+
+
+class Metrics(object):
+    """Statistics for every callable and job the bot has run.
+
+    If ``profile_every`` is set, every that-many-th call of each callable is
+    run under :mod:`cProfile`. If ``profile_slower_than`` is set, a callable
+    whose call took longer than that many seconds has its next call
+    profiled. Profiles are written to ``profile_dir``, if given, and a short
+    report is kept in :attr:`CallableStats.last_profile`. Only one call is
+    profiled at a time.
+    """
+    def __init__(self, profile_every=0, profile_slower_than=0,
+                 profile_dir=None):
+        self.profile_every = profile_every
+        self.profile_slower_than = profile_slower_than
+        self.profile_dir = profile_dir
+        self.started = time.time()
+
+        # These are each only updated by one thread at a time (the thread
+        # reading from the server, or one holding the bot's writing lock), so
+        # they need no locking of their own.
+        self.lines_received = 0
+        """The number of lines received from the server."""
+        self.lines_sent = 0
+        """The number of lines sent to the server."""
+        self.dispatch_durations = Histogram()
+        """How long handing each received line to the callables took."""
+        self.send_waiting = collections.deque()
+        """Holds one item for each message waiting for its turn to be sent;
+        appending to and popping from a deque is atomic."""
+
+        self._stats = {}
+        self._lock = threading.Lock()
+        self._profile_next = set()
+        self._profiling = threading.Lock()
+
+    def _get(self, name):
+        # Must be called with the lock held.
+        stats = self._stats.get(name)
+        if stats is None:
+            stats = self._stats[name] = CallableStats(name)
+        return stats
+
+    def record_call(self, func, seconds, error=False):
+        """Count a call of ``func`` which took ``seconds``."""
+        name = callable_name(func)
+        with self._lock:
+            stats = self._get(name)
+            stats.calls += 1
+            if error:
+                stats.errors += 1
+            stats.durations.observe(seconds)
+            if self.profile_slower_than and seconds > self.profile_slower_than:
+                self._profile_next.add(name)
+
+    def record_rejection(self, func, limit):
+        """Count a call of ``func`` refused by the ``limit`` rate limit."""
+        with self._lock:
+            rejected = self._get(callable_name(func)).rejected
+            rejected[limit] = rejected.get(limit, 0) + 1
+
+    def start_profile(self, func):
+        """Return an enabled profiler if this call of ``func`` should be
+        profiled, or ``None``. Pass it to :meth:`finish_profile` afterwards.
+        """
+        if not self.profile_every and not self.profile_slower_than:
+            return None
+        name = callable_name(func)
+        with self._lock:
+            stats = self._stats.get(name)
+            calls = stats.calls if stats else 0
+            wanted = (name in self._profile_next or
+                      (self.profile_every and
+                       (calls + 1) % self.profile_every == 0))
+        if not wanted or not self._profiling.acquire(False):
+            return None
+        with self._lock:
+            self._profile_next.discard(name)
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # Some other profiler is already running in this process
+            self._profiling.release()
+            return None
+        return profiler
+
+    def finish_profile(self, func, profiler):
+        """Stop ``profiler`` and keep its report for ``func``."""
+        profiler.disable()
+        self._profiling.release()
+        name = callable_name(func)
+        if self.profile_dir:
+            filename = os.path.join(
+                self.profile_dir, '%s-%d.prof' % (name, time.time()))
+            try:
+                profiler.dump_stats(filename)
+            except (IOError, OSError):
+                pass
+        output = StringIO()
+        stats = pstats.Stats(profiler, stream=output)
+        stats.sort_stats('cumulative').print_stats(15)
+        with self._lock:
+            self._get(name).last_profile = output.getvalue()
+
+    def get(self, name):
+        """Return the :class:`CallableStats` for ``name``, or ``None``."""
+        with self._lock:
+            return self._stats.get(name)
+
+    def top(self, key='total', limit=5):
+        """Return the ``limit`` busiest callables' :class:`CallableStats`.
+
+        ``key`` is ``'total'`` (time), ``'max'`` (time), ``'calls'`` or
+        ``'errors'``.
+        """
+        keys = {
+            'total': lambda stats: stats.durations.sum,
+            'max': lambda stats: stats.durations.max,
+            'calls': lambda stats: stats.calls,
+            'errors': lambda stats: stats.errors,
+        }
+        with self._lock:
+            stats = list(self._stats.values())
+        return sorted(stats, key=keys[key], reverse=True)[:limit]
+
+    def snapshot(self):
+        """Return all statistics as a dict of plain values, e.g. for JSON."""
+        with self._lock:
+            return {
+                'started': self.started,
+                'time': time.time(),
+                'callables': dict((name, stats.as_dict())
+                                  for name, stats in self._stats.items()),
+            }
+
+    def reset(self):
+        """Forget everything recorded so far."""
+        with self._lock:
+            self._stats.clear()
+            self._profile_next.clear()
+            self.started = time.time()
@@ -0,0 +1,210 @@
+# coding=utf-8
+"""Bookkeeping for the ``rate``, ``channel_rate`` and ``global_rate`` limits,
+and a token bucket for modules which limit their own requests.
+
+*Availability: 6.4+*
+"""
+from __future__ import unicode_literals, absolute_import, print_function, division
+
+import threading
+import time
+
+
+class RateLimiter(object):
+    """Remembers when rate-limited callables were last used.
+
+    A callable with ``rate = 10`` may be used once every 10 seconds by each
+    nick; ``channel_rate`` and ``global_rate`` limit it likewise per channel
+    and overall. Each of those is a token bucket holding a single token,
+    which refills after the limit's number of seconds; all that needs to be
+    kept for it is when the token was last taken.
+
+    Only callables which declare a limit are tracked. An entry stops
+    mattering once its limit has passed, so such entries are pruned every
+    ``prune_interval`` seconds; the memory used is bounded by the number of
+    nicks and channels active within the longest limit, not by everyone who
+    ever used the bot.
+    """
+    def __init__(self, prune_interval=60):
+        self.prune_interval = prune_interval
+        # func -> {'user': {nick: t}, 'channel': {...}, 'global': t}
+        self._used = {}
+        self._lock = threading.Lock()
+        self._last_prune = time.time()
+
+    @staticmethod
+    def is_limited(func):
+        """Whether ``func`` declares any rate limit."""
+        return bool(getattr(func, 'rate', 0) or
+                    getattr(func, 'channel_rate', 0) or
+                    getattr(func, 'global_rate', 0))
+
+    def check(self, func, nick, channel=None, now=None):
+        """Return why ``nick`` may not use ``func`` in ``channel`` now.
+
+        The result is ``None`` if the call is allowed, or a tuple of the
+        limit which prevents it (``'user'``, ``'global'`` or ``'channel'``),
+        the seconds since the last use, and the limit's number of seconds.
+        ``channel`` is ``None`` for private messages.
+        """
+        if not self.is_limited(func):
+            return None
+        if now is None:
+            now = time.time()
+        with self._lock:
+            return self._check(func, nick, channel, now)
+
+    def acquire(self, func, nick, channel=None, now=None):
+        """Check and record a use of ``func`` in one step.
+
+        Returns what :meth:`check` would, and records the use only if it is
+        allowed. Unlike calling :meth:`check` then :meth:`record`, several
+        threads can't all pass the check before any of them records.
+        """
+        if not self.is_limited(func):
+            return None
+        if now is None:
+            now = time.time()
+        with self._lock:
+            limited = self._check(func, nick, channel, now)
+            if limited is None:
+                self._record(func, nick, channel, now)
+            return limited
+
+    def release(self, func, nick, channel=None, now=None):
+        """Take back a use recorded by :meth:`acquire` at ``now``.
+
+        Any use before it had already stopped limiting anything, or the
+        acquisition wouldn't have been allowed, so it is simply forgotten.
+        """
+        if not self.is_limited(func):
+            return
+        with self._lock:
+            used = self._used.get(func)
+            if used is None:
+                return
+            if used['user'].get(nick) == now:
+                del used['user'][nick]
+            if channel is not None and used['channel'].get(channel) == now:
+                del used['channel'][channel]
+            if used['global'] == now:
+                used['global'] = None
+
+    def _check(self, func, nick, channel, now):
+        # Must be called with the lock held.
+        used = self._used.get(func)
+        if used is None:
+            return None
+        checks = [('user', func.rate, used['user'].get(nick)),
+                  ('global', func.global_rate, used['global'])]
+        if channel is not None:
+            checks.append(('channel', func.channel_rate,
+                           used['channel'].get(channel)))
+        for limit, rate, last in checks:
+            if rate > 0 and last is not None and now - last < rate:
+                return (limit, now - last, rate)
+        return None
+
+    def record(self, func, nick, channel=None, now=None):
+        """Note that ``nick`` used ``func`` in ``channel`` at ``now``."""
+        if not self.is_limited(func):
+            return
+        if now is None:
+            now = time.time()
+        with self._lock:
+            self._record(func, nick, channel, now)
+
+    def _record(self, func, nick, channel, now):
+        # Must be called with the lock held.
+        used = self._used.get(func)
+        if used is None:
+            used = self._used[func] = {'user': {}, 'channel': {},
+                                       'global': None}
+        used['user'][nick] = now
+        used['global'] = now
+        if channel is not None:
+            used['channel'][channel] = now
+        if now - self._last_prune >= self.prune_interval:
+            self._prune(now)
+
+    def _prune(self, now):
+        # Must be called with the lock held.
+        self._last_prune = now
+        for func, used in list(self._used.items()):
+            for limit, rate in (('user', func.rate),
+                                ('channel', func.channel_rate)):
+                entries = used[limit]
+                for key, last in list(entries.items()):
+                    if now - last >= rate:
+                        del entries[key]
+            if used['global'] is not None and \
+                    now - used['global'] >= func.global_rate:
+                used['global'] = None
+            if (not used['user'] and not used['channel'] and
+                    used['global'] is None):
+                del self._used[func]
+
+    def prune(self, now=None):
+        """Forget every use which no longer limits anything."""
+        with self._lock:
+            self._prune(time.time() if now is None else now)
+
+    def times(self, bot_nick):
+        """Return the recorded uses as the bot's old ``times`` dict.
+
+        That maps each nick and channel to a dict of callables to when they
+        last used it; global uses are under ``bot_nick``.
+        """
+        times = {}
+        with self._lock:
+            for func, used in self._used.items():
+                for limit in ('user', 'channel'):
+                    for key, last in used[limit].items():
+                        times.setdefault(key, {})[func] = last
+                if used['global'] is not None:
+                    times.setdefault(bot_nick, {})[func] = used['global']
+        return times
+
+    def __len__(self):
+        """The number of uses being remembered."""
+        with self._lock:
+            return sum(len(used['user']) + len(used['channel']) +
+                       (used['global'] is not None)
+                       for used in self._used.values())
+
+
+class TokenBucket(object):
+    """A thread-safe token bucket allowing ``rate`` acquisitions per ``per``
+    seconds, with bursts of up to ``rate``."""
+    def __init__(self, rate, per=60.0):
+        self.rate = float(rate)
+        self.per = float(per)
+        self._tokens = self.rate
+        self._last = time.time()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        elapsed = now - self._last
+        self._last = now
+        self._tokens = min(self.rate,
+                           self._tokens + elapsed * self.rate / self.per)
+
+    def acquire(self, timeout=None):
+        """Take a token, waiting up to ``timeout`` seconds for one.
+
+        Returns ``True`` if a token was taken, ``False`` if the timeout ran
+        out first. A ``timeout`` of ``None`` waits as long as needed.
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        while True:
+            with self._lock:
+                now = time.time()
+                self._refill(now)
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return True
+                wait = (1 - self._tokens) * self.per / self.rate
+            if deadline is not None:
+                if now + wait > deadline:
+                    return False
+            time.sleep(wait)
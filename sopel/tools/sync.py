@@ -0,0 +1,237 @@
+# coding=utf-8
+"""Pacing the joining of channels, and tracking when they're synced.
+
+*Availability: 6.4+*
+
+On connect, the bot joins every configured channel and then asks for each
+one's users with WHO. Sending all of that at once trips the flood
+protection of most servers when there are many channels. The bot keeps one
+:class:`ChannelSync` as ``bot.channel_sync``, which sends these requests at
+a steady rate, most important channels first, and records how far along
+each channel is.
+
+A module which needs a channel's full user list can wait for it::
+
+    if bot.channel_sync.wait(channel, timeout=30):
+        users = bot.channels[channel].users
+"""
+from __future__ import unicode_literals, absolute_import, print_function, division
+
+import heapq
+import itertools
+import threading
+import time
+
+from sopel.tools import Identifier
+
+QUEUED = 'queued'
+"""The channel is waiting for its turn to be joined."""
+JOINING = 'joining'
+"""JOIN has been sent for the channel."""
+JOINED = 'joined'
+"""The bot is in the channel, and is waiting to ask for its users."""
+WHO = 'who'
+"""WHO has been sent for the channel, and the reply hasn't ended yet."""
+SYNCED = 'synced'
+"""The bot is in the channel and knows who else is."""
+WHO_TIMEOUT = 'who_timeout'
+"""The bot is in the channel, but the WHO reply never came, so it may not
+know everyone who else is."""
+
+
+class ChannelSync(object):
+    """Sends JOIN and WHO requests at most ``rate`` per second.
+
+    Up to ``burst`` requests can be sent at once after a quiet spell, and
+    at most ``max_who`` WHO replies are waited for at a time (a WHO which
+    gets no reply within ``who_timeout`` seconds is given up on). Requests
+    are sent lowest ``priority`` first; a channel keeps the priority it was
+    joined with for its WHO, so an important channel is synced before a
+    less important one is even joined.
+    """
+    def __init__(self, bot, rate=2.0, burst=5, max_who=2, who_timeout=60):
+        self.bot = bot
+        self.rate = rate
+        self.burst = burst
+        self.max_who = max_who
+        self.who_timeout = who_timeout
+        self._cond = threading.Condition()
+        self._queue = []  # heap of (priority, seq, channel, send)
+        self._seq = itertools.count()
+        self._state = {}
+        self._priority = {}
+        self._synced = {}  # channel -> Event
+        self._who_sent = {}  # channel -> time
+        self._tokens = burst
+        self._refilled = time.time()
+        self._thread = None
+
+    def join(self, channel, key=None, priority=0):
+        """Join ``channel`` when its turn comes.
+
+        Channels the bot was asked to join while running should have
+        priority 0, to be joined before any waiting from connect.
+        """
+        channel = Identifier(channel)
+        with self._cond:
+            if self._state.get(channel) not in (None, QUEUED):
+                return
+            self._state[channel] = QUEUED
+            self._priority[channel] = priority
+            self._push(channel, priority,
+                       lambda: self._start_join(channel, key))
+
+    def joined(self, channel, send_who):
+        """Note that the bot joined ``channel``; call ``send_who`` (which
+        should send a WHO for it) when its turn comes."""
+        channel = Identifier(channel)
+        with self._cond:
+            self._state[channel] = JOINED
+            self._event(channel).clear()
+            priority = self._priority.setdefault(channel, 0)
+            self._push(channel, priority,
+                       lambda: self._start_who(channel, send_who))
+
+    def who_done(self, channel):
+        """Note that the WHO reply for ``channel`` has ended."""
+        channel = Identifier(channel)
+        with self._cond:
+            if self._who_sent.pop(channel, None) is None:
+                return  # Someone else's WHO
+            self._state[channel] = SYNCED
+            self._event(channel).set()
+            self._cond.notify()
+
+    def parted(self, channel):
+        """Forget ``channel``, which the bot has left."""
+        channel = Identifier(channel)
+        with self._cond:
+            self._state.pop(channel, None)
+            self._priority.pop(channel, None)
+            self._who_sent.pop(channel, None)
+            self._event(channel).clear()
+            self._cond.notify()
+
+    def reset(self):
+        """Forget every channel, e.g. after reconnecting."""
+        with self._cond:
+            self._queue = []
+            self._state.clear()
+            self._priority.clear()
+            self._who_sent.clear()
+            for event in self._synced.values():
+                event.clear()
+            self._tokens = self.burst
+
+    def state(self, channel):
+        """Return how far along ``channel`` is (one of the constants in this
+        module), or ``None`` if it isn't known."""
+        return self._state.get(Identifier(channel))
+
+    def is_synced(self, channel):
+        """Whether the bot is in ``channel`` and knows who else is."""
+        return self.state(channel) == SYNCED
+
+    def wait(self, channel, timeout=None):
+        """Wait until ``channel`` is synced. Returns whether it is.
+
+        Stops waiting, returning False, if the channel's WHO times out.
+
+        Don't call this from a callable with ``thread(False)``; nothing more
+        is received from the server while it waits.
+        """
+        with self._cond:
+            event = self._event(Identifier(channel))
+        return event.wait(timeout) and self.is_synced(channel)
+
+    def progress(self):
+        """Return a dict of the number of channels in each state."""
+        counts = {}
+        with self._cond:
+            for state in self._state.values():
+                counts[state] = counts.get(state, 0) + 1
+        return counts
+
+    def _event(self, channel):
+        # Must be called with the lock held.
+        event = self._synced.get(channel)
+        if event is None:
+            event = self._synced[channel] = threading.Event()
+        return event
+
+    def _push(self, channel, priority, send):
+        # Must be called with the lock held.
+        heapq.heappush(self._queue, (priority, next(self._seq), channel, send))
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run,
+                                            name='ChannelSync')
+            self._thread.daemon = True
+            self._thread.start()
+        self._cond.notify()
+
+    # These are called with the lock held, and return a function which
+    # sends the request once the lock is released, or None if it's no longer
+    # needed. Sending takes other locks, and the thread reading from the
+    # server needs this one meanwhile.
+
+    def _start_join(self, channel, key):
+        if self._state.get(channel) != QUEUED:
+            return None
+        self._state[channel] = JOINING
+        return lambda: self.bot.coalescer.join(channel, key)
+
+    def _start_who(self, channel, send_who):
+        if self._state.get(channel) != JOINED:
+            return None
+        self._state[channel] = WHO
+        self._who_sent[channel] = time.time()
+        return send_who
+
+    def _next(self, now):
+        # Must be called with the lock held. Returns the next request which
+        # can be sent now, or None.
+        for channel, sent in list(self._who_sent.items()):
+            if now - sent > self.who_timeout:
+                del self._who_sent[channel]
+                self._state[channel] = WHO_TIMEOUT
+                # Waiters stop waiting, but aren't told it's synced
+                self._event(channel).set()
+        skipped = []
+        found = None
+        while self._queue:
+            entry = heapq.heappop(self._queue)
+            waiting_who = self._state.get(entry[2]) == JOINED
+            if waiting_who and len(self._who_sent) >= self.max_who:
+                skipped.append(entry)
+                continue
+            found = entry
+            break
+        for entry in skipped:
+            heapq.heappush(self._queue, entry)
+        return found
+
+    def _run(self):
+        while True:
+            with self._cond:
+                now = time.time()
+                self._tokens = min(
+                    self.burst,
+                    self._tokens + (now - self._refilled) * self.rate)
+                self._refilled = now
+                if self._tokens < 1:
+                    self._cond.wait((1 - self._tokens) / self.rate)
+                    continue
+                entry = self._next(now)
+                if entry is None:
+                    # Nothing to send until a request is added or a WHO
+                    # ends (or times out)
+                    self._cond.wait(1 if self._who_sent else None)
+                    continue
+                send = entry[3]()
+                if send is None:
+                    continue
+                self._tokens -= 1
+            try:
+                send()
+            except Exception:
+                self.bot.error()
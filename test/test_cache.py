@@ -0,0 +1,98 @@
+# coding=utf-8
+"""Tests for sopel.tools.cache"""
+from __future__ import unicode_literals, absolute_import, print_function, division
+
+import sqlite3
+
+import pytest
+
+from sopel.modules.url import TitleCache
+from sopel.tools import normalize_url
+from sopel.tools.cache import ExpiringLRUCache
+
+
+def test_get_set():
+    cache = ExpiringLRUCache(4)
+    cache.set('a', 1)
+    assert cache.get('a') == 1
+    assert cache.get('b') is None
+    assert cache.get('b', 'default') == 'default'
+    assert 'a' in cache
+    assert 'b' not in cache
+    assert cache.hits == 1
+    assert cache.misses == 2
+    assert cache.hit_rate == pytest.approx(1 / 3)
+
+
+def test_evicts_least_recently_used():
+    cache = ExpiringLRUCache(2)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    cache.get('a')
+    cache.set('c', 3)
+    assert len(cache) == 2
+    assert 'a' in cache
+    assert 'b' not in cache
+    assert 'c' in cache
+
+
+def test_ttl():
+    cache = ExpiringLRUCache(4, ttl=60)
+    cache.set('a', 1)
+    cache.set('b', 2, ttl=-1)
+    cache.set('c', 3, ttl=None)
+    assert cache.get('a') == 1
+    assert cache.get('b') is None
+    assert cache.get('c') == 3
+    assert cache.expire() == 0  # 'b' was already dropped by the lookup
+    cache.set('d', 4, ttl=-1)
+    assert len(cache) == 2
+    assert cache.expire() == 1
+    assert sorted(cache.items()) == [('a', 1), ('c', 3)]
+
+
+def test_pop_and_clear():
+    cache = ExpiringLRUCache(4)
+    cache.set('a', 1)
+    assert cache.pop('a') == 1
+    assert cache.pop('a', 'gone') == 'gone'
+    cache.set('b', 2)
+    cache.get('b')
+    cache.clear()
+    assert len(cache) == 0
+    assert cache.hits == cache.misses == 0
+
+
+def test_invalid_size():
+    with pytest.raises(ValueError):
+        ExpiringLRUCache(0)
+
+
+def test_normalize_url():
+    assert normalize_url('HTTP://Example.COM') == 'http://example.com/'
+    assert (normalize_url('https://example.com:443/a?b=c#frag') ==
+            'https://example.com/a?b=c')
+    assert (normalize_url('http://example.com:8080/') ==
+            'http://example.com:8080/')
+
+
+def test_title_cache():
+    cache = TitleCache(8, ttl=60, negative_ttl=-1)
+    cache.put('http://short.example/x', 'Title', 'http://example.com/page')
+    assert cache.get('HTTP://example.com/page#top')['title'] == 'Title'
+    assert cache.get('http://short.example/x')['url'] == (
+        'http://example.com/page')
+    # Failures are only remembered for negative_ttl
+    cache.put('http://example.com/broken', None)
+    assert cache.get('http://example.com/broken') is None
+    assert len(cache) == 2
+    assert (cache.hits, cache.misses) == (2, 1)
+
+
+def test_title_cache_database():
+    db = sqlite3.connect(':memory:')
+    TitleCache(8, ttl=60, negative_ttl=60, db=db).put(
+        'http://example.com/', 'Title')
+    cache = TitleCache(8, ttl=60, negative_ttl=60, db=db)
+    assert cache.get('http://example.com')['title'] == 'Title'
+    assert cache.get('http://example.com/other') is None
@@ -0,0 +1,70 @@
+# coding=utf-8
+"""Tests for sopel.tools.calculation"""
+from __future__ import unicode_literals, absolute_import, print_function, division
+
+import time
+
+import pytest
+
+from sopel.tools.calculation import (eval_equation, EvaluatorPool,
+                                     ExpressionEvaluator)
+
+
+def sleep_for(expression):
+    # Evaluator for the pool; must be importable by its worker processes
+    time.sleep(float(expression))
+    return expression
+
+
+def test_eval_equation():
+    assert eval_equation('2*(1+2)**2') == 18
+    pytest.raises(ZeroDivisionError, eval_equation, '1/0')
+    pytest.raises(ValueError, eval_equation, '9**9**9')
+
+
+def test_pool_evaluates_and_caches():
+    pool = EvaluatorPool(eval_equation, processes=1)
+    try:
+        assert pool('5 // 2') == 2
+        assert pool.cache.get('5 // 2') == (True, 2)
+        pytest.raises(ZeroDivisionError, pool, '1/0')
+        pytest.raises(SyntaxError, pool, '1+')
+        # Cached errors are raised afresh each time
+        first = pytest.raises(ZeroDivisionError, pool, '1/0').value
+        second = pytest.raises(ZeroDivisionError, pool, '1/0').value
+        assert first is not second
+        assert first.args == second.args
+    finally:
+        pool.close()
+
+
+def test_pool_stops_when_all_users_close():
+    pool = EvaluatorPool(eval_equation, processes=1)
+    try:
+        pool.start()
+        pool.start()
+        assert pool('1+1') == 2
+        pool.close()
+        # Still running for the other user
+        assert pool._workers
+        assert pool('2+2') == 4
+        pool.close()
+        assert not pool._workers
+    finally:
+        pool.close()
+
+
+def test_pool_kills_on_timeout():
+    pool = EvaluatorPool(sleep_for, processes=1, timeout=0.2)
+    try:
+        start = time.time()
+        pytest.raises(ExpressionEvaluator.Error, pool, '10')
+        assert time.time() - start < 5
+        # The killed worker was replaced
+        assert pool('0') == '0'
+        # A repeat doesn't tie up a worker again
+        start = time.time()
+        pytest.raises(ExpressionEvaluator.Error, pool, '10')
+        assert time.time() - start < 0.1
+    finally:
+        pool.close()
@@ -0,0 +1,71 @@
+# coding=utf-8
+"""Tests for sopel.tools.coalesce"""
+from __future__ import unicode_literals, absolute_import, print_function, division
+
+from sopel.test_tools import MockSopel, wait_for
+from sopel.tools.coalesce import Coalescer
+
+
+def make_bot(*tokens):
+    bot = MockSopel('Sopel')
+    bot.isupport.parse(tokens)
+    return bot
+
+
+def test_joins_combined():
+    bot = make_bot()
+    coalescer = Coalescer(bot, window=0.05)
+    coalescer.join('#first')
+    # Nothing was held, so the first goes right away
+    assert bot.written == ['JOIN #first']
+    coalescer.join('#spam')
+    coalescer.join('#eggs', 'secret')
+    coalescer.join('#spam')
+    coalescer.join('#first')
+    assert bot.written == ['JOIN #first']
+    wait_for(lambda: len(bot.written) > 1)
+    assert bot.written == ['JOIN #first', 'JOIN #eggs,#spam secret']
+
+
+def test_joins_split_by_line_length():
+    bot = make_bot('LINELEN=40')
+    coalescer = Coalescer(bot)
+    channels = ['#channel%d' % i for i in range(6)]
+    lines = coalescer.lines(('JOIN',), [(c, None) for c in channels])
+    assert [args for args, _ in lines] == [
+        ['JOIN', '#channel0,#channel1,#channel2'],
+        ['JOIN', '#channel3,#channel4,#channel5'],
+    ]
+    for args, _ in lines:
+        assert len(' '.join(args)) + 2 <= 40
+
+
+def test_modes_limited_by_modes_token():
+    bot = make_bot('MODES=2')
+    coalescer = Coalescer(bot)
+    lines = coalescer.lines(('MODE', '#chan'), [
+        ('+b', 'a!*@*'), ('+m', None), ('+b', 'b!*@*'), ('-q', 'c!*@*')])
+    assert [' '.join(args) for args, _ in lines] == [
+        'MODE #chan +bmb a!*@* b!*@*',
+        'MODE #chan -q c!*@*',
+    ]
+
+
+def test_kicks_limited_by_targmax():
+    bot = make_bot('TARGMAX=KICK:2')
+    coalescer = Coalescer(bot)
+    lines = coalescer.lines(('KICK', '#chan', 'Bye'), ['spam', 'eggs', 'ham'])
+    assert lines == [(['KICK', '#chan', 'spam,eggs'], 'Bye'),
+                     (['KICK', '#chan', 'ham'], 'Bye')]
+    bot = make_bot('TARGMAX=KICK:')
+    coalescer = Coalescer(bot)
+    lines = coalescer.lines(('KICK', '#chan', 'Bye'), ['spam', 'eggs', 'ham'])
+    assert lines == [(['KICK', '#chan', 'spam,eggs,ham'], 'Bye')]
+
+
+def test_no_window_sends_right_away():
+    bot = make_bot()
+    coalescer = Coalescer(bot, window=0)
+    coalescer.kick('#chan', 'spam', 'Bye')
+    coalescer.kick('#chan', 'eggs', 'Bye')
+    assert bot.written == ['KICK #chan spam :Bye', 'KICK #chan eggs :Bye']
@@ -0,0 +1,30 @@
+# coding=utf-8
+"""Tests for sopel.modules.find"""
+from __future__ import unicode_literals, absolute_import, print_function, division
+
+from sopel.modules import find
+from sopel.test_tools import MockSopel
+
+
+def test_channel_history_bounded():
+    history = find.ChannelHistory(lines_per_nick=2, max_nicks=2)
+    for line in ('one', 'two', 'three'):
+        history.add('spam', line)
+    assert history.lines('spam') == ['two', 'three']
+    history.add('eggs', 'hello')
+    history.add('spam', 'four')  # Now the most recently active
+    history.add('ham', 'hi')
+    assert 'eggs' not in history
+    assert history.stats() == {'nicks': 2, 'lines': 3}
+
+
+def test_history_stats():
+    bot = MockSopel('Sopel')
+    find.setup(bot)
+    assert find.history_stats(bot) == {'channels': 0, 'nicks': 0, 'lines': 0}
+    for channel in ('#a', '#b'):
+        history = find.ChannelHistory()
+        history.add('spam', 'one')
+        history.add('eggs', 'two')
+        bot.memory['find_lines'][channel] = history
+    assert find.history_stats(bot) == {'channels': 2, 'nicks': 4, 'lines': 4}
@@ -4,7 +4,8 @@ from __future__ import unicode_literals, absolute_import, print_function, divisi
 
 import pytest
 
-from sopel.formatting import colors, color, bold, underline
+from sopel.formatting import (colors, color, bold, underline, italic,
+                               hex_color, plain, split)
 
 
 def test_color():
@@ -24,3 +25,65 @@ def test_bold():
 def test_underline():
     text = 'Hello World'
     assert underline(text) == '\x1f' + text + '\x1f'
+
+
+def test_italic():
+    text = 'Hello World'
+    assert italic(text) == '\x1d' + text + '\x1d'
+
+
+def test_hex_color():
+    text = 'Hello World'
+    assert hex_color(text) == text
+    assert hex_color(text, '#ff8800') == '\x04FF8800' + text + '\x04'
+    assert (hex_color(text, 'FF8800', '000000') ==
+            '\x04FF8800,000000' + text + '\x04')
+    pytest.raises(ValueError, hex_color, text, '#FF88')
+
+
+def test_plain():
+    assert plain(color('red', colors.RED, colors.BLACK) + ' text') == 'red text'
+    assert plain('\x0304,text') == ',text'
+    assert plain('\x03123') == '3'
+    assert plain(hex_color('hex', '123456', 'ABCDEF')) == 'hex'
+    assert plain('\x02b\x1di\x1eo\x11m\x16r\x1fu\x0fn') == 'biomrun'
+    assert plain('nothing to see') == 'nothing to see'
+
+
+def test_split_on_spaces():
+    assert split('Hello World', 20) == ['Hello World']
+    assert split('Hello World again', 11) == ['Hello World', 'again']
+    assert split('abcdefgh', 3) == ['abc', 'def', 'gh']
+    # Runs of spaces don't make pieces of their own
+    assert split('abc   def', 3) == ['abc', 'def']
+    assert split('   abc', 2) == ['ab', 'c']
+    assert split('ab    ', 3) == ['ab']
+    # Nor do the spaces left before a code which doesn't fit
+    assert split(' \x0304,01 abc def', 6) == ['\x0304,01', 'abc', 'def']
+
+
+def test_split_keeps_characters_whole():
+    text = '\u00e9' * 5  # two bytes each
+    assert split(text, 3) == ['\u00e9'] * 5
+    # A letter stays with its combining accent
+    text = 'e\u0301' * 2
+    assert split(text, 4) == ['e\u0301', 'e\u0301']
+    for piece in split('\u6f22\u5b57' * 10, 7):
+        assert len(piece.encode('utf-8')) <= 7
+
+
+def test_split_keeps_codes_whole():
+    text = 'ab' + color('c', colors.RED, colors.BLACK)
+    for limit in range(3, 8):
+        pieces = split(text, limit)
+        assert ''.join(pieces) == text
+        # A cut code would leave some of its digits in the text
+        assert ''.join(plain(piece) for piece in pieces) == 'abc'
+    assert split(text, 6) == ['ab', '\x0304,01', 'c\x03']
+
+
+def test_split_max_pieces():
+    text = 'one two three four'
+    assert split(text, 5) == ['one', 'two', 'three', 'four']
+    assert split(text, 5, 2) == ['one', 'two three four']
+    assert split(text, 5, 1) == [text]
@@ -0,0 +1,57 @@
+# coding=utf-8
+"""Tests for sopel.tools.history"""
+from __future__ import unicode_literals, absolute_import, print_function, division
+
+from sopel.tools import Identifier
+from sopel.tools.history import MessageHistory
+
+
+def test_recent():
+    history = MessageHistory(depth=3)
+    chan = Identifier('#chan')
+    for i in range(5):
+        history.record(chan, Identifier('alice' if i % 2 else 'bob'),
+                       'line %d' % i)
+    assert [e.text for e in history.recent(chan)] == [
+        'line 4', 'line 3', 'line 2']
+    assert [e.text for e in history.recent(Identifier('#CHAN'), Identifier('Alice'))] == [
+        'line 3']
+    assert [e.text for e in history.recent(chan, limit=1)] == ['line 4']
+    assert history.recent('#other') == []
+
+
+def test_last():
+    history = MessageHistory()
+    chan = Identifier('#chan')
+    assert history.last(chan) is None
+    history.record(chan, Identifier('alice'), 'hello', 'ACTION')
+    history.record(chan, Identifier('bob'), '.mangle')
+    assert history.last(chan).text == '.mangle'
+    previous = history.last(chan, skip=1)
+    assert previous.nick == 'alice'
+    assert previous.ctcp == 'ACTION'
+    assert history.last(chan, skip=2) is None
+
+
+def test_max_bytes_drops_least_active_channel():
+    history = MessageHistory(depth=10, max_bytes=10)
+    history.record(Identifier('#quiet'), Identifier('alice'), 'aaaa')
+    history.record(Identifier('#busy'), Identifier('bob'), 'bbbb')
+    history.record(Identifier('#busy'), Identifier('bob'), 'cccc')
+    assert history.channels() == ['#busy']
+    assert history.stats() == {'channels': 1, 'lines': 2, 'bytes': 8}
+
+
+def test_forget_channel():
+    history = MessageHistory()
+    chan = Identifier('#chan')
+    history.record(chan, Identifier('alice'), 'hello')
+    history.forget_channel(chan)
+    assert history.recent(chan) == []
+    assert history.stats()['bytes'] == 0
+
+
+def test_disabled():
+    history = MessageHistory(depth=0)
+    history.record(Identifier('#chan'), Identifier('alice'), 'hello')
+    assert history.channels() == []
@@ -0,0 +1,79 @@
+# coding=utf-8
+"""Tests for sopel.tools.isupport, and the coretasks which use it"""
+from __future__ import unicode_literals, absolute_import, print_function, division
+
+from sopel import coretasks, module
+from sopel.tools import Identifier
+from sopel.tools.isupport import ISupport
+
+
+class FakeTrigger(object):
+    def __init__(self, *args):
+        self.args = list(args)
+
+
+class FakeBot(object):
+    def __init__(self, *tokens):
+        self.isupport = ISupport()
+        self.isupport.parse(tokens)
+        self.privileges = {}
+
+
+def test_defaults():
+    isupport = ISupport()
+    assert isupport.prefix == [('q', '~'), ('a', '&'), ('o', '@'),
+                               ('h', '%'), ('v', '+')]
+    assert isupport.chanmodes == ('beI', 'k', 'l', 'imnpst')
+    assert isupport.modes == 3
+    assert isupport.max_targets('PRIVMSG') == 1
+    assert isupport.max_targets('JOIN') is None
+    assert isupport.max_targets('KICK') == 1
+    assert isupport.linelen == 512
+    assert isupport.casemapping == 'rfc1459'
+    assert not isupport.whox
+    assert isupport.monitor is None
+
+
+def test_parse():
+    isupport = ISupport()
+    isupport.parse(['PREFIX=(ov)@+', 'CHANTYPES=#', 'CHANMODES=b,k,l,imnt',
+                    'MODES=4', 'TARGMAX=PRIVMSG:4,NOTICE:4,JOIN:,KICK:1',
+                    'LINELEN=1024', 'CASEMAPPING=ascii', 'WHOX',
+                    'MONITOR=100', 'NETWORK=Example\\x20Net'])
+    assert isupport.prefix == [('o', '@'), ('v', '+')]
+    assert isupport.chantypes == '#'
+    assert isupport.chanmodes == ('b', 'k', 'l', 'imnt')
+    assert isupport.modes == 4
+    assert isupport.max_targets('privmsg') == 4
+    assert isupport.max_targets('JOIN') is None
+    assert isupport.max_targets('KICK') == 1
+    assert isupport.linelen == 1024
+    assert isupport.casemapping == 'ascii'
+    assert isupport.whox
+    assert isupport.monitor == 100
+    assert isupport['network'] == 'Example Net'
+
+    isupport.parse(['-WHOX', 'MODES'])
+    assert 'WHOX' not in isupport
+    assert isupport.modes is None
+
+
+def test_names_multi_prefix():
+    bot = FakeBot('PREFIX=(ohv)@%+')
+    coretasks.handle_names(bot, FakeTrigger(
+        'Sopel', '=', '#chan', '@+Spam %Eggs Ham ~Odd'))
+    privileges = bot.privileges[Identifier('#chan')]
+    assert privileges[Identifier('spam')] == module.OP | module.VOICE
+    assert privileges[Identifier('eggs')] == module.HALFOP
+    assert privileges[Identifier('ham')] == 0
+    assert privileges[Identifier('~odd')] == 0
+
+
+def test_modes_take_their_own_params():
+    bot = FakeBot()
+    channel = Identifier('#chan')
+    bot.privileges[channel] = {Identifier('Other'): module.VOICE}
+    coretasks.track_modes(bot, FakeTrigger(
+        '#chan', '+lob-v', '10', 'Spam', '*!*@example.com', 'Other'))
+    assert bot.privileges[channel] == {Identifier('Spam'): module.OP,
+                                       Identifier('Other'): 0}
@@ -0,0 +1,89 @@
+# coding=utf-8
+"""Tests for sopel.loader"""
+from __future__ import unicode_literals, absolute_import, print_function, division
+
+import imp
+import os
+
+import pytest
+
+from sopel import loader
+from sopel.test_tools import MockConfig
+
+
+@pytest.fixture
+def moddir(tmpdir):
+    loader.clear_caches()
+    tmpdir.join('spam.py').write('')
+    tmpdir.mkdir('eggs').join('__init__.py').write('')
+    tmpdir.mkdir('notamodule')
+    return tmpdir
+
+
+def test_scan_directory(moddir):
+    found = loader._scan_directory(str(moddir))
+    assert found == {
+        'spam': (str(moddir.join('spam.py')), imp.PY_SOURCE),
+        'eggs': (str(moddir.join('eggs')), imp.PKG_DIRECTORY),
+    }
+
+
+def test_scan_directory_cached_until_changed(moddir):
+    first = loader._scan_directory(str(moddir))
+    assert loader._scan_directory(str(moddir)) is first
+
+    moddir.join('ham.py').write('')
+    # Make sure the mtime differs even on coarse-grained filesystems
+    mtime = os.path.getmtime(str(moddir)) + 10
+    os.utime(str(moddir), (mtime, mtime))
+    assert 'ham' in loader._scan_directory(str(moddir))
+
+
+def test_scan_missing_directory(moddir):
+    assert loader._scan_directory(str(moddir.join('missing'))) == {}
+
+
+def test_compile_rule_cached():
+    rule = loader.compile_rule('Sopel', r'$nickname!')
+    assert rule.match('Sopel!')
+    assert loader.compile_rule('Sopel', r'$nickname!') is rule
+    assert loader.compile_rule('Other', r'$nickname!') is not rule
+
+
+def test_compile_command_cached():
+    command = loader.compile_command(r'\.', 'spam')
+    assert command.match('.spam eggs').group(2) == 'eggs'
+    assert loader.compile_command(r'\.', 'spam') is command
+
+
+def test_module_hash(moddir):
+    spam = str(moddir.join('spam.py'))
+    first = loader.get_module_hash(spam, imp.PY_SOURCE)
+    assert loader.get_module_hash(spam, imp.PY_SOURCE) == first
+    moddir.join('spam.py').write('spam = True\n')
+    assert loader.get_module_hash(spam, imp.PY_SOURCE) != first
+
+    eggs = str(moddir.join('eggs'))
+    first = loader.get_module_hash(eggs, imp.PKG_DIRECTORY)
+    moddir.join('eggs', 'bacon.py').write('')
+    assert loader.get_module_hash(eggs, imp.PKG_DIRECTORY) != first
+
+
+def test_module_with_setup_not_deferrable(moddir):
+    config = MockConfig()
+    spam = str(moddir.join('spam.py'))
+    moddir.join('spam.py').write(
+        'import sopel.module\n'
+        '@sopel.module.commands("spam")\n'
+        'def spam(bot, trigger):\n'
+        '    pass\n')
+    module, _ = loader.load_module('test_spam', spam, imp.PY_SOURCE)
+    parts = loader.clean_module(module, config)
+    meta = loader.get_module_metadata(spam, imp.PY_SOURCE, config, module,
+                                      *parts)
+    assert meta['deferrable']
+
+    module.setup = lambda bot: None
+    meta = loader.get_module_metadata(spam, imp.PY_SOURCE, config, module,
+                                      *parts)
+    assert not meta['deferrable']
@@ -0,0 +1,118 @@
+# coding=utf-8
+"""Tests for sopel.logger"""
+from __future__ import unicode_literals, absolute_import, print_function, division
+
+import json
+import logging
+import time
+
+from sopel.logger import ExceptionLog, IrcLoggingHandler
+from sopel.test_tools import MockSopel, wait_for
+from sopel.tools import _LogFile
+
+
+def make_bot(cls=MockSopel):
+    bot = cls('Sopel')
+    bot.config.core.logging_channel = '#log'
+    return bot
+
+
+def make_logger(bot, **kwargs):
+    handler = IrcLoggingHandler(bot, logging.WARNING, **kwargs)
+    logger = logging.getLogger('sopel.test.%s' % id(handler))
+    logger.propagate = False
+    logger.addHandler(handler)
+    return logger
+
+
+def test_repeats_suppressed_and_summarized():
+    bot = make_bot()
+    logger = make_logger(bot, max_per_window=10, window=0.3)
+    for i in range(5):
+        logger.warning('Failure number %d', i)
+    logger.warning('Something else')
+    wait_for(lambda: len(bot.written) >= 3)
+    assert bot.written == ['PRIVMSG #log :Failure number 0',
+                           'PRIVMSG #log :Something else',
+                           'PRIVMSG #log :4 similar messages suppressed']
+
+
+def test_cap_per_window():
+    bot = make_bot()
+    logger = make_logger(bot, max_per_window=2, window=0.3)
+    for i in range(5):
+        logger.warning('Message %d' % i)
+    wait_for(lambda: len(bot.written) >= 3)
+    assert bot.written == ['PRIVMSG #log :Message 0', 'PRIVMSG #log :Message 1',
+                           'PRIVMSG #log :3 similar messages suppressed']
+
+
+def test_emit_does_not_wait_for_sending():
+    class SlowBot(MockSopel):
+        def msg(self, channel, text):
+            time.sleep(0.5)
+            MockSopel.msg(self, channel, text)
+
+    logger = make_logger(make_bot(SlowBot), window=10)
+    start = time.time()
+    for i in range(5):
+        logger.warning('Message %d' % i)
+    assert time.time() - start < 0.25
+
+
+def read_log(path):
+    _LogFile.flush_all()
+    return path.read() if path.check() else ''
+
+
+def test_exception_log_groups_repeats(tmpdir):
+    path = tmpdir.join('exceptions.log')
+    log = ExceptionLog(str(path), group_interval=0.2)
+    assert log.record('Oops (file "spam.py")', 'trace 1', {'nick': 'Eggs'})
+    assert not log.record('Oops (file "spam.py")', 'trace 2')
+    assert not log.record('Oops (file "spam.py")', 'trace 3')
+    assert log.counts['Oops (file "spam.py")'] == 3
+    time.sleep(0.25)
+    assert log.record('Oops (file "spam.py")', 'trace 4')
+    wait_for(lambda: 'trace 4' in read_log(path))
+    text = read_log(path)
+    assert 'nick: Eggs' in text
+    assert 'trace 2' not in text
+    assert '(2 more times since it was last logged)' in text
+
+
+def test_exception_log_json(tmpdir):
+    path = tmpdir.join('exceptions.log')
+    log = ExceptionLog(str(path), json_lines=True)
+    log.record('Oops', 'trace', {'nick': 'Eggs'})
+    wait_for(lambda: read_log(path))
+    entry = json.loads(read_log(path).splitlines()[0])
+    assert entry['signature'] == 'Oops'
+    assert entry['nick'] == 'Eggs'
+    assert entry['repeats'] == 0
+
+
+def test_exception_log_replies_limited(tmpdir):
+    log = ExceptionLog(str(tmpdir.join('exceptions.log')), reply_interval=60)
+    assert log.should_reply('Oops')
+    assert not log.should_reply('Oops')
+    assert log.should_reply('Something else')
+
+
+def test_exception_log_flush(tmpdir):
+    path = tmpdir.join('exceptions.log')
+    log = ExceptionLog(str(path))
+    assert log.flush(1)  # Nothing recorded yet
+    log.record('Fatal', 'last words')
+    assert log.flush(5)
+    assert 'last words' in path.read()
+
+
+def test_exception_log_bounded(tmpdir):
+    log = ExceptionLog(str(tmpdir.join('exceptions.log')), max_signatures=2)
+    for signature in ('a', 'b', 'a', 'c'):
+        log.record(signature, 'trace')
+        log.should_reply(signature)
+    assert list(log.counts) == ['a', 'c']
+    assert log.counts['a'] == 2
+    assert len(log._logged) == len(log._replied) == 2
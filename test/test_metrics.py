@@ -0,0 +1,82 @@
+# coding=utf-8
+"""Tests for sopel.tools.metrics"""
+from __future__ import unicode_literals, absolute_import, print_function, division
+
+import json
+
+from sopel.tools.metrics import (
+    Histogram, Metrics, callable_name, format_histogram
+)
+
+
+def spam(bot, trigger):
+    return sum(range(100))
+
+
+def test_histogram():
+    histogram = Histogram((1, 2, 5))
+    for value in (0.5, 1, 1.5, 3, 10):
+        histogram.observe(value)
+    assert histogram.counts == [2, 1, 1, 1]
+    assert histogram.count == 5
+    assert histogram.sum == 16
+    assert histogram.max == 10
+    assert histogram.quantile(0.5) == 2
+    assert histogram.quantile(1) == 10
+
+
+def test_format_histogram():
+    histogram = Histogram((0.5, 1))
+    histogram.observe(0.25)
+    histogram.observe(2)
+    assert format_histogram('spam', histogram, {'egg': 'a"b'}) == [
+        'spam_bucket{egg="a\\"b",le="0.5"} 1',
+        'spam_bucket{egg="a\\"b",le="1.0"} 1',
+        'spam_bucket{egg="a\\"b",le="+Inf"} 2',
+        'spam_sum{egg="a\\"b"} 2.25',
+        'spam_count{egg="a\\"b"} 2',
+    ]
+
+
+def test_record():
+    metrics = Metrics()
+    metrics.record_call(spam, 0.002)
+    metrics.record_call(spam, 0.5, error=True)
+    metrics.record_rejection(spam, 'user')
+    metrics.record_rejection(spam, 'user')
+
+    stats = metrics.get(callable_name(spam))
+    assert stats.calls == 2
+    assert stats.errors == 1
+    assert stats.rejected == {'user': 2}
+    assert stats.durations.max == 0.5
+    assert metrics.top('errors') == [stats]
+
+    snapshot = json.loads(json.dumps(metrics.snapshot()))
+    assert snapshot['callables'][callable_name(spam)]['calls'] == 2
+
+    metrics.reset()
+    assert metrics.get(callable_name(spam)) is None
+
+
+def test_profile_every():
+    metrics = Metrics(profile_every=2)
+    assert metrics.start_profile(spam) is None
+    metrics.record_call(spam, 0.001)
+    profiler = metrics.start_profile(spam)
+    assert profiler is not None
+    spam(None, None)
+    metrics.finish_profile(spam, profiler)
+    metrics.record_call(spam, 0.001)
+    assert 'function calls' in metrics.get(callable_name(spam)).last_profile
+
+
+def test_profile_slow_calls():
+    metrics = Metrics(profile_slower_than=1)
+    metrics.record_call(spam, 0.5)
+    assert metrics.start_profile(spam) is None
+    metrics.record_call(spam, 2)
+    profiler = metrics.start_profile(spam)
+    assert profiler is not None
+    metrics.finish_profile(spam, profiler)
+    assert metrics.start_profile(spam) is None
@@ -0,0 +1,89 @@
+# coding=utf-8
+"""Tests for sopel.tools.ratelimit"""
+from __future__ import unicode_literals, absolute_import, print_function, division
+
+from sopel.tools import Identifier
+from sopel.tools.ratelimit import RateLimiter, TokenBucket
+
+
+def limited(rate=0, channel_rate=0, global_rate=0):
+    def func(bot, trigger):
+        pass
+    func.rate = rate
+    func.channel_rate = channel_rate
+    func.global_rate = global_rate
+    return func
+
+
+def test_unlimited_not_tracked():
+    limiter = RateLimiter()
+    func = limited()
+    limiter.record(func, Identifier('Nick'), '#chan', now=100)
+    assert limiter.check(func, Identifier('Nick'), '#chan', now=100) is None
+    assert len(limiter) == 0
+
+
+def test_user_limit():
+    limiter = RateLimiter()
+    func = limited(rate=10)
+    nick = Identifier('Nick')
+    assert limiter.check(func, nick, '#chan', now=100) is None
+    limiter.record(func, nick, '#chan', now=100)
+    assert limiter.check(func, Identifier('NICK'), '#chan', now=105) == \
+        ('user', 5, 10)
+    assert limiter.check(func, Identifier('Other'), '#chan', now=105) is None
+    assert limiter.check(func, nick, '#chan', now=110) is None
+
+
+def test_channel_and_global_limits():
+    limiter = RateLimiter()
+    func = limited(channel_rate=10, global_rate=5)
+    limiter.record(func, Identifier('Nick'), '#chan', now=100)
+    assert limiter.check(func, Identifier('Other'), None, now=102) == \
+        ('global', 2, 5)
+    assert limiter.check(func, Identifier('Other'), '#chan', now=107) == \
+        ('channel', 7, 10)
+    assert limiter.check(func, Identifier('Other'), '#elsewhere',
+                         now=107) is None
+
+
+def test_prune_forgets_expired_uses():
+    limiter = RateLimiter(prune_interval=1000)
+    short = limited(rate=10)
+    long_ = limited(rate=100)
+    limiter.record(short, Identifier('Nick'), now=100)
+    limiter.record(long_, Identifier('Nick'), now=100)
+    assert len(limiter) == 4  # user and global for each
+    limiter.prune(now=150)
+    assert len(limiter) == 1
+    assert limiter.check(long_, Identifier('Nick'), now=150) == \
+        ('user', 50, 100)
+    limiter.prune(now=200)
+    assert len(limiter) == 0
+
+
+def test_record_prunes_periodically():
+    limiter = RateLimiter(prune_interval=60)
+    func = limited(rate=10)
+    limiter._last_prune = 0
+    for i in range(100):
+        limiter.record(func, Identifier('nick%d' % i), now=i)
+    assert len(limiter) < 100
+
+
+def test_acquire_and_release():
+    limiter = RateLimiter()
+    func = limited(rate=10)
+    nick = Identifier('Nick')
+    assert limiter.acquire(func, nick, '#chan', now=100) is None
+    assert limiter.acquire(func, nick, '#chan', now=101) == ('user', 1, 10)
+    limiter.release(func, nick, '#chan', now=100)
+    assert limiter.acquire(func, nick, '#chan', now=102) is None
+
+
+def test_token_bucket():
+    bucket = TokenBucket(2, per=60)
+    assert bucket.acquire(timeout=0)
+    assert bucket.acquire(timeout=0)
+    # The next token is 30 seconds away
+    assert not bucket.acquire(timeout=0.1)
@@ -0,0 +1,66 @@
+# coding=utf-8
+"""Tests for sopel.tools.sync"""
+from __future__ import unicode_literals, absolute_import, print_function, division
+
+import time
+
+from sopel.test_tools import MockSopel, wait_for
+from sopel.tools import sync
+from sopel.tools.coalesce import Coalescer
+
+
+def make_bot():
+    bot = MockSopel('Sopel')
+    bot.coalescer = Coalescer(bot, window=0)
+    return bot
+
+
+def test_joins_by_priority_and_paced():
+    bot = make_bot()
+    channel_sync = sync.ChannelSync(bot, rate=20, burst=1)
+    # Queue them all before the first can be sent
+    with channel_sync._cond:
+        channel_sync.join('#late', priority=20)
+        channel_sync.join('#first', priority=1)
+        channel_sync.join('#second', priority=10)
+    start = time.time()
+    wait_for(lambda: len(bot.written) == 3)
+    assert bot.written == ['JOIN #first', 'JOIN #second', 'JOIN #late']
+    # One at once, then one every 1/20 s
+    assert time.time() - start >= 0.09
+
+
+def test_who_limited_and_synced():
+    bot = make_bot()
+    channel_sync = sync.ChannelSync(bot, rate=100, burst=10, max_who=1)
+    for channel in ('#a', '#b'):
+        channel_sync.joined(channel, lambda c=channel: bot.write(('WHO', c)))
+    wait_for(lambda: bot.written)
+    time.sleep(0.05)
+    assert bot.written == ['WHO #a']
+    assert channel_sync.state('#a') == sync.WHO
+    assert not channel_sync.wait('#a', timeout=0.01)
+
+    channel_sync.who_done('#A')
+    assert channel_sync.is_synced('#a')
+    assert channel_sync.wait('#a', timeout=0.01)
+    wait_for(lambda: len(bot.written) == 2)
+    assert bot.written[1] == 'WHO #b'
+    assert channel_sync.progress() == {sync.SYNCED: 1, sync.WHO: 1}
+
+    channel_sync.parted('#a')
+    assert channel_sync.state('#a') is None
+
+
+def test_who_timeout_not_synced():
+    bot = make_bot()
+    channel_sync = sync.ChannelSync(bot, rate=100, burst=10, who_timeout=0.05)
+    channel_sync.joined('#a', lambda: bot.write(('WHO', '#a')))
+    start = time.time()
+    assert not channel_sync.wait('#a', timeout=2)
+    assert time.time() - start < 1.9
+    assert channel_sync.state('#a') == sync.WHO_TIMEOUT
+    assert not channel_sync.is_synced('#a')
+    # A late reply doesn't count either
+    channel_sync.who_done('#a')
+    assert channel_sync.state('#a') == sync.WHO_TIMEOUT
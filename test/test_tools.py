@@ -0,0 +1,154 @@
+# coding=utf-8
+"""Tests for sopel.tools"""
+from __future__ import unicode_literals, absolute_import, print_function, division
+
+import os
+import threading
+
+import pytest
+
+from sopel import tools
+
+
+def test_output_redirect_shares_file(tmpdir):
+    path = str(tmpdir.join('stdio.log'))
+    out = tools.OutputRedirect(path, quiet=True)
+    err = tools.OutputRedirect(path, stderr=True, quiet=True)
+    out.write('spam\n')
+    err.write('eggs ☃\n')
+    out.flush()
+    with open(path, 'rb') as f:
+        assert f.read().decode('utf-8') == 'spam\neggs ☃\n'
+
+
+def test_output_redirect_line_buffered(tmpdir):
+    path = str(tmpdir.join('stdio.log'))
+    out = tools.OutputRedirect(path, quiet=True)
+    out.write('spam')
+    out.write(' and eggs\n')
+    with open(path) as f:
+        assert f.read() == 'spam and eggs\n'
+
+
+def test_output_redirect_rotates(tmpdir):
+    path = str(tmpdir.join('rotated.log'))
+    out = tools.OutputRedirect(path, quiet=True, max_bytes=10, backups=2)
+    for line in ('first\n', 'second\n', 'third\n', 'fourth\n'):
+        out.write(line)
+    out.flush()
+    with open(path) as f:
+        assert f.read() == 'fourth\n'
+    with open(path + '.1') as f:
+        assert f.read() == 'third\n'
+    with open(path + '.2') as f:
+        assert f.read() == 'second\n'
+    assert not os.path.exists(path + '.3')
+
+
+def test_output_redirect_reopens(tmpdir):
+    path = str(tmpdir.join('moved.log'))
+    out = tools.OutputRedirect(path, quiet=True)
+    out.write('before\n')
+    out.flush()
+    os.rename(path, path + '.old')
+    tools.OutputRedirect.reopen()
+    out.write('after\n')
+    out.flush()
+    with open(path) as f:
+        assert f.read() == 'after\n'
+    with open(path + '.old') as f:
+        assert f.read() == 'before\n'
+
+
+def test_memory_snapshots_survive_changes():
+    memory = tools.SopelMemory((i, i) for i in range(10))
+    for key in memory:
+        del memory[key]
+    assert len(memory) == 0
+
+    memory.update(spam=1, eggs=2)
+    items = memory.items()
+    memory['ham'] = 3
+    assert sorted(items) == [('eggs', 2), ('spam', 1)]
+
+
+def test_memory_setdefault_atomic():
+    memory = tools.SopelMemory()
+    seen = []
+
+    def worker():
+        for i in range(1000):
+            seen.append(memory.setdefault(i % 10, object()))
+
+    threads = [threading.Thread(target=worker) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(set(map(id, seen))) == 10
+
+
+def test_memory_with_default():
+    memory = tools.SopelMemoryWithDefault(list)
+    memory['spam'].append(1)
+    assert memory['spam'] == [1]
+    assert 'eggs' not in memory
+    assert memory.keys() == ['spam']
+
+
+def test_identifier_reused():
+    nick = tools.Identifier('Spam[]')
+    assert tools.Identifier('Spam[]') is nick
+    assert tools.Identifier(nick) is nick
+    assert nick == 'spam{}'
+    assert nick.lower() == 'spam[]'
+    assert '%s' % nick == 'Spam[]'
+
+
+def test_identifier_cache_bounded(monkeypatch):
+    monkeypatch.setattr(tools.Identifier, 'cache_size', 2)
+    tools.Identifier._cache.clear()
+    first = tools.Identifier('First')
+    tools.Identifier('Second')
+    assert tools.Identifier('First') is first  # Now the most recently used
+    tools.Identifier('Third')
+    assert list(tools.Identifier._cache) == ['First', 'Third']
+    # Plain strings compared with an Identifier aren't cached
+    assert first == 'FIRST' and first != 'some text'
+    assert 'FIRST' not in tools.Identifier._cache
+
+
+def test_identifier_cache_threads(monkeypatch):
+    monkeypatch.setattr(tools.Identifier, 'cache_size', 8)
+    tools.Identifier._cache.clear()
+    errors = []
+
+    def make():
+        try:
+            for i in range(2000):
+                tools.Identifier('nick%d' % (i % 12))
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=make) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert not errors
+    assert len(tools.Identifier._cache) <= 8
+
+
+def test_identifier_casemapping():
+    try:
+        tools.Identifier.set_casemapping('ascii')
+        assert tools.Identifier('Spam[]') != 'spam{}'
+        assert tools.Identifier('Spam[]') == 'SPAM[]'
+        tools.Identifier.set_casemapping('strict-rfc1459')
+        assert tools.Identifier('Spam[]|') == 'spam{}\\'
+        assert tools.Identifier('Spam^') != 'spam~'
+        with pytest.raises(ValueError):
+            tools.Identifier.set_casemapping('spam')
+    finally:
+        tools.Identifier.set_casemapping('rfc1459')
+    assert tools.Identifier('Spam^') == 'spam~'